@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for pykrety, run from the repository root:
+
+    python -m benchmarks.xml_backends
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.loadtest --workload details --workers 16
+"""
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare per Geokret memory of the slotted Geokret against the former
+__dict__ based one, on inventories parsed from synthetic mypage.php rows.
+
+    python -m benchmarks.geokret_memory [count]
+"""
+
+import sys
+
+from pykrety.Geokret import GK_FIELDS, GK_DEFAULTS
+from pykrety.parsers.GeokretyHTMLHandler import iter_html_owned
+from benchmarks.synthetic import owned_html
+
+
+class DictGeokret(object):
+    """
+    The former Geokret storage: a per instance __dict__, no sharing.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: dict, representing a Geokret
+        :return: None
+        """
+        self.__dict__.update(kwargs)
+
+
+def deep_size(objects):
+    """
+    Bytes used by objects and everything they reference, each distinct
+    object counted once.
+
+    :param objects: iterable
+    :return: int
+    """
+    seen = set()
+    size = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (int, bool)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, field) for field in GK_FIELDS)
+    return size
+
+
+def copy_value(value):
+    """
+    :param value: a field value
+    :return: a distinct but equal copy of string values
+    """
+    if isinstance(value, unicode):
+        return (u'_' + value)[1:]
+    return value
+
+
+def run(count):
+    """
+    :param count: int, number of Geokrety
+    :return: dict, class name => bytes per Geokret
+    """
+    slotted = list(iter_html_owned(owned_html(count)))
+    # Without interning every parsed value is a string copy of its own,
+    # unset fields were read from class attributes
+    legacy = [DictGeokret(**dict((k, copy_value(v))
+                                 for (k, v) in gk.as_dict().iteritems()
+                                 if v != GK_DEFAULTS[k]))
+              for gk in slotted]
+    return {
+        'DictGeokret': deep_size(legacy) / float(count),
+        'Geokret': deep_size(slotted) / float(count),
+    }
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for (name, size) in sorted(run(count).items()):
+        print "%-12s %8.1f bytes per geokret" % (name, size)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load test GeokretyConnector workloads, against the local stand-in or any
+Geokrety.org url. Reports requests per second and latency percentiles,
+measured on every request attempt of the connector transport.
+
+    python -m benchmarks.loadtest --workload details --operations 2000 \\
+        --workers 16 --latency 0.05 --error-rate 0.02
+    python -m benchmarks.loadtest --url http://127.0.0.1:8080 --cache
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+
+from pykrety.Geokret import Geokret
+from pykrety.GeokretyCache import GeokretyCache
+from pykrety.GeokretyConnector import GeokretyConnector
+from pykrety.GeokretyTransport import GeokretyTransport
+from benchmarks.standin import add_server_arguments, server_from_arguments, \
+    STANDIN_FIRST_ID
+
+# Latency percentiles reported
+LOADTEST_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+def percentile(values, rank):
+    """
+    :param values: sorted float list
+    :param rank: float, percentile, 0 to 100
+    :return: float, nearest rank value, None without values
+    """
+    if not values:
+        return None
+    index = int(round(rank / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def _failures(results):
+    """
+    :param results: BulkResult iterable
+    :return: int, failed operations
+    """
+    return sum(1 for result in results if not result.ok)
+
+
+def _concurrently(func, operations, workers):
+    """
+    :param func: callable, one operation, raises when it fails
+    :param operations: int, number of operations
+    :param workers: int, concurrent operations
+    :return: int, failed operations
+    """
+    def run(_):
+        try:
+            func()
+            return True
+        except Exception:
+            return False
+
+    pool = ThreadPool(workers)
+    try:
+        return sum(1 for ok in pool.imap_unordered(run, xrange(operations))
+                   if not ok)
+    finally:
+        pool.terminate()
+
+
+def workload_details(connector, args):
+    """
+    konkret.php pages of the inventory, in turn.
+
+    :return: int, failed operations
+    """
+    ids = [STANDIN_FIRST_ID + i % args.geokrety
+           for i in xrange(args.operations)]
+    return _failures(connector.get_geokrety_details_web(
+        ids, args.workers, args.rate))
+
+
+def workload_inventory(connector, args):
+    """
+    Whole mypage.php inventory, its pages fetched concurrently.
+
+    :return: int, failed operations
+    """
+    return _concurrently(
+        lambda: list(connector.iter_inventory_web(max_workers=args.workers)),
+        args.operations, 1)
+
+
+def workload_export(connector, args):
+    """
+    export2.php inventory, streamed.
+
+    :return: int, failed operations
+    """
+    return _concurrently(
+        lambda: list(connector.get_geokrety_modified_since(0)),
+        args.operations, args.workers)
+
+
+def workload_poll(connector, args):
+    """
+    export2.php Geokrety modified since the workload started, the
+    incremental poll, streamed.
+
+    :return: int, failed operations
+    """
+    since = time.time()
+    return _concurrently(
+        lambda: list(connector.get_geokrety_modified_since(since)),
+        args.operations, args.workers)
+
+
+def workload_update(connector, args):
+    """
+    edit.php updates of the inventory Geokrety, in turn.
+
+    :return: int, failed operations
+    """
+    geokrety = [Geokret(gk_id=STANDIN_FIRST_ID + i % args.geokrety,
+                        name=u'Kret %d' % i, type='0',
+                        description=u'Load test %d' % i)
+                for i in xrange(args.operations)]
+    return _failures(connector.update_geokrety_web(
+        geokrety, max_workers=args.workers, rate=args.rate))
+
+
+def workload_create(connector, args):
+    """
+    register.php creations.
+
+    :return: int, failed operations
+    """
+    geokrety = [Geokret(name=u'Load %d' % i, type='0',
+                        description=u'Load test %d' % i)
+                for i in xrange(args.operations)]
+    return _failures(connector.create_geokrety_web(
+        geokrety, max_workers=args.workers, rate=args.rate))
+
+
+# Workload name => function, returning the failed operations
+WORKLOADS = {
+    'details': workload_details,
+    'inventory': workload_inventory,
+    'export': workload_export,
+    'poll': workload_poll,
+    'update': workload_update,
+    'create': workload_create,
+}
+
+
+def run(connector, name, args):
+    """
+    Run a workload, measuring every request attempt.
+
+    :param connector: GeokretyConnector, connected
+    :param name: String, workload name
+    :param args: argparse.Namespace, options
+    :return: dict, the report
+    """
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def record(event):
+        with lock:
+            latencies.append(event.latency)
+            statuses[str(event.status or 'error')] += 1
+
+    connector.transport.register_hook('request', record)
+    try:
+        start = time.time()
+        failed = WORKLOADS[name](connector, args)
+        seconds = time.time() - start
+    finally:
+        connector.transport.hooks['request'].remove(record)
+
+    latencies.sort()
+    return {
+        'workload': name,
+        'operations': args.operations,
+        'failed': failed,
+        'seconds': seconds,
+        'operations_per_second': args.operations / seconds,
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / seconds,
+        'statuses': dict(statuses),
+        'latency_ms': dict(
+            [('p%s' % rank, _ms(percentile(latencies, rank)))
+             for rank in LOADTEST_PERCENTILES] +
+            [('max', _ms(latencies[-1] if latencies else None))]),
+    }
+
+
+def _ms(seconds):
+    """
+    :param seconds: float or None
+    :return: float, milliseconds, or None
+    """
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def main(argv):
+    """
+    :param argv: String list, command line arguments
+    :return: int, exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.loadtest',
+        description='Load test GeokretyConnector workloads.')
+    parser.add_argument('--url', help='target, a local stand-in is started '
+                                      'when not given')
+    parser.add_argument('--login', default='loadtest')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--workload', nargs='+', choices=sorted(WORKLOADS),
+                        default=['details'])
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='concurrent requests of the connector')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='operations per second at most')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache parsed pages')
+    parser.add_argument('--output', help='JSON report file')
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        server = server_from_arguments(args)
+        server.start()
+        url = server.url
+
+    connector = GeokretyConnector(
+        args.login, args.password, url=url,
+        cache=GeokretyCache() if args.cache else None,
+        transport=GeokretyTransport(pool_maxsize=args.workers))
+    try:
+        connector.connect_web()
+        connector.connect_api()
+        reports = [run(connector, name, args) for name in args.workload]
+    finally:
+        connector.transport.close()
+        if server is not None:
+            server.stop()
+
+    for report in reports:
+        latency = report['latency_ms']
+        print >> sys.stderr, (
+            "%-10s %6d ops %4d failed %8.1f ops/s %8.1f req/s  "
+            "p50 %s ms  p99 %s ms  max %s ms  %s" % (
+                report['workload'], report['operations'], report['failed'],
+                report['operations_per_second'],
+                report['requests_per_second'], latency['p50'],
+                latency['p99'], latency['max'],
+                ' '.join('%s:%d' % item
+                         for item in sorted(report['statuses'].items()))))
+    if args.output:
+        with open(args.output, 'wb') as handle:
+            json.dump(reports, handle, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,619 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the Geokrety.org endpoints used by GeokretyConnector,
+serving synthetic documents modeled on the tests/ fixtures.
+
+Latency, transient errors and throttling may be simulated, to exercise
+concurrency, retries and caching offline:
+
+    python -m benchmarks.standin --port 8080 --geokrety 5000 \\
+        --latency 0.05 --error-rate 0.01 --throttle 200
+
+    gkConn = GeokretyConnector('login', 'password',
+                               url='http://127.0.0.1:8080')
+
+Any login and password are accepted. Geokrety created or edited through
+register.php and edit.php are served with their new name, type and
+description, and export2.php honours modifiedsince.
+"""
+
+import argparse
+import BaseHTTPServer
+import calendar
+import gzip
+import hashlib
+import random
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+import uuid
+# time.strptime imports it on first use, which fails when threads race
+import _strptime
+from collections import Counter
+from cStringIO import StringIO
+
+from benchmarks.synthetic import details_html, export_xml, owned_html
+
+# IDs of the served Geokrety start there, like the synthetic documents
+STANDIN_FIRST_ID = 40000
+
+# Session cookie set by longin.php
+STANDIN_COOKIE = 'geokrety_sess'
+
+# Seconds asked by throttled responses
+STANDIN_RETRY_AFTER = 1
+
+# Age of the generated Geokrety last modification when the server starts,
+# in seconds
+STANDIN_GENERATED_AGE = 86400
+
+# export2.php modifiedsince parameter format, UTC
+STANDIN_MODIFIED_SINCE_FORMAT = '%Y%m%d%H%M%S'
+
+
+class StandinHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Route the requests of one connection, keeping it alive.
+    """
+    protocol_version = 'HTTP/1.1'
+    # responses are written at once, flushed after each request
+    wbufsize = -1
+
+    def setup(self):
+        """
+        Send small responses without waiting for the ACK of the previous
+        segment, which a client delays.
+
+        :return: None
+        """
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        """
+        :return: None
+        """
+        self._handle('GET')
+
+    def do_POST(self):
+        """
+        :return: None
+        """
+        self._handle('POST')
+
+    def _handle(self, method):
+        """
+        Simulate the network and server conditions, then route.
+
+        :param method: String, 'GET' or 'POST'
+        :return: None
+        """
+        server = self.server
+        url = urlparse.urlsplit(self.path)
+        script = url.path.rsplit('/', 1)[-1]
+        query = dict(urlparse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+
+        server.sleep()
+        if server.throttled():
+            self._send(429, headers={'Retry-After': STANDIN_RETRY_AFTER},
+                       script=script)
+            return
+        if server.failing():
+            self._send(503, script=script)
+            return
+
+        route = ROUTES.get((method, script))
+        if route is None:
+            self._send(404, script=script)
+            return
+        if method == 'POST' and script != 'imgup.php':
+            query.update(urlparse.parse_qsl(body))
+        route(self, query)
+
+    def _authenticated(self):
+        """
+        :return: Boolean, the request carries a session cookie
+        """
+        return STANDIN_COOKIE in (self.headers.get('Cookie') or '')
+
+    def _redirect(self, script, location, headers=None):
+        """
+        :param script: String, endpoint, counted by the server
+        :param location: String, path
+        :param headers: dict, optional more headers
+        :return: None
+        """
+        headers = dict(headers or {}, Location=location)
+        self._send(302, headers=headers, script=script)
+
+    def _send(self, status, body='', headers=None, script=None,
+              cacheable=False):
+        """
+        :param status: int, HTTP status
+        :param body: String
+        :param headers: dict, optional more headers
+        :param script: String, endpoint counted by the server
+        :param cacheable: Boolean, send an ETag and honor If-None-Match
+        :return: None
+        """
+        headers = dict(headers or {})
+        if cacheable:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                (status, body) = (304, '')
+        if (body and self.server.compress and
+                'gzip' in (self.headers.get('Accept-Encoding') or '')):
+            body = self.server.gzipped(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        self.server.count(script, status)
+        self.send_response(status)
+        for (name, value) in headers.iteritems():
+            self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def login(self, query):
+        """
+        longin.php: open a web session.
+
+        :param query: dict, form fields
+        :return: None
+        """
+        if not query.get('login') or not query.get('haslo1'):
+            self._send(200, '<html>login form</html>', script='longin.php')
+            return
+        self._redirect('longin.php', '/mypage.php', {
+            'Set-Cookie': '%s=%s; path=/' % (STANDIN_COOKIE,
+                                             uuid.uuid4().hex)})
+
+    def secid(self, query):
+        """
+        api-login2secid.php: API key of a user.
+
+        :param query: dict, form fields
+        :return: None
+        """
+        if not query.get('login') or not query.get('password'):
+            self._send(403, script='api-login2secid.php')
+            return
+        self._send(200, self.server.secid + '\n',
+                   script='api-login2secid.php')
+
+    def export(self, query):
+        """
+        export2.php: XML inventory.
+
+        :param query: dict, query string
+        :return: None
+        """
+        if query.get('secid') != self.server.secid:
+            self._send(403, script='export2.php')
+            return
+        since = None
+        if query.get('modifiedsince'):
+            try:
+                since = calendar.timegm(time.strptime(
+                    query['modifiedsince'], STANDIN_MODIFIED_SINCE_FORMAT))
+            except ValueError:
+                self._send(400, script='export2.php')
+                return
+        self._send(200, self.server.export(since), script='export2.php',
+                   headers={'Content-Type': 'text/xml; charset=utf-8'},
+                   cacheable=True)
+
+    def mypage(self, query):
+        """
+        mypage.php: HTML inventory, page=0 for all of it.
+
+        :param query: dict, query string
+        :return: None
+        """
+        page = int(query.get('page') or 0)
+        if page > self.server.pages():
+            self._send(404, script='mypage.php')
+            return
+        self._send(200, self.server.mypage(page), script='mypage.php',
+                   headers={'Content-Type': 'text/html; charset=utf-8'},
+                   cacheable=True)
+
+    def konkret(self, query):
+        """
+        konkret.php: HTML details of a Geokret.
+
+        :param query: dict, query string
+        :return: None
+        """
+        gk_id = int(query.get('id') or 0)
+        if not self.server.exists(gk_id):
+            self._send(404, script='konkret.php')
+            return
+        self._send(200, self.server.konkret(gk_id), script='konkret.php',
+                   headers={'Content-Type': 'text/html; charset=utf-8'},
+                   cacheable=True)
+
+    def edit(self, query):
+        """
+        edit.php: update a Geokret, then show it.
+
+        :param query: dict, form fields
+        :return: None
+        """
+        self._change('edit.php', int(query.get('id') or 0), query)
+
+    def register(self, query):
+        """
+        register.php: create a Geokret, then show it.
+
+        :param query: dict, form fields
+        :return: None
+        """
+        if not query.get('nazwa'):
+            self._send(200, '<html>register form</html>',
+                       script='register.php')
+            return
+        self._change('register.php', None, query)
+
+    def imgup(self, query):
+        """
+        imgup.php: add a picture to a Geokret, then show it.
+
+        :param query: dict, query string
+        :return: None
+        """
+        self._change('imgup.php', int(query.get('id') or 0))
+
+    def _change(self, script, gk_id, query=None):
+        """
+        :param script: String, endpoint
+        :param gk_id: int, changed Geokret, None to create one
+        :param query: dict, optional form fields, nazwa, typ and opis
+            are kept
+        :return: None
+        """
+        if not self._authenticated():
+            self._send(403, script=script)
+            return
+        if gk_id is not None and not self.server.exists(gk_id):
+            self._send(404, script=script)
+            return
+        if query is not None:
+            fields = dict((field, query[name].decode('utf-8'))
+                          for (name, field) in STANDIN_FORM_FIELDS
+                          if name in query)
+            gk_id = self.server.change(gk_id, fields)
+        self._redirect(script, '/konkret.php?id=%d' % gk_id)
+
+    def log_message(self, format, *args):
+        """
+        Requests are counted, not logged.
+
+        :return: None
+        """
+        pass
+
+
+# register.php and edit.php form field => Geokret field
+STANDIN_FORM_FIELDS = (
+    ('nazwa', 'name'),
+    ('typ', 'type'),
+    ('opis', 'description'),
+)
+
+# (method, script) => StandinHandler method
+ROUTES = {
+    ('POST', 'longin.php'): StandinHandler.login,
+    ('POST', 'api-login2secid.php'): StandinHandler.secid,
+    ('GET', 'export2.php'): StandinHandler.export,
+    ('GET', 'mypage.php'): StandinHandler.mypage,
+    ('GET', 'konkret.php'): StandinHandler.konkret,
+    ('POST', 'edit.php'): StandinHandler.edit,
+    ('POST', 'register.php'): StandinHandler.register,
+    ('POST', 'imgup.php'): StandinHandler.imgup,
+}
+
+
+class StandinServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded stand-in of Geokrety.org, one thread per connection.
+
+        server = StandinServer(geokrety=1000, latency=0.02)
+        server.start()
+        gkConn = GeokretyConnector('login', 'password', url=server.url)
+        ...
+        server.stop()
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, geokrety=1000,
+                 page_size=100, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle=None, compress=True, seed=0):
+        """
+        :param host: String, listening address
+        :param port: int, listening port, any free one with 0
+        :param geokrety: int, size of the inventory
+        :param page_size: int, Geokrety per mypage.php page
+        :param latency: float, seconds added to every response
+        :param jitter: float, maximum random seconds added to latency
+        :param error_rate: float, share of requests answered 503
+        :param throttle: float, requests per second served at most, more
+            are answered 429, None for no limit
+        :param compress: Boolean, gzip responses when accepted
+        :param seed: int, random seed of the generated documents
+        :return: None
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           StandinHandler)
+        self.geokrety = geokrety
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.compress = compress
+        self.seed = seed
+        self.secid = hashlib.sha1('standin %d' % seed).hexdigest()
+        self.next_id = STANDIN_FIRST_ID + geokrety
+        self.generated = time.time() - STANDIN_GENERATED_AGE
+        # gk_id => fields given to register.php or edit.php
+        self.changes = {}
+        # gk_id => time of the last change
+        self.modified = {}
+        # bumped on every change, served documents are rebuilt
+        self.version = 0
+        self.documents = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.window = (0, 0)
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        :return: String, base url to give to the connector
+        """
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def start(self):
+        """
+        Serve from a background thread.
+
+        :return: None
+        """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        :return: None
+        """
+        self.shutdown()
+        self.server_close()
+
+    def sleep(self):
+        """
+        Wait the simulated latency.
+
+        :return: None
+        """
+        delay = self.latency
+        if self.jitter:
+            with self.lock:
+                delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttled(self):
+        """
+        :return: Boolean, the request is over the throttle rate
+        """
+        if not self.throttle:
+            return False
+        with self.lock:
+            now = time.time()
+            (start, served) = self.window
+            if now - start >= 1:
+                (start, served) = (now, 0)
+            self.window = (start, served + 1)
+            return served >= self.throttle
+
+    def failing(self):
+        """
+        :return: Boolean, the request should fail
+        """
+        if not self.error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, script, status):
+        """
+        :param script: String, endpoint
+        :param status: int, HTTP status answered
+        :return: None
+        """
+        with self.lock:
+            self.counts[(script, status)] += 1
+
+    def exists(self, gk_id):
+        """
+        :param gk_id: int, Geokret ID
+        :return: Boolean
+        """
+        return STANDIN_FIRST_ID <= gk_id < self.next_id
+
+    def change(self, gk_id, fields):
+        """
+        Create or edit a Geokret.
+
+        :param gk_id: int, Geokret ID, None to create one
+        :param fields: dict, name, type and description
+        :return: int, Geokret ID
+        """
+        with self.lock:
+            if gk_id is None:
+                gk_id = self.next_id
+                self.next_id += 1
+            self.changes[gk_id] = dict(self.changes.get(gk_id, {}),
+                                       **fields)
+            self.modified[gk_id] = time.time()
+            self.version += 1
+            return gk_id
+
+    def total(self):
+        """
+        :return: int, Geokrety served, created ones included
+        """
+        return self.next_id - STANDIN_FIRST_ID
+
+    def pages(self):
+        """
+        :return: int, mypage.php pages count
+        """
+        return max(1, -(-self.total() // self.page_size))
+
+    def export(self, since=None):
+        """
+        :param since: float, optional unix time, only the Geokrety
+            modified since are exported
+        :return: String, export2.php document
+        """
+        if since is None or since <= self.generated:
+            return self._document('export2', lambda: export_xml(
+                self.total(), self.seed, self.changes))
+        with self.lock:
+            only = set(gk_id for (gk_id, modified) in self.modified.items()
+                       if modified >= since)
+            changes = dict(self.changes)
+        # a document of the changed Geokrety only, not kept
+        return export_xml(max(only) - STANDIN_FIRST_ID + 1 if only else 0,
+                          self.seed, changes, only)
+
+    def mypage(self, page):
+        """
+        :param page: int, page number, 0 for all
+        :return: String, mypage.php page
+        """
+        def build():
+            total = self.total()
+            if page:
+                first = (page - 1) * self.page_size
+                count = min(self.page_size, total - first)
+            else:
+                (first, count) = (0, total)
+            return owned_html(count, self.seed, page, self.pages(),
+                              STANDIN_FIRST_ID + first,
+                              self.changes).encode('utf-8')
+        return self._document('mypage %d' % page, build)
+
+    def konkret(self, gk_id):
+        """
+        :param gk_id: int, Geokret ID
+        :return: String, konkret.php page, not kept
+        """
+        return details_html(gk_id, self.seed,
+                            change=self.changes.get(gk_id)).encode('utf-8')
+
+    def gzipped(self, body):
+        """
+        :param body: String
+        :return: String, gzip compressed, kept for the served documents
+        """
+        key = ('gzip', hashlib.md5(body).digest())
+        document = self.documents.get(key)
+        if document is None:
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=5) as out:
+                out.write(body)
+            document = buf.getvalue()
+            if len(self.documents) < 1000:
+                self.documents[key] = document
+        return document
+
+    def _document(self, key, build):
+        """
+        :param key: String, document name
+        :param build: callable, returns the document
+        :return: String, the document, built once per version
+        """
+        version = self.version
+        entry = self.documents.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, build())
+            self.documents[key] = entry
+        return entry[1]
+
+
+def main(argv=None):
+    """
+    :param argv: String list, command line arguments
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.standin',
+        description='Serve a local stand-in of Geokrety.org.')
+    add_server_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    server = server_from_arguments(args, args.host, args.port)
+    print 'Serving %d Geokrety on %s' % (args.geokrety, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for ((script, status), count) in sorted(server.counts.items()):
+            print '%-22s %3d %8d' % (script, status, count)
+
+
+def add_server_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser, given the server options
+    :return: None
+    """
+    parser.add_argument('--geokrety', type=int, default=1000,
+                        help='size of the inventory')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='Geokrety per mypage.php page')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='maximum random seconds added to latency')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered 503')
+    parser.add_argument('--throttle', type=float, default=None,
+                        help='requests per second served, more get 429')
+    parser.add_argument('--no-gzip', action='store_true',
+                        help='never compress responses')
+
+
+def server_from_arguments(args, host='127.0.0.1', port=0):
+    """
+    :param args: argparse.Namespace, parsed server options
+    :param host: String, listening address
+    :param port: int, listening port
+    :return: StandinServer
+    """
+    return StandinServer(host, port, geokrety=args.geokrety,
+                         page_size=args.page_size, latency=args.latency,
+                         jitter=args.jitter, error_rate=args.error_rate,
+                         throttle=args.throttle,
+                         compress=not args.no_gzip)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throughput and peak memory of the parsers and serializers, on synthetic
+documents of 1k, 10k and 100k Geokrety.
+
+Every measure runs in a fresh interpreter, so that peak memory is its own.
+Results are written as JSON, and may be compared with a previous run:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+    python -m benchmarks.suite --sizes 1000 --only parse_xml_stream
+
+BeautifulSoup based parsers are slow and memory hungry: at 100k Geokrety
+they take minutes and parse_html_owned several GiB.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import details_html, export_xml, owned_html
+
+# Results format version, bumped when measures are no longer comparable
+SUITE_FORMAT = 1
+
+# Default numbers of Geokrety
+SUITE_SIZES = (1000, 10000, 100000)
+
+# Distinct konkret.php pages, parsed in turn until the size is reached
+SUITE_DETAILS_PAGES = 100
+
+# Short benchmarks are repeated for at least that many seconds, the best
+# run is kept
+SUITE_MIN_SECONDS = 1.0
+
+# Relative change reported as a regression or an improvement
+SUITE_THRESHOLD = 0.10
+
+
+def rss_kb():
+    """
+    :return: int, current resident memory of the process, in KiB
+    """
+    try:
+        with open('/proc/self/statm') as handle:
+            pages = int(handle.read().split()[1])
+        return pages * resource.getpagesize() / 1024
+    except (IOError, OSError):
+        # no procfs, the peak is the best estimate left
+        return peak_rss_kb()
+
+
+def peak_rss_kb():
+    """
+    :return: int, peak resident memory of the process, in KiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024
+    return peak
+
+
+def fixture(directory, name, size):
+    """
+    Path of a synthetic input file, written on first use.
+
+    :param directory: String, fixtures directory
+    :param name: String, 'export2.xml', 'mypage.html' or 'geokrety.csv'
+    :param size: int, number of Geokrety
+    :return: String, path
+    """
+    path = os.path.join(directory, '%d-%s' % (size, name))
+    if os.path.exists(path):
+        return path
+
+    if name == 'export2.xml':
+        data = export_xml(size)
+    elif name == 'mypage.html':
+        data = owned_html(size).encode('utf-8')
+    elif name == 'geokrety.csv':
+        from pykrety.GeokretyCSV import write_csv
+        from pykrety.parsers.GeokretyXMLHandler import parse_xml_stream
+        with open(fixture(directory, 'export2.xml', size), 'rb') as handle:
+            write_csv(parse_xml_stream(handle), path)
+        return path
+    else:
+        raise ValueError('unknown fixture %s' % name)
+
+    with open(path, 'wb') as handle:
+        handle.write(data)
+    return path
+
+
+def setup_parse_xml_stream(directory, size):
+    """
+    :return: callable, the measured work
+    """
+    from pykrety.parsers.GeokretyXMLHandler import parse_xml_stream
+    path = fixture(directory, 'export2.xml', size)
+
+    def work():
+        with open(path, 'rb') as handle:
+            return parse_xml_stream(handle)
+    return work
+
+
+def setup_parse_html_owned(directory, size):
+    """
+    :return: callable, the measured work
+    """
+    from pykrety.parsers.GeokretyHTMLHandler import parse_html_owned
+    with open(fixture(directory, 'mypage.html', size), 'rb') as handle:
+        html = handle.read().decode('utf-8')
+    return lambda: parse_html_owned(html)
+
+
+def setup_parse_html_geokret(directory, size):
+    """
+    :return: callable, the measured work
+    """
+    from pykrety.parsers.GeokretyHTMLHandler import parse_html_geokret
+    pages = [details_html(40000 + i)
+             for i in xrange(min(size, SUITE_DETAILS_PAGES))]
+
+    def work():
+        return [parse_html_geokret(pages[i % len(pages)])
+                for i in xrange(size)]
+    return work
+
+
+def setup_write_csv(directory, size):
+    """
+    :return: callable, the measured work
+    """
+    from pykrety.GeokretyCSV import write_csv
+    from pykrety.parsers.GeokretyXMLHandler import parse_xml_stream
+    with open(fixture(directory, 'export2.xml', size), 'rb') as handle:
+        geokrety = parse_xml_stream(handle)
+    path = os.path.join(directory, '%d-written.csv' % size)
+    return lambda: write_csv(geokrety, path)
+
+
+def setup_read_csv(directory, size):
+    """
+    :return: callable, the measured work
+    """
+    from pykrety.GeokretyCSV import iter_csv
+    path = fixture(directory, 'geokrety.csv', size)
+    return lambda: list(iter_csv(path))
+
+
+# Benchmark name => setup function, returning the work to measure
+BENCHMARKS = {
+    'parse_xml_stream': setup_parse_xml_stream,
+    'parse_html_owned': setup_parse_html_owned,
+    'parse_html_geokret': setup_parse_html_geokret,
+    'write_csv': setup_write_csv,
+    'read_csv': setup_read_csv,
+}
+
+# Benchmark name => input file, written before the benchmark process starts
+FIXTURES = {
+    'parse_xml_stream': 'export2.xml',
+    'parse_html_owned': 'mypage.html',
+    'write_csv': 'export2.xml',
+    'read_csv': 'geokrety.csv',
+}
+
+
+def measure(name, size, directory):
+    """
+    Run one benchmark in this process, which should be a fresh one. The
+    peak memory includes the setup, setup_rss_kb is what it retains.
+
+    :param name: String, benchmark name
+    :param size: int, number of Geokrety
+    :param directory: String, fixtures directory
+    :return: dict, the measure
+    """
+    work = BENCHMARKS[name](directory, size)
+    setup_rss = rss_kb()
+    seconds = None
+    runs = 0
+    elapsed = 0.0
+    while elapsed < SUITE_MIN_SECONDS:
+        start = time.time()
+        work()
+        run_seconds = time.time() - start
+        seconds = min(seconds, run_seconds) if runs else run_seconds
+        elapsed += run_seconds
+        runs += 1
+    peak = peak_rss_kb()
+    return {
+        'benchmark': name,
+        'size': size,
+        'runs': runs,
+        'seconds': seconds,
+        'per_second': size / seconds if seconds else None,
+        'setup_rss_kb': setup_rss,
+        'peak_rss_kb': peak,
+    }
+
+
+def run(names, sizes, directory):
+    """
+    Run benchmarks, each in a child interpreter.
+
+    :param names: String list, benchmark names
+    :param sizes: int list, numbers of Geokrety
+    :param directory: String, fixtures directory
+    :return: dict list, the measures
+    """
+    results = []
+    for size in sizes:
+        for name in names:
+            if name in FIXTURES:
+                fixture(directory, FIXTURES[name], size)
+            output = subprocess.check_output(
+                [sys.executable] +
+                ['-W%s' % option for option in sys.warnoptions] +
+                ['-m', 'benchmarks.suite', '--measure', name,
+                 '--sizes', str(size), '--fixtures', directory])
+            result = json.loads(output.splitlines()[-1])
+            print >> sys.stderr, "%-20s %8d %10.2f s %10.0f geokrety/s " \
+                "%8d KiB peak" % (name, size, result['seconds'],
+                                  result['per_second'] or 0,
+                                  result['peak_rss_kb'])
+            results.append(result)
+    return results
+
+
+def environment():
+    """
+    :return: dict, what the measures depend on
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def compare(results, previous):
+    """
+    :param results: dict list, measures of this run
+    :param previous: dict, a previous results document
+    :return: String list, report lines
+    """
+    if previous.get('format') != SUITE_FORMAT:
+        return ['previous results format %s is not comparable' %
+                previous.get('format')]
+    before = dict(((result['benchmark'], result['size']), result)
+                  for result in previous['results'])
+    lines = []
+    for result in results:
+        old = before.get((result['benchmark'], result['size']))
+        if old is None or not old['per_second'] or not result['per_second']:
+            continue
+        speed = result['per_second'] / old['per_second'] - 1
+        memory = float(result['peak_rss_kb']) / old['peak_rss_kb'] - 1
+        flags = []
+        if speed < -SUITE_THRESHOLD:
+            flags.append('SLOWER')
+        if memory > SUITE_THRESHOLD:
+            flags.append('MORE MEMORY')
+        lines.append('%-20s %8d  speed %+6.1f%%  peak memory %+6.1f%%  %s' % (
+            result['benchmark'], result['size'], speed * 100, memory * 100,
+            ' '.join(flags)))
+    return lines
+
+
+def main(argv):
+    """
+    :param argv: String list, command line arguments
+    :return: int, exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.suite',
+        description='Benchmark pykrety parsers and serializers.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(SUITE_SIZES),
+                        help='numbers of Geokrety')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS),
+                        default=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--output', help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results file')
+    parser.add_argument('--fixtures',
+                        help='directory of the synthetic inputs, kept')
+    parser.add_argument('--measure', choices=sorted(BENCHMARKS),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print json.dumps(measure(args.measure, args.sizes[0], args.fixtures))
+        return 0
+
+    directory = args.fixtures or tempfile.mkdtemp(prefix='pykrety-bench-')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        results = run(args.only, args.sizes, directory)
+    finally:
+        if not args.fixtures:
+            shutil.rmtree(directory)
+
+    document = {
+        'format': SUITE_FORMAT,
+        'environment': environment(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'wb') as handle:
+            json.dump(document, handle, indent=2, sort_keys=True)
+    else:
+        print json.dumps(document, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'rb') as handle:
+            previous = json.load(handle)
+        for line in compare(results, previous):
+            print >> sys.stderr, line
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic Geokrety.org documents, modeled on the tests/ fixtures.
+"""
+
+import cgi
+import random
+from xml.sax.saxutils import escape
+
+from pykrety.Geokret import GK_TYPES
+
+
+SPOTTED_TYPES = [u'Inside a cache', u'In the hands of user', u'Missing']
+COUNTRIES = [u'fr', u'pl', u'de', u'cz', u'nl', u'be']
+OWNERS = [u'kumy', u'filips', u'mathieu', u'geokrety']
+
+
+def export_xml(count, seed=0, changes=None, only=None):
+    """
+    Build an export2.php document holding count Geokrety.
+
+    Odd Geokrety use the compact attribute form of export2.php, even ones
+    and changed ones use the detailed child elements form.
+
+    :param count: int, number of Geokrety
+    :param seed: int, random seed
+    :param changes: dict, optional Geokret ID => dict of its name, type
+        and description, replacing the generated ones
+    :param only: set, optional IDs of the Geokrety to include
+    :return: String, utf-8 xml
+    """
+    changes = changes or {}
+    rand = random.Random(seed)
+    parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n'
+             '<gkxml version="1.0" date="2014-09-03 21:49:59">\n'
+             '    <geokrety>\n']
+    for i in xrange(count):
+        gk_id = 40000 + i
+        # values are drawn for every Geokret, so that the others do not
+        # depend on changes and only
+        if i % 2:
+            (distance, gk_type) = (rand.randint(0, 20000), rand.randint(0, 4))
+            (owner, waypoint) = (OWNERS[0], i)
+        else:
+            owner = rand.choice(OWNERS)
+            distance = rand.randint(0, 20000)
+            waypoint = rand.randint(0, 0xfffff)
+            gk_type = 0
+        if only is not None and gk_id not in only:
+            continue
+        change = changes.get(gk_id)
+        if i % 2 and change is None:
+            parts.append(
+                '        <geokret id="%d" dist="%d" owner_id="26422" '
+                'type="%d" image="1409773%04dmgfc.png">\n'
+                '            <![CDATA[c:geo %d]]></geokret>\n' % (
+                    gk_id, distance, gk_type, i % 10000, i))
+        else:
+            change = change or {}
+            gk_type = int(change.get('type', gk_type))
+            parts.append(
+                '        <geokret id="%d">\n'
+                '            <name>%s</name>\n'
+                '            <description>%s</description>\n'
+                '            <owner id="26422">%s</owner>\n'
+                '            <datecreated>2014-09-03 21:49:59</datecreated>\n'
+                '            <distancetravelled>%d</distancetravelled>\n'
+                '            <state>0</state>\n'
+                '            <type id="%d">%s</type>\n'
+                '            <waypoints><waypoint>GC%05X</waypoint>'
+                '</waypoints>\n'
+                '        </geokret>\n' % (
+                    gk_id,
+                    _xml(change.get('name', u'Kret %d' % i)),
+                    _xml(change.get('description',
+                                    u'Kret long description %d\n'
+                                    u'                on two lines' % i)),
+                    _xml(owner), distance, gk_type, _xml(GK_TYPES[gk_type]),
+                    waypoint))
+    parts.append('    </geokrety>\n</gkxml>\n')
+    return ''.join(parts)
+
+
+OWNED_ROW = u'''<tr class='mg%(parity)d'>
+    <td class='mid' data-sort='010'><span title='%(spotted_type)s'><img src='templates/log_icons/0/10.png'
+            alt='%(spotted_type)s' width='37' height='37' border='0'/></span></td>
+    <td><a href="konkret.php?id=%(gk_id)d">GK%(gk_id)04X</a><img src='templates/idcard.png' width='14' height='10'
+            border='0' alt='photo' style='margin-left:12px' class='att_js'
+            title='ajax|2|obrazki-male/%(image)s|obrazki/%(image)s'/><br/><span
+            class="bardzomale">%(name)s</span></td>
+    <td data-sort='%(country)sGC%(waypoint)s'><img src='templates/country_codes/%(country)s.png' alt='%(country)s'
+            title='%(country)s' width='16' height='11'/> <a
+            href='http://www.geocaching.com/seek/cache_details.aspx?wp=GC%(waypoint)s'>GC%(waypoint)s</a></td>
+    <td class='mid' data-sort='2'><span class='att_js'
+            title='&lt;b&gt;2014-11-08 12:00:00&lt;/b&gt;'><img
+            src='templates/log_icons/0/20.png' alt='Dropped to'/> 2&nbsp;days&nbsp;ago<span class='bardzomale'><br/><a
+            href='mypage.php?userid=26422'>%(owner)s</a></span></span></td>
+    <td class='mid' data-sort='%(distance)d'>%(distance)d<span class='bardzomale'> km</span></td>
+    <td class='mid'>%(cache_count)d</td>
+    <td class='mid'><a href='edit.php?co=geokret&amp;id=%(gk_id)d'><img src='templates/edit.png' alt='edit'
+            title='Edit this GeoKret' width='16' height='16' border='0'/></a> <a href="/ruchy.php?nr=%(nr)s"><img
+            src="templates/usmiech.png" alt="log" title="Log this GeoKret" width="16" height="16" border="0"/></a></td>
+</tr>
+'''
+
+
+def owned_html(count, seed=0, page=0, pages=0, first_id=None,
+               changes=None):
+    """
+    Build a mypage.php page holding count Geokrety. A Geokret row only
+    depends on the seed and its ID, it reads the same on every page.
+
+    :param count: int, number of Geokrety
+    :param seed: int, random seed
+    :param page: int, page number announced in the pagination links
+    :param pages: int, pages count announced in the pagination links
+    :param first_id: int, ID of the first Geokret, derived from seed and
+        count by default
+    :param changes: dict, optional Geokret ID => dict of its name,
+        replacing the generated one
+    :return: unicode, html page
+    """
+    changes = changes or {}
+    if first_id is None:
+        first_id = 40000 + seed * count
+    links = u' '.join(u'<a href="/mypage.php?co=1&amp;page=%d">%d</a>' % (
+        number, number) for number in xrange(pages, 0, -1))
+    parts = [u'<html><body><div id="prawo"><h2>kumy\'s geokrets</h2>\n'
+             u'<div>Page %d :: &lt; [%s] &gt; :: <strong><a '
+             u'href="/mypage.php?co=1&amp;page=0">Show all</a></strong>'
+             u'</div>\n<table class=\'sortable\'>\n' % (page, links)]
+    for i in xrange(count):
+        gk_id = first_id + i
+        rand = random.Random(seed * 1000003 + gk_id)
+        parts.append(OWNED_ROW % {
+            'parity': i % 2,
+            'gk_id': gk_id,
+            'name': cgi.escape(changes.get(gk_id, {}).get(
+                'name', u'Kret %d' % gk_id)),
+            'spotted_type': rand.choice(SPOTTED_TYPES),
+            'image': u'1415394%03dhqdaf.jpg' % (gk_id % 1000),
+            'country': rand.choice(COUNTRIES),
+            'waypoint': u'%05X' % rand.randint(0, 0xfff),
+            'owner': rand.choice(OWNERS),
+            'distance': rand.randint(0, 20000),
+            'cache_count': rand.randint(0, 300),
+            'nr': u''.join(rand.choice(u'ABCDEFGHJKLMNPQRSTUVWXYZ')
+                           for _ in xrange(6)),
+        })
+    parts.append(u'</table></div></body></html>\n')
+    return u''.join(parts)
+
+
+DETAILS_PAGE = u'''<html><head><title>GeoKrety :: %(name)s</title></head><body>
+<div id="prawo">
+<table width="100%%">
+    <tr>
+        <td class="heading1" colspan="2"><img src="templates/info.png" alt="Info:"/> GeoKret <strong>%(name)s</strong>
+            (%(type)s) by <a href="mypage.php?userid=%(ownerid)d">%(owner)s</a></td>
+    </tr>
+    <tr>
+        <td class="tresc1" style="width:10em">Reference Number:</td>
+        <td><strong>GK%(gk_id)04X</strong></td>
+    </tr>
+    <tr>
+        <td class="tresc1">Tracking Code:</td>
+        <td><strong>%(nr)s</strong></td>
+    </tr>
+    <tr>
+        <td class="tresc1">Total distance:</td>
+        <td><strong>%(distance)d km</strong></td>
+    </tr>
+    <tr>
+        <td class="tresc1">Places visited:</td>
+        <td><strong>%(cache_count)d</strong></td>
+    </tr>
+    <tr>
+        <td class="tresc1">Forum links:</td>
+        <td><form name="frm1"><input onclick='select()' type='text' name='link1'
+            value='[url=http://geokrety.org/konkret.php?id=%(gk_id)d]%(name)s[/url]' size='14'/></form></td>
+    </tr>
+    <tr>
+        <td class="tresc1">Country track:</td>
+        <td>%(track)s</td>
+    </tr>
+    <tr>
+        <td class="tresc1">Rating:</td>
+        <td style="padding-top: 10px;">
+            <div class="basic" id="0+%(gk_id)d+%(ownerid)d"></div>
+            <span class="szare">votes: %(votes)d, average rating: %(rating)s. You can't rate your own GeoKret.</span>
+            <span id="serverResponse"></span>
+        </td>
+    </tr>
+</table>
+
+<table width="100%%">
+    <tr>
+        <td class="heading1"><img src="templates/comment.png" alt="Comment:"/></td>
+    </tr>
+    <tr>
+        <td class="tresc1" title="Short description">%(description)s</td>
+    </tr>
+    <tr>
+        <td align="right"><a href="imgup.php?typ=0&amp;id=%(gk_id)d">Add photo</a> <a
+            href="edit.php?co=geokret&amp;id=%(gk_id)d" title="Edit description">Edit</a></td>
+    </tr>
+    <tr>
+        <td class="tresc1">
+            <div id="obrazek_box"><span class="obrazek_hi"><a href="obrazki/%(image)s" rel="cb"
+                title=""><img src="obrazki-male/%(image)s" border="0" alt=""/></a></span><span
+                class="obrazek"><a href="wykresy/%(gk_id)d.png" rel="lytebox[gk]" title="Altitude profile"><img
+                src="templates/altitude.png" border="0" alt="Altitude profile"/></a></span></div>
+        </td>
+    </tr>
+</table>
+
+<table width="100%%" class="moves">
+%(moves)s
+</table>
+</div></body></html>
+'''
+
+DETAILS_TRACK = (u"<img src='templates/country_codes/%(country)s.png' "
+                 u"class='textalign' alt='%(country_upper)s' "
+                 u"title='%(country_upper)s'/><span class='xxs'>"
+                 u"(%(count)d)</span> ")
+
+DETAILS_MOVE = (u"<tr><td class='mid'><img src='templates/log_icons/0/0.png' "
+                u"alt='Dropped to'/></td><td>2014-11-%(day)02d 12:00:00</td>"
+                u"<td><a href='http://www.geocaching.com/seek/"
+                u"cache_details.aspx?wp=GC%(waypoint)s'>GC%(waypoint)s</a>"
+                u"</td><td><a href='mypage.php?userid=26422'>%(owner)s</a>"
+                u"</td><td>Moved along, %(km)d km</td></tr>")
+
+
+def details_html(gk_id, seed=0, moves=10, change=None):
+    """
+    Build a konkret.php page of one Geokret.
+
+    :param gk_id: int, Geokret ID
+    :param seed: int, random seed
+    :param moves: int, rows of the moves table
+    :param change: dict, optional name, type and description, replacing
+        the generated ones
+    :return: unicode, html page
+    """
+    change = change or {}
+    rand = random.Random(seed * 1000003 + gk_id)
+    track = u''.join(DETAILS_TRACK % {
+        'country': country,
+        'country_upper': country.upper(),
+        'count': rand.randint(1, 5),
+    } for country in rand.sample(COUNTRIES, rand.randint(1, 3)))
+    gk_type = rand.choice([u'Traditional', u'Book/CD/DVD', u'Coin'])
+    if 'type' in change:
+        gk_type = GK_TYPES[int(change['type'])]
+    return DETAILS_PAGE % {
+        'gk_id': gk_id,
+        'name': cgi.escape(change.get('name', u'Kret %d' % gk_id)),
+        'type': gk_type,
+        'ownerid': 26422,
+        'owner': rand.choice(OWNERS),
+        'nr': u''.join(rand.choice(u'ABCDEFGHJKLMNPQRSTUVWXYZ')
+                       for _ in xrange(6)),
+        'distance': rand.randint(0, 20000),
+        'cache_count': rand.randint(0, 300),
+        'track': track,
+        'votes': rand.randint(0, 20),
+        'rating': rand.choice([u'0', u'3.5', u'4.25', u'5']),
+        'description': cgi.escape(change.get(
+            'description', u'Kret long description %d, ' % gk_id * 8)),
+        'image': u'1409496%03dcdpga.jpg' % (gk_id % 1000),
+        'moves': u'\n'.join(DETAILS_MOVE % {
+            'day': rand.randint(1, 28),
+            'waypoint': u'%05X' % rand.randint(0, 0xfffff),
+            'owner': rand.choice(OWNERS),
+            'km': rand.randint(0, 500),
+        } for _ in xrange(moves)),
+    }
+
+
+def _xml(text):
+    """
+    :param text: unicode
+    :return: String, utf-8 xml character data
+    """
+    return escape(text).encode('utf-8')
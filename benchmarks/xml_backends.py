@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare export2.php XML parsing engines, in Geokrety per second.
+
+    python -m benchmarks.xml_backends [count ...]
+"""
+
+import sys
+import time
+from cStringIO import StringIO
+
+from pykrety.parsers.GeokretyXMLHandler import iter_xml_stream, XML_BACKENDS
+from benchmarks.synthetic import export_xml
+
+
+def run(count):
+    """
+    Parse a synthetic export with every backend.
+
+    :param count: int, number of Geokrety in the document
+    :return: dict, backend => Geokrety per second
+    """
+    document = export_xml(count)
+    results = {}
+    reference = None
+    for backend in sorted(XML_BACKENDS):
+        start = time.time()
+        geokrety = list(iter_xml_stream(StringIO(document), backend))
+        elapsed = time.time() - start
+
+        geokrety = [gk.as_dict() for gk in geokrety]
+        if reference is None:
+            reference = geokrety
+        elif geokrety != reference:
+            raise AssertionError("%s output differs" % backend)
+        results[backend] = len(geokrety) / elapsed
+    return results
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for count in counts:
+        for backend, rate in sorted(run(count).items()):
+            print "%8d geokrety  %-10s %10.0f geokrety/s" % (
+                count, backend, rate)
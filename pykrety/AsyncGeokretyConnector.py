@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non blocking abstraction around Geokrety.org.
+
+Every call returns at once with a multiprocessing.pool.AsyncResult. Wait
+for its value with .get(), poll it with .ready(), or pass a callback
+which is called with the value once the request completed.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+from GeokretyConnector import GeokretyConnector, URL
+
+# Default number of requests in flight
+ASYNC_MAX_CONCURRENCY = 32
+
+
+class AsyncGeokretyConnector(GeokretyConnector):
+    """
+    Non blocking connector for geokrety.org.
+
+    Calls are queued on a pool of max_concurrency threads sharing the
+    session and the parsers of GeokretyConnector. Any number of calls may
+    be queued, at most max_concurrency requests are in flight.
+    """
+    pool = None
+
+    def __init__(self, login, password, url=URL,
+                 max_concurrency=ASYNC_MAX_CONCURRENCY, transport=None):
+        """
+        Initialize the connector. Need credentials from Geokrety.org
+
+        :param login: string
+        :param password: string
+        :param url: string, optional Geokrety.org base url
+        :param max_concurrency: int, maximum requests in flight
+        :param transport: GeokretyTransport, optional, to tune connections
+            or share them between connectors
+        :return: None
+        """
+        GeokretyConnector.__init__(self, login, password, url,
+                                   transport=transport)
+        self.pool = ThreadPool(max_concurrency)
+        self._grow_connection_pool(max_concurrency)
+
+    def _submit(self, method, args=(), kwargs=None, callback=None):
+        """
+        Queue a blocking GeokretyConnector method on the pool.
+
+        :param method: unbound GeokretyConnector method
+        :param args: tuple, positional arguments
+        :param kwargs: dict, keyword arguments
+        :param callback: callable, optional, called with the result
+        :return: AsyncResult
+        """
+        return self.pool.apply_async(method, (self,) + tuple(args),
+                                     kwargs or {}, callback)
+
+    def connect_api(self, callback=None):
+        """
+        Retrieve secid to be used by API calls
+
+        :param callback: callable, optional, called once connected
+        :return: AsyncResult
+        """
+        return self._submit(GeokretyConnector.connect_api,
+                            callback=callback)
+
+    def connect_web(self, callback=None):
+        """
+        Connect to Geokrety.org, store received cookies for future
+        authenticated calls.
+
+        :param callback: callable, optional, called once connected
+        :return: AsyncResult
+        """
+        return self._submit(GeokretyConnector.connect_web,
+                            callback=callback)
+
+    def get_inventory(self, callback=None):
+        """
+        Retrieve the user inventory via API call.
+
+        :param callback: callable, optional, called with the Geokret array
+        :return: AsyncResult of Geokret array
+        """
+        return self._submit(GeokretyConnector.get_inventory,
+                            callback=callback)
+
+    def get_inventory_web(self, user_id=None, callback=None):
+        """
+        Retrieve inventory for user_id.
+        Parse the Web pages.
+
+        :param user_id: int, optional, default to connected user
+        :param callback: callable, optional, called with the Geokret array
+        :return: AsyncResult of Geokret array
+        """
+        return self._submit(GeokretyConnector.get_inventory_web, (user_id,),
+                            callback=callback)
+
+    def get_geokret_details_web(self, gk_id, callback=None):
+        """
+        Retrieve full details for a Geokret.
+        Parse the Web pages.
+
+        Failures are raised by AsyncResult.get() as GeokretyConnectorError.
+
+        :param gk_id: int, Geokret ID
+        :param callback: callable, optional, called with the Geokret
+        :return: AsyncResult of Geokret
+        """
+        return self._submit(GeokretyConnector._fetch_geokret_details,
+                            (gk_id,), callback=callback)
+
+    def update_geokret_web(self, geokret, callback=None):
+        """
+        Update a Geokret, via form post.
+        Authentication mandatory.
+
+        Failures are raised by AsyncResult.get() as GeokretyConnectorError.
+
+        :param geokret: Geokret object
+        :param callback: callable, optional, called with the Geokret
+        :return: AsyncResult of Geokret
+        """
+        return self._submit(GeokretyConnector._update_geokret,
+                            (geokret,), callback=callback)
+
+    def upload_image_web(self, geokret, image_filename,
+                         description=None, avatar=False, callback=None):
+        """
+        Upload a picture for a Geokret.
+        Authentication mandatory.
+
+        Failures are raised by AsyncResult.get() as GeokretyConnectorError.
+
+        :param geokret: Geokret object
+        :param image_filename: image file to upload
+        :param description: String, optional image description
+        :param avatar: Boolean, set image as featured
+        :param callback: callable, optional, called with UPLOAD_UPLOADED
+        :return: AsyncResult of String
+        """
+        return self._submit(GeokretyConnector._upload_image,
+                            (geokret, image_filename, description, avatar),
+                            callback=callback)
+
+    def create_geokret_web(self, geokret, logathome=False, callback=None):
+        """
+        Create a new Geokret from a Geokret instance.
+        Authentication mandatory.
+
+        Failures are raised by AsyncResult.get() as GeokretyConnectorError.
+
+        :param geokret: Geokret object
+        :param logathome: Boolean, set the initial position to user's home
+        :param callback: callable, optional, called with the Geokret
+        :return: AsyncResult of Geokret
+        """
+        return self._submit(GeokretyConnector._create_geokret,
+                            (geokret, logathome), callback=callback)
+
+    def close(self):
+        """
+        Wait for queued calls to complete and release the threads.
+
+        :return: None
+        """
+        self.pool.close()
+        self.pool.join()
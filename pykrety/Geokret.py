@@ -54,38 +54,139 @@ GK_CVS_COLUMNS = [
     "cache_rating",
 ]
 
+# Geokrety fields
+GK_FIELDS = tuple(GK_CVS_COLUMNS)
+
+# Geokrety fields values when not set
+GK_DEFAULTS = dict.fromkeys(GK_FIELDS)
+GK_DEFAULTS.update({
+    "gk_id": 0,
+    "ownerid": 0,
+    "cache_count": 0,
+})
+
+# Low cardinality fields, their values are shared between Geokrety
+GK_INTERNED_FIELDS = frozenset([
+    "owner",
+    "state",
+    "type",
+    "spotted_type",
+    "spotted_country",
+])
+
+# Distinct values shared at most, the table is emptied once full so that
+# long running processes do not grow it without bound
+GK_INTERNED_MAX = 4096
+
+# Fields sent by GeokretyConnector.update_geokret_web()
+GK_EDITABLE_FIELDS = frozenset([
+    "name",
+    "description",
+    "type",
+])
+
+_INTERNED = {}
+
+
+def intern_value(value):
+    """
+    Return the shared copy of a string value, unicode included.
+
+    :param value: the value to share
+    :return: an equal value, shared by every caller since the table was
+        last emptied
+    """
+    if not isinstance(value, basestring):
+        return value
+    if len(_INTERNED) >= GK_INTERNED_MAX and value not in _INTERNED:
+        _INTERNED.clear()
+    return _INTERNED.setdefault(value, value)
+
 
 class Geokret(object):
     """
     Object helper for representing a single Geokret
-    """
 
-    gk_id = 0
-    tracking_number = None
-    name = None
-    description = None
-    imagehi = None
-    images = None
-    owner = None
-    ownerid = 0
-    datecreated = None
-    distance = None
-    state = None
-    type = None
-    spotted_name = None
-    spotted_type = None
-    spotted_country = None
-    country_track = None
-    cache_count = 0
-    cache_rating = None
+    Fields are stored in slots, instead of a per instance dict.
 
+    Field changes, through setters or plain attribute writes, are recorded
+    once mark_clean() was called, usually by the connector when the Geokret
+    is loaded from or saved to Geokrety.org. Until then, every field is
+    considered changed. Lists changed in place are not seen, except
+    through add_image().
+    """
+    __slots__ = GK_FIELDS + ('_dirty',)
 
     def __init__(self, **kwargs):
         """
-        :param kwargs: dict, representing a Geokret
+        :param kwargs: dict, representing a Geokret, keys which are not
+            GK_FIELDS are ignored
+        :return: None
+        """
+        # nothing is recorded yet, skip the tracking
+        _set_dirty(self, None)
+        for (set_field, default) in _DEFAULT_SETTERS:
+            set_field(self, default)
+        for (key, value) in kwargs.iteritems():
+            if key in GK_INTERNED_FIELDS:
+                value = intern_value(value)
+            elif key not in GK_DEFAULTS:
+                continue
+            object.__setattr__(self, key, value)
+
+    def __getstate__(self):
+        """
+        :return: dict, pickled state
+        """
+        state = self.as_dict()
+        state['_dirty'] = self._dirty
+        return state
+
+    def __setstate__(self, state):
+        """
+        :param state: dict, pickled state
+        :return: None
+        """
+        _set_dirty(self, None)
+        for (key, value) in state.iteritems():
+            object.__setattr__(self, key, value)
+
+    def as_dict(self):
+        """
+        :return: dict, field name => value
+        """
+        return dict((field, getattr(self, field)) for field in GK_FIELDS)
+
+    def dirty_fields(self):
+        """
+        :return: frozenset, fields changed since mark_clean(), every field
+            if it was never called
+        """
+        if self._dirty is None:
+            return frozenset(GK_FIELDS)
+        return frozenset(self._dirty)
+
+    def mark_clean(self):
+        """
+        Consider the Geokret in sync with Geokrety.org, start recording
+        changes.
+
         :return: None
         """
-        self.__dict__.update(kwargs)
+        self._dirty = set()
+
+    def __setattr__(self, name, value):
+        """
+        Set a field, recording the change.
+
+        :param name: String, field name
+        :param value: the new value
+        :return: None
+        """
+        if (name != '_dirty' and self._dirty is not None and
+                getattr(self, name) != value):
+            self._dirty.add(name)
+        object.__setattr__(self, name, value)
 
     def gkid(self):
         """
@@ -123,7 +224,7 @@ class Geokret(object):
         :param gk_type: int, The Geokret Type
         :return: None
         """
-        self.type = gk_type
+        self.type = intern_value(gk_type)
 
     def set_description(self, description):
         """
@@ -139,7 +240,7 @@ class Geokret(object):
         :param owner: String, Geokret Owner Name
         :return: None
         """
-        self.owner = owner
+        self.owner = intern_value(owner)
 
     def set_owner_id(self, ownerid):
         """
@@ -180,6 +281,8 @@ class Geokret(object):
         :return: None
         """
         self.images.append("http://geokrety.org/obrazki/" + image)
+        if self._dirty is not None:
+            self._dirty.add("images")
 
     def set_spotted_cache_name(self, spotted_name):
         """
@@ -195,7 +298,7 @@ class Geokret(object):
         :param spotted_type: String, status
         :return: None
         """
-        self.spotted_type = spotted_type
+        self.spotted_type = intern_value(spotted_type)
 
     def set_spotted_country(self, spotted_country):
         """
@@ -203,14 +306,18 @@ class Geokret(object):
         :param spotted_country: String, country initials
         :return: None
         """
-        self.spotted_country = spotted_country
+        self.spotted_country = intern_value(spotted_country)
 
     def set_country_track(self, country_track):
         """
         Set the Geokret Country history
-        :param country_track: Array of tuples, [(String:country, int:count)]
+        :param country_track: Array of tuples, [(String:country, int:count)],
+            or None
         :return: None
         """
+        if country_track is not None:
+            country_track = [(intern_value(country), count)
+                             for (country, count) in country_track]
         self.country_track = country_track
 
     def set_cache_count(self, cache_count):
@@ -238,12 +345,18 @@ class Geokret(object):
         return u"<__Geokrety__: %s %s: %s>" % (
             self.name,
             gkid,
-            str(self.__dict__))
+            str(self.as_dict()))
+
+
+# Slot setters, faster than object.__setattr__ and bypassing the tracking
+_set_dirty = Geokret.__dict__['_dirty'].__set__
+_DEFAULT_SETTERS = tuple((Geokret.__dict__[field].__set__, GK_DEFAULTS[field])
+                         for field in GK_FIELDS)
 
 
 if __name__ == "__main__":
     GKDEF = {
-        "id": 18,
+        "gk_id": 18,
         "name": "Kret Name",
         "description": "Kret Long Description",
         "images": []
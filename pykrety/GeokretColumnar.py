@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+Binary columnar files of Geokrety.
+
+The file starts with a magic string and a JSON header describing every
+column, followed by the columns themselves, each one a contiguous little
+endian buffer aligned on 8 bytes:
+
+    int       int64 values, then null flags (uint8) for unset values
+    category  int32 codes, the values list is in the header
+    text      null flags (uint8), offsets (int64, rows + 1), utf-8 data
+    json      same as text, values encoded as in GeokretyCSV
+
+Files are read through mmap: with NumPy the numeric columns are views of
+the file, and text columns are decoded when their values are accessed, so
+opening a file costs the same whatever its size. Only the requested columns
+are loaded. The file stays mapped until the table is closed.
+"""
+
+import json
+import mmap
+import struct
+from array import array
+
+from GeokretTable import GeokretTable, INT_TYPECODE, CODE_TYPECODE, numpy
+from GeokretyCSV import CSV_JSON_FIELDS, encode_json_field, decode_json_field
+
+COLUMNAR_MAGIC = 'GKCOLS01'
+
+COLUMNAR_ALIGN = 8
+
+INT_DTYPE = '<i8'
+CODE_DTYPE = '<i4'
+NULL_DTYPE = '<u1'
+
+# NumPy dtype => (struct format character, array typecode)
+DTYPES = {
+    INT_DTYPE: ('q', INT_TYPECODE),
+    CODE_DTYPE: ('i', CODE_TYPECODE),
+    NULL_DTYPE: ('B', 'B'),
+}
+
+
+class TextColumn(object):
+    """
+    Text column of a columnar file, values are decoded on access.
+    """
+
+    def __init__(self, buffer, start, nulls, offsets, decode):
+        """
+        :param buffer: mmap, the file
+        :param start: int, data position in the file
+        :param nulls: typed array, 1 for unset values
+        :param offsets: typed array, value bounds relative to start
+        :param decode: callable, turns stored bytes into the value
+        :return: None
+        """
+        self.buffer = buffer
+        self.start = start
+        self.nulls = nulls
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self):
+        """
+        :return: int, rows count
+        """
+        return len(self.nulls)
+
+    def __getitem__(self, row):
+        """
+        :param row: int, row index
+        :return: the value
+        """
+        if self.nulls[row]:
+            return None
+        return self.decode(self.buffer[self.start + int(self.offsets[row]):
+                                       self.start + int(self.offsets[row + 1])])
+
+    def __iter__(self):
+        """
+        :return: values generator
+        """
+        buffer = self.buffer
+        start = self.start
+        decode = self.decode
+        offsets = self.offsets.tolist()
+        for (row, null) in enumerate(self.nulls.tolist()):
+            if null:
+                yield None
+            else:
+                yield decode(buffer[start + offsets[row]:
+                                    start + offsets[row + 1]])
+
+
+def write_columnar(geokrety, filename):
+    """
+    Write Geokrety as a columnar file.
+
+    :param geokrety: GeokretTable, or iterable of Geokret
+    :param filename: String, output filename
+    :return: int, Geokrety written
+    """
+    if isinstance(geokrety, GeokretTable):
+        table = geokrety
+    else:
+        table = GeokretTable.from_geokrety(geokrety)
+
+    columns = {}
+    buffers = []
+    position = [0]
+
+    def add(data):
+        buffers.append(data)
+        offset = position[0]
+        padding = -len(data) % COLUMNAR_ALIGN
+        buffers.append('\0' * padding)
+        position[0] += len(data) + padding
+        return offset
+
+    for (name, values) in sorted(table.columns.iteritems()):
+        if name in table.categories:
+            columns[name] = {'kind': 'category', 'dtype': CODE_DTYPE,
+                             'categories': table.categories[name],
+                             'offset': add(_pack(values, CODE_DTYPE))}
+        else:
+            columns[name] = {'kind': 'int', 'dtype': INT_DTYPE,
+                             'offset': add(_pack(values, INT_DTYPE))}
+            if name in table.nulls:
+                columns[name]['nulls'] = add(_pack(table.nulls[name],
+                                                   NULL_DTYPE))
+
+    for (name, values) in sorted(table.texts.iteritems()):
+        kind = 'json' if name in CSV_JSON_FIELDS else 'text'
+        (nulls, offsets, data) = _encode_texts(values, kind)
+        columns[name] = {'kind': kind,
+                         'nulls': add(_pack(nulls, NULL_DTYPE)),
+                         'offsets': add(_pack(offsets, INT_DTYPE)),
+                         'data': add(data)}
+
+    header = json.dumps({'rows': table.size, 'columns': columns})
+    header += ' ' * (-len(header) % COLUMNAR_ALIGN)
+    with open(filename, 'wb') as handle:
+        handle.write(COLUMNAR_MAGIC)
+        handle.write(struct.pack('<Q', len(header)))
+        handle.write(header)
+        for data in buffers:
+            handle.write(data)
+    return table.size
+
+
+def read_columnar(filename, columns=None):
+    """
+    Open a columnar file.
+
+    :param filename: String, input filename
+    :param columns: iterable of String, optional columns to load, all
+        by default
+    :return: GeokretTable, to be closed
+    """
+    with open(filename, 'rb') as handle:
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+        buffer.close()
+        raise ValueError("%s is not a columnar Geokrety file" % filename)
+    (length,) = struct.unpack_from('<Q', buffer, len(COLUMNAR_MAGIC))
+    start = len(COLUMNAR_MAGIC) + 8
+    header = json.loads(buffer[start:start + length])
+    start += length
+    rows = header['rows']
+
+    values = {}
+    categories = {}
+    texts = {}
+    nulls = {}
+    for (name, column) in header['columns'].iteritems():
+        if columns is not None and name not in columns:
+            continue
+        kind = column['kind']
+        if kind in ('int', 'category'):
+            values[name] = _unpack(buffer, start + column['offset'], rows,
+                                   column['dtype'])
+            if kind == 'category':
+                categories[name] = column['categories']
+            if 'nulls' in column:
+                nulls[name] = _unpack(buffer, start + column['nulls'], rows,
+                                      NULL_DTYPE)
+        else:
+            if kind == 'json':
+                decode = lambda data, name=name: decode_json_field(name, data)
+            else:
+                decode = lambda data: data.decode('utf-8')
+            texts[name] = TextColumn(
+                buffer, start + column['data'],
+                _unpack(buffer, start + column['nulls'], rows, NULL_DTYPE),
+                _unpack(buffer, start + column['offsets'], rows + 1,
+                        INT_DTYPE),
+                decode)
+
+    return GeokretTable(values, categories, rows, texts, nulls, buffer)
+
+
+def _encode_texts(values, kind):
+    """
+    :param values: sequence of text column values
+    :param kind: String, 'text' or 'json'
+    :return: tuple, (null flags, offsets, data)
+    """
+    nulls = []
+    offsets = [0]
+    parts = []
+    size = 0
+    for value in values:
+        if value is None:
+            nulls.append(1)
+        else:
+            nulls.append(0)
+            if kind == 'json':
+                value = encode_json_field(value)
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            else:
+                value = str(value)
+            parts.append(value)
+            size += len(value)
+        offsets.append(size)
+    return (nulls, offsets, ''.join(parts))
+
+
+def _pack(values, dtype):
+    """
+    :param values: sequence of int
+    :param dtype: String, one of DTYPES
+    :return: String, little endian buffer
+    """
+    if numpy is not None:
+        return numpy.asarray(values, dtype=dtype).tostring()
+    return struct.pack('<%d%s' % (len(values), DTYPES[dtype][0]), *values)
+
+
+def _unpack(buffer, offset, count, dtype):
+    """
+    :param buffer: mmap, the file
+    :param offset: int, buffer position
+    :param count: int, values count
+    :param dtype: String, one of DTYPES
+    :return: typed array, a view of buffer with NumPy
+    """
+    if numpy is not None:
+        return numpy.frombuffer(buffer, dtype=dtype, count=count,
+                                offset=offset)
+    (code, typecode) = DTYPES[dtype]
+    return array(typecode,
+                 struct.unpack_from('<%d%s' % (count, code), buffer, offset))
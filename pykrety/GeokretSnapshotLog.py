@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+Append-only log of Geokrety state snapshots.
+
+Each snapshot appends one fixed-width record per Geokret, all sharing the
+snapshot timestamp and sorted by gk_id:
+
+    timestamp    float64
+    gk_id        uint32
+    distance     uint32
+    cache_count  uint32
+    spot         uint32, code of the (spotted_type, spotted_name) pair
+
+Spot codes are listed in a sidecar file, one JSON pair per line. The log
+is read through mmap. Snapshots are appended in time order, so both "state
+of all at time T" and "history of a Geokret" are answered with binary
+searches instead of a scan of the log.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+SNAPSHOT_RECORD = struct.Struct('<dIIII')
+
+SnapshotRecord = namedtuple('SnapshotRecord', [
+    'timestamp', 'gk_id', 'distance', 'cache_count',
+    'spotted_type', 'spotted_name'])
+
+
+class _RecordField(object):
+    """
+    Sequence of one field of the log records, for the bisect module.
+    """
+
+    def __init__(self, buffer, size, index):
+        """
+        :param buffer: mmap, the log
+        :param size: int, records count
+        :param index: int, field position in SNAPSHOT_RECORD
+        :return: None
+        """
+        self.buffer = buffer
+        self.size = size
+        self.index = index
+
+    def __len__(self):
+        """
+        :return: int, records count
+        """
+        return self.size
+
+    def __getitem__(self, position):
+        """
+        :param position: int, record index
+        :return: the field value
+        """
+        return SNAPSHOT_RECORD.unpack_from(
+            self.buffer, position * SNAPSHOT_RECORD.size)[self.index]
+
+
+class GeokretSnapshotLog(object):
+    """
+    Snapshot log stored in filename, and filename.names for spot codes.
+
+        log = GeokretSnapshotLog('/tmp/pykrety.log')
+        log.append(gkConn.get_inventory_web())
+        for record in log.history(46464):
+            print record.timestamp, record.distance
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: String, log file, created when needed
+        :return: None
+        """
+        self.filename = filename
+        self.names_filename = filename + '.names'
+        self.spots = []
+        self.codes = {}
+        self.buffer = None
+        self.size = 0
+
+        if os.path.exists(self.names_filename):
+            with open(self.names_filename, 'rb') as handle:
+                for line in handle:
+                    self._remember_spot(tuple(json.loads(line)))
+
+    def append(self, geokrety, timestamp=None):
+        """
+        Record a snapshot. Timestamps must be strictly increasing, a
+        Geokret listed twice is recorded once, with its last state.
+
+        :param geokrety: iterable of Geokret
+        :param timestamp: float, optional unix time, default to now
+        :return: int, records written
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        timestamps = self._field(0)
+        if len(timestamps) and timestamps[len(timestamps) - 1] >= timestamp:
+            raise ValueError("snapshots must be appended in time order, "
+                             "at distinct timestamps")
+
+        new_spots = []
+        records = []
+        latest = dict((int(geokret.gk_id), geokret) for geokret in geokrety)
+        for (_, geokret) in sorted(latest.iteritems()):
+            spot = (geokret.spotted_type, geokret.spotted_name)
+            code = self.codes.get(spot)
+            if code is None:
+                code = self._remember_spot(spot)
+                new_spots.append(spot)
+            records.append(SNAPSHOT_RECORD.pack(
+                timestamp, int(geokret.gk_id), int(geokret.distance or 0),
+                int(geokret.cache_count or 0), code))
+
+        # codes are saved before the records using them
+        if new_spots:
+            with open(self.names_filename, 'ab') as handle:
+                for spot in new_spots:
+                    handle.write(json.dumps(spot) + '\n')
+        with open(self.filename, 'ab') as handle:
+            # drop a record left incomplete by an interrupted append
+            handle.truncate(self._count() * SNAPSHOT_RECORD.size)
+            handle.write(''.join(records))
+        return len(records)
+
+    def __len__(self):
+        """
+        :return: int, records count
+        """
+        return self._count()
+
+    def timestamps(self):
+        """
+        :return: list of float, snapshots timestamps
+        """
+        timestamps = self._field(0)
+        result = []
+        position = 0
+        while position < len(timestamps):
+            timestamp = timestamps[position]
+            result.append(timestamp)
+            position = bisect.bisect_right(timestamps, timestamp, position)
+        return result
+
+    def state_at(self, timestamp):
+        """
+        State of all Geokrety in the last snapshot taken at or before
+        timestamp.
+
+        :param timestamp: float, unix time
+        :return: list of SnapshotRecord, ordered by gk_id
+        """
+        timestamps = self._field(0)
+        end = bisect.bisect_right(timestamps, timestamp)
+        if not end:
+            return []
+        start = bisect.bisect_left(timestamps, timestamps[end - 1])
+        return [self._record(position) for position in xrange(start, end)]
+
+    def history(self, gk_id, since=None, until=None):
+        """
+        States of one Geokret, one per snapshot it appears in.
+
+        :param gk_id: int, Geokret ID
+        :param since: float, optional unix time of the first snapshot
+        :param until: float, optional unix time of the last snapshot
+        :return: list of SnapshotRecord, in time order
+        """
+        timestamps = self._field(0)
+        ids = self._field(1)
+        position = 0
+        if since is not None:
+            position = bisect.bisect_left(timestamps, since)
+        end = len(timestamps)
+        if until is not None:
+            end = bisect.bisect_right(timestamps, until)
+
+        result = []
+        while position < end:
+            batch_end = bisect.bisect_right(
+                timestamps, timestamps[position], position, end)
+            found = bisect.bisect_left(ids, gk_id, position, batch_end)
+            if found < batch_end and ids[found] == gk_id:
+                result.append(self._record(found))
+            position = batch_end
+        return result
+
+    def close(self):
+        """
+        :return: None
+        """
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+            self.size = 0
+
+    def _remember_spot(self, spot):
+        """
+        :param spot: tuple, (spotted_type, spotted_name)
+        :return: int, spot code
+        """
+        code = self.codes[spot] = len(self.spots)
+        self.spots.append(spot)
+        return code
+
+    def _count(self):
+        """
+        :return: int, complete records in the log file
+        """
+        try:
+            return os.path.getsize(self.filename) // SNAPSHOT_RECORD.size
+        except OSError:
+            return 0
+
+    def _map(self):
+        """
+        Map the log, again when it grew since the last call.
+
+        :return: int, mapped records count
+        """
+        count = self._count()
+        if count != self.size:
+            self.close()
+            if count:
+                with open(self.filename, 'rb') as handle:
+                    self.buffer = mmap.mmap(
+                        handle.fileno(), count * SNAPSHOT_RECORD.size,
+                        access=mmap.ACCESS_READ)
+            self.size = count
+        return count
+
+    def _field(self, index):
+        """
+        :param index: int, field position in SNAPSHOT_RECORD
+        :return: _RecordField
+        """
+        count = self._map()
+        return _RecordField(self.buffer, count, index)
+
+    def _record(self, position):
+        """
+        :param position: int, record index
+        :return: SnapshotRecord
+        """
+        (timestamp, gk_id, distance, cache_count, code) = \
+            SNAPSHOT_RECORD.unpack_from(self.buffer,
+                                        position * SNAPSHOT_RECORD.size)
+        (spotted_type, spotted_name) = self.spots[code]
+        return SnapshotRecord(timestamp, gk_id, distance, cache_count,
+                              spotted_type, spotted_name)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local Geokrety inventory store, backed by SQLite.
+
+images and country_track are kept in child tables, their length in the
+geokrety table tells an empty list from None. Lookups by gk_id,
+tracking_number, owner and spotted cache are indexed, and results are
+streamed from the database instead of being loaded at once.
+"""
+
+import sqlite3
+
+from Geokret import Geokret, GK_DEFAULTS
+
+# Geokrety written per transaction
+STORE_CHUNK_SIZE = 1000
+
+# Geokrety fetched per query when reading
+STORE_FETCH_SIZE = 500
+
+# Inventory listing fields telling whether a Geokret changed
+SNAPSHOT_FIELDS = (
+    "distance",
+    "cache_count",
+    "spotted_name",
+    "spotted_type",
+)
+
+# Scalar columns of the geokrety table
+STORE_COLUMNS = (
+    "gk_id",
+    "tracking_number",
+    "name",
+    "description",
+    "imagehi",
+    "owner",
+    "ownerid",
+    "datecreated",
+    "distance",
+    "state",
+    "type",
+    "spotted_name",
+    "spotted_type",
+    "spotted_country",
+    "cache_count",
+    "cache_rating_votes",
+    "cache_rating_score",
+    "images_count",
+    "country_track_count",
+)
+
+# List fields kept in child tables => geokrety column holding their length
+STORE_LIST_COLUMNS = (
+    ("images", "images_count"),
+    ("country_track", "country_track_count"),
+)
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geokrety (
+    gk_id INTEGER PRIMARY KEY,
+    tracking_number TEXT,
+    name TEXT,
+    description TEXT,
+    imagehi TEXT,
+    owner TEXT,
+    ownerid INTEGER,
+    datecreated TEXT,
+    distance INTEGER,
+    state TEXT,
+    type INTEGER,
+    spotted_name TEXT,
+    spotted_type TEXT,
+    spotted_country TEXT,
+    cache_count INTEGER,
+    cache_rating_votes TEXT,
+    cache_rating_score TEXT,
+    images_count INTEGER,
+    country_track_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS geokrety_tracking_number
+    ON geokrety (tracking_number);
+CREATE INDEX IF NOT EXISTS geokrety_owner ON geokrety (owner);
+CREATE INDEX IF NOT EXISTS geokrety_ownerid ON geokrety (ownerid);
+CREATE INDEX IF NOT EXISTS geokrety_spotted_name ON geokrety (spotted_name);
+
+CREATE TABLE IF NOT EXISTS geokret_images (
+    gk_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (gk_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS geokret_country_track (
+    gk_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    country TEXT,
+    count INTEGER,
+    PRIMARY KEY (gk_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class GeokretStore(object):
+    """
+    SQLite store of Geokrety.
+
+        store = GeokretStore('/tmp/pykrety.db')
+        store.upsert(gkConn.iter_inventory_web())
+        geokret = store.find_by_tracking_number('RPEYDE')
+    """
+    connection = None
+
+    def __init__(self, filename=':memory:'):
+        """
+        Open, and create when needed, the store.
+
+        :param filename: String, SQLite database file
+        :return: None
+        """
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(STORE_SCHEMA)
+
+        # stores created before the lists length was kept
+        columns = set(row[1] for row in self.connection.execute(
+            "PRAGMA table_info(geokrety)"))
+        with self.connection:
+            for (_, column) in STORE_LIST_COLUMNS:
+                if column not in columns:
+                    self.connection.execute(
+                        "ALTER TABLE geokrety ADD COLUMN %s INTEGER" % column)
+
+    def close(self):
+        """
+        :return: None
+        """
+        self.connection.close()
+
+    def upsert(self, geokrety, chunk_size=STORE_CHUNK_SIZE, merge=False):
+        """
+        Insert or replace Geokrety, chunk_size of them per transaction.
+
+        Merging suits partial sources, like the API export: fields left
+        to their default value, None or 0, keep the stored value instead
+        of replacing it.
+
+        :param geokrety: iterable of Geokret, a list or a connector stream
+        :param chunk_size: int, Geokrety written per transaction
+        :param merge: Boolean, merge with the stored Geokrety
+        :return: int, Geokrety written
+        """
+        count = 0
+        chunk = []
+        for geokret in geokrety:
+            chunk.append(geokret)
+            if len(chunk) >= chunk_size:
+                count += self._upsert_chunk(chunk, merge)
+                chunk = []
+        if chunk:
+            count += self._upsert_chunk(chunk, merge)
+        return count
+
+    def delete(self, gk_ids):
+        """
+        :param gk_ids: iterable of int, Geokrety IDs
+        :return: None
+        """
+        rows = [(int(gk_id),) for gk_id in gk_ids]
+        with self.connection:
+            for table in ('geokret_images', 'geokret_country_track',
+                          'geokrety'):
+                self.connection.executemany(
+                    "DELETE FROM %s WHERE gk_id = ?" % table, rows)
+
+    def get(self, gk_id):
+        """
+        :param gk_id: int, Geokret ID
+        :return: The Geokret or None
+        """
+        for geokret in self._query("gk_id = ?", (int(gk_id),)):
+            return geokret
+
+    def find_by_tracking_number(self, tracking_number):
+        """
+        :param tracking_number: String, Geokret Tracking Number
+        :return: The Geokret or None
+        """
+        for geokret in self._query("tracking_number = ?", (tracking_number,)):
+            return geokret
+
+    def iter_by_owner(self, owner):
+        """
+        :param owner: String, owner name
+        :return: Geokret generator
+        """
+        return self._query("owner = ?", (owner,))
+
+    def iter_by_owner_id(self, ownerid):
+        """
+        :param ownerid: int, owner ID
+        :return: Geokret generator
+        """
+        return self._query("ownerid = ?", (int(ownerid),))
+
+    def iter_by_spotted_name(self, spotted_name):
+        """
+        :param spotted_name: String, cache waypoint
+        :return: Geokret generator
+        """
+        return self._query("spotted_name = ?", (spotted_name,))
+
+    def iter_geokrety(self):
+        """
+        :return: Geokret generator, every stored Geokret
+        """
+        return self._query()
+
+    def get_meta(self, key, default=None):
+        """
+        :param key: String, metadata name
+        :param default: value returned when key is not set
+        :return: String, metadata value
+        """
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def set_meta(self, key, value):
+        """
+        :param key: String, metadata name
+        :param value: String, metadata value
+        :return: None
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, value))
+
+    def snapshot(self):
+        """
+        Listing fields of every stored Geokret, see SNAPSHOT_FIELDS.
+
+        :return: dict, gk_id => tuple of values
+        """
+        cursor = self.connection.execute(
+            "SELECT gk_id, %s FROM geokrety" % ', '.join(SNAPSHOT_FIELDS))
+        return dict((row[0], row[1:]) for row in cursor)
+
+    def __len__(self):
+        """
+        :return: int, stored Geokrety count
+        """
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM geokrety").fetchone()[0]
+
+    def _upsert_chunk(self, geokrety, merge=False):
+        """
+        Write Geokrety in one transaction.
+
+        :param geokrety: Geokret array
+        :param merge: Boolean, merge with the stored Geokrety
+        :return: int, Geokrety written
+        """
+        rows = []
+        updates = []
+        images = []
+        tracks = []
+        for geokret in geokrety:
+            rating = geokret.cache_rating or (None, None)
+            values = geokret.as_dict()
+            values['cache_rating_votes'] = rating[0]
+            values['cache_rating_score'] = rating[1]
+            for (field, column) in STORE_LIST_COLUMNS:
+                if values[field] is not None:
+                    values[column] = len(values[field])
+            rows.append(tuple(values.get(column)
+                              for column in STORE_COLUMNS))
+            if merge:
+                updates.append(tuple(
+                    values.get(column)
+                    if values.get(column) != GK_DEFAULTS.get(column)
+                    else None for column in STORE_COLUMNS[1:]) +
+                    (geokret.gk_id,))
+            for (position, url) in enumerate(geokret.images or ()):
+                images.append((geokret.gk_id, position, url))
+            for (position, (country, count)) in enumerate(
+                    geokret.country_track or ()):
+                tracks.append((geokret.gk_id, position, country, count))
+
+        # merged Geokrety keep the stored lists they do not have
+        image_ids = [(geokret.gk_id,) for geokret in geokrety
+                     if not merge or geokret.images is not None]
+        track_ids = [(geokret.gk_id,) for geokret in geokrety
+                     if not merge or geokret.country_track is not None]
+        insert = "INSERT OR %s INTO geokrety (%s) VALUES (%s)" % (
+            'IGNORE' if merge else 'REPLACE', ', '.join(STORE_COLUMNS),
+            ', '.join('?' * len(STORE_COLUMNS)))
+        with self.connection:
+            if merge:
+                self.connection.executemany(
+                    "UPDATE geokrety SET %s WHERE gk_id = ?" % ', '.join(
+                        '%s = COALESCE(?, %s)' % (column, column)
+                        for column in STORE_COLUMNS[1:]), updates)
+            self.connection.executemany(insert, rows)
+            self.connection.executemany(
+                "DELETE FROM geokret_images WHERE gk_id = ?", image_ids)
+            self.connection.executemany(
+                "DELETE FROM geokret_country_track WHERE gk_id = ?",
+                track_ids)
+            self.connection.executemany(
+                "INSERT INTO geokret_images (gk_id, position, url) "
+                "VALUES (?, ?, ?)", images)
+            self.connection.executemany(
+                "INSERT INTO geokret_country_track "
+                "(gk_id, position, country, count) VALUES (?, ?, ?, ?)",
+                tracks)
+        return len(rows)
+
+    def _query(self, where=None, params=()):
+        """
+        Stream Geokrety matching a condition, STORE_FETCH_SIZE at a time.
+
+        :param where: String, optional SQL condition on geokrety columns
+        :param params: tuple, condition parameters
+        :return: Geokret generator
+        """
+        sql = "SELECT %s FROM geokrety" % ', '.join(STORE_COLUMNS)
+        if where:
+            sql += " WHERE " + where
+        sql += " ORDER BY gk_id"
+
+        cursor = self.connection.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(STORE_FETCH_SIZE)
+            if not rows:
+                return
+            for geokret in self._load_geokrety(rows):
+                yield geokret
+
+    def _load_geokrety(self, rows):
+        """
+        Turn geokrety rows into Geokrety, with their child rows.
+
+        :param rows: list of geokrety table rows
+        :return: Geokret array
+        """
+        geokrety = []
+        by_id = {}
+        for row in rows:
+            values = dict(zip(STORE_COLUMNS, row))
+            rating = (values.pop('cache_rating_votes'),
+                      values.pop('cache_rating_score'))
+            if rating != (None, None):
+                values['cache_rating'] = rating
+            for (field, column) in STORE_LIST_COLUMNS:
+                if values.pop(column) is not None:
+                    values[field] = []
+            geokret = Geokret(**values)
+            geokrety.append(geokret)
+            by_id[geokret.gk_id] = geokret
+
+        marks = ', '.join('?' * len(by_id))
+        for (gk_id, url) in self.connection.execute(
+                "SELECT gk_id, url FROM geokret_images "
+                "WHERE gk_id IN (%s) ORDER BY gk_id, position" % marks,
+                by_id.keys()):
+            geokret = by_id[gk_id]
+            if geokret.images is None:
+                geokret.images = []
+            geokret.images.append(url)
+        for (gk_id, country, count) in self.connection.execute(
+                "SELECT gk_id, country, count FROM geokret_country_track "
+                "WHERE gk_id IN (%s) ORDER BY gk_id, position" % marks,
+                by_id.keys()):
+            geokret = by_id[gk_id]
+            if geokret.country_track is None:
+                geokret.country_track = []
+            geokret.country_track.append((country, count))
+        return geokrety
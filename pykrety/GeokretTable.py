@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar representation of a Geokrety inventory.
+
+Numeric fields are held in typed arrays, low cardinality text fields as
+integer codes into a categories list. Aggregates run over whole columns,
+with NumPy when it is installed and the array module otherwise. The other
+fields are kept as plain sequences, so a table converts back to Geokrety.
+"""
+
+import operator
+from array import array
+
+from Geokret import Geokret
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Integer columns => value stored when the field is not set, the null
+# flags tell it from a stored value
+TABLE_INT_COLUMNS = (
+    ("gk_id", 0),
+    ("ownerid", 0),
+    ("distance", 0),
+    ("cache_count", 0),
+    ("type", -1),
+)
+
+# Low cardinality text columns, stored as codes
+TABLE_CATEGORY_COLUMNS = (
+    "owner",
+    "state",
+    "spotted_type",
+    "spotted_country",
+)
+
+# Other fields, kept as sequences of values
+TABLE_TEXT_COLUMNS = (
+    "tracking_number",
+    "name",
+    "description",
+    "imagehi",
+    "datecreated",
+    "spotted_name",
+    "images",
+    "country_track",
+    "cache_rating",
+)
+
+# array typecodes
+INT_TYPECODE = 'l'
+CODE_TYPECODE = 'i'
+NULL_TYPECODE = 'B'
+
+
+def _int(value, missing):
+    """
+    :param value: field value, may be a numeric string or None
+    :param missing: int, value used when not convertible
+    :return: int
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return missing
+
+
+class GeokretTable(object):
+    """
+    Columnar inventory, see GeokretTable.from_geokrety()
+
+    column(name) returns a NumPy array (or array.array) of integers, codes
+    for category columns. categories[name] lists the values of those codes.
+    nulls[name] flags, with 1, the unset values of integer columns, stored
+    as their TABLE_INT_COLUMNS value. texts[name] holds the values of the
+    other columns.
+
+    A table may hold only some columns, see read_columnar(). A table read
+    from a file maps it until closed:
+
+        with read_columnar('/tmp/pykrety-out.gkc') as table:
+            print table.sum('distance')
+    """
+    columns = None
+    categories = None
+    texts = None
+    nulls = None
+    buffer = None
+    size = 0
+
+    def __init__(self, columns, categories, size, texts=None, nulls=None,
+                 buffer=None):
+        """
+        :param columns: dict, column name => typed array
+        :param categories: dict, category column name => values list
+        :param size: int, rows count
+        :param texts: dict, other column name => values sequence
+        :param nulls: dict, integer column name => null flags typed array
+        :param buffer: mmap, optional file the columns are read from
+        :return: None
+        """
+        self.columns = columns
+        self.categories = categories
+        self.size = size
+        self.texts = texts or {}
+        self.nulls = nulls or {}
+        self.buffer = buffer
+
+    def close(self):
+        """
+        Unmap the file of a table read by read_columnar(). Neither the
+        table nor arrays taken from its columns may be used afterwards.
+
+        :return: None
+        """
+        if self.buffer is not None:
+            self.columns = {}
+            self.texts = {}
+            self.nulls = {}
+            self.buffer.close()
+            self.buffer = None
+
+    def __enter__(self):
+        """
+        :return: GeokretTable, self
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        :return: None
+        """
+        self.close()
+
+    @classmethod
+    def from_geokrety(cls, geokrety):
+        """
+        Build a table in one pass over Geokrety, a list or a parser stream.
+
+        :param geokrety: iterable of Geokret
+        :return: GeokretTable
+        """
+        columns = dict((name, array(INT_TYPECODE))
+                       for (name, _) in TABLE_INT_COLUMNS)
+        nulls = dict((name, array(NULL_TYPECODE))
+                     for (name, _) in TABLE_INT_COLUMNS)
+        columns.update((name, array(CODE_TYPECODE))
+                       for name in TABLE_CATEGORY_COLUMNS)
+        categories = dict((name, []) for name in TABLE_CATEGORY_COLUMNS)
+        lookups = dict((name, {}) for name in TABLE_CATEGORY_COLUMNS)
+        texts = dict((name, []) for name in TABLE_TEXT_COLUMNS)
+
+        size = 0
+        for geokret in geokrety:
+            for (name, missing) in TABLE_INT_COLUMNS:
+                value = getattr(geokret, name)
+                nulls[name].append(value is None)
+                columns[name].append(_int(value, missing))
+            for name in TABLE_CATEGORY_COLUMNS:
+                value = getattr(geokret, name)
+                lookup = lookups[name]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(categories[name])
+                    categories[name].append(value)
+                columns[name].append(code)
+            for name in TABLE_TEXT_COLUMNS:
+                texts[name].append(getattr(geokret, name))
+            size += 1
+
+        if numpy is not None:
+            columns = dict((name, numpy.array(values, dtype=values.typecode))
+                           for (name, values) in columns.iteritems())
+            nulls = dict((name, numpy.array(values, dtype=values.typecode))
+                         for (name, values) in nulls.iteritems())
+        return cls(columns, categories, size, texts, nulls)
+
+    def __len__(self):
+        """
+        :return: int, rows count
+        """
+        return self.size
+
+    def column(self, name):
+        """
+        :param name: String, column name
+        :return: typed array
+        """
+        return self.columns[name]
+
+    def values(self, name):
+        """
+        Decoded values of a column.
+
+        :param name: String, column name
+        :return: list
+        """
+        if name in self.texts:
+            return list(self.texts[name])
+        if name in self.categories:
+            categories = self.categories[name]
+            return [categories[code] for code in self.columns[name]]
+        return list(self.columns[name])
+
+    def mask(self, name, value, compare=operator.eq):
+        """
+        Rows where compare(column value, value) is true, with NumPy or the
+        array module alike. Category columns compare their values.
+
+            table.mask('distance', 1000, operator.gt)
+
+        :param name: String, column name
+        :param value: the value to compare with
+        :param compare: callable, a comparison of the operator module,
+            equality by default
+        :return: booleans, typed array
+        """
+        column = self.columns[name]
+        if name in self.categories:
+            if compare is operator.eq:
+                try:
+                    value = self.categories[name].index(value)
+                except ValueError:
+                    value = -1
+            else:
+                column = self.values(name)
+                return [compare(item, value) for item in column]
+        if numpy is not None:
+            return compare(column, value)
+        return [compare(item, value) for item in column]
+
+    def filter(self, mask):
+        """
+        Keep the rows where mask is true.
+
+        :param mask: booleans, one per row, see mask()
+        :return: GeokretTable
+        """
+        if numpy is not None:
+            return self.take(numpy.flatnonzero(numpy.asarray(mask)))
+        return self.take([i for (i, keep) in enumerate(mask) if keep])
+
+    def sort(self, name, reverse=False):
+        """
+        Rows ordered by a column. Category columns are ordered by value.
+
+        :param name: String, column name
+        :param reverse: Boolean, descending order
+        :return: GeokretTable
+        """
+        if name in self.categories:
+            keys = self._category_ranks(name)
+        else:
+            keys = self.columns[name]
+
+        if numpy is not None:
+            order = numpy.argsort(keys, kind='mergesort')
+            if reverse:
+                order = order[::-1]
+        else:
+            order = sorted(xrange(self.size), key=keys.__getitem__,
+                           reverse=reverse)
+        return self.take(order)
+
+    def take(self, indices):
+        """
+        Rows at indices, in that order.
+
+        :param indices: sequence of int
+        :return: GeokretTable
+        """
+        if numpy is not None:
+            (columns, nulls) = [
+                dict((name, values[indices])
+                     for (name, values) in arrays.iteritems())
+                for arrays in (self.columns, self.nulls)]
+        else:
+            (columns, nulls) = [
+                dict((name, array(values.typecode,
+                                  [values[i] for i in indices]))
+                     for (name, values) in arrays.iteritems())
+                for arrays in (self.columns, self.nulls)]
+        texts = dict((name, [values[i] for i in indices])
+                     for (name, values) in self.texts.iteritems())
+        return GeokretTable(columns, self.categories, len(indices), texts,
+                            nulls)
+
+    def to_geokrety(self):
+        """
+        Turn rows back into Geokrety. Integers flagged as null, or
+        negative, which stand for unset fields, are restored as None.
+
+        :return: Geokret generator
+        """
+        names = []
+        columns = []
+        for (name, column) in self.columns.iteritems():
+            if name in self.categories:
+                labels = self.categories[name]
+                column = [labels[code] for code in column.tolist()]
+            elif name in self.nulls:
+                column = [value if value >= 0 and not null else None
+                          for (value, null) in zip(
+                              column.tolist(), self.nulls[name].tolist())]
+            else:
+                column = [value if value >= 0 else None
+                          for value in column.tolist()]
+            names.append(name)
+            columns.append(column)
+        for (name, column) in self.texts.iteritems():
+            names.append(name)
+            columns.append(list(column))
+
+        for values in zip(*columns):
+            yield Geokret(**dict((name, value)
+                                 for (name, value) in zip(names, values)
+                                 if value is not None))
+
+    def sum(self, name):
+        """
+        :param name: String, integer column name
+        :return: int
+        """
+        if numpy is not None:
+            return int(self.columns[name].sum())
+        return sum(self.columns[name])
+
+    def group_by(self, key, name=None, aggregate='count'):
+        """
+        Aggregate a column by the values of another one.
+
+        :param key: String, grouping column name
+        :param name: String, aggregated integer column, not needed to count
+        :param aggregate: String, 'count', 'sum' or 'mean'
+        :return: dict, key value => aggregate
+        """
+        if key in self.categories:
+            labels = self.categories[key]
+            codes = self.columns[key]
+        elif numpy is not None:
+            (labels, codes) = numpy.unique(self.columns[key],
+                                           return_inverse=True)
+            labels = [int(label) for label in labels]
+        else:
+            labels = sorted(set(self.columns[key]))
+            positions = dict((label, i) for (i, label) in enumerate(labels))
+            codes = [positions[value] for value in self.columns[key]]
+
+        groups = len(labels)
+        if numpy is not None:
+            counts = numpy.bincount(codes, minlength=groups)
+            if aggregate != 'count':
+                sums = numpy.bincount(codes, weights=self.columns[name],
+                                      minlength=groups)
+        else:
+            counts = [0] * groups
+            for code in codes:
+                counts[code] += 1
+            if aggregate != 'count':
+                sums = [0] * groups
+                for (code, value) in zip(codes, self.columns[name]):
+                    sums[code] += value
+
+        result = {}
+        for (code, label) in enumerate(labels):
+            count = int(counts[code])
+            if not count:
+                continue
+            if aggregate == 'count':
+                result[label] = count
+            elif aggregate == 'sum':
+                result[label] = int(sums[code])
+            elif aggregate == 'mean':
+                result[label] = float(sums[code]) / count
+            else:
+                raise ValueError("unknown aggregate %s" % aggregate)
+        return result
+
+    def _category_ranks(self, name):
+        """
+        Codes of a category column replaced by the rank of their value.
+
+        :param name: String, category column name
+        :return: typed array
+        """
+        categories = self.categories[name]
+        ranks = [0] * len(categories)
+        for (rank, code) in enumerate(sorted(xrange(len(categories)),
+                                             key=categories.__getitem__)):
+            ranks[code] = rank
+        if numpy is not None:
+            return numpy.array(ranks, dtype=CODE_TYPECODE)[self.columns[name]]
+        return [ranks[code] for code in self.columns[name]]
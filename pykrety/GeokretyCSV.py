@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+CSV import/export of Geokrety.
+
+Geokrety are written and read one chunk at a time, so exports of any size
+run in constant memory. List fields are stored as JSON, integer fields are
+restored as integers, and filenames ending with .gz are gzip compressed.
+
+Files of previous releases, which wrote list fields as Python literals and
+unset ones as empty cells, are read as well.
+"""
+
+import ast
+import csv
+import gzip
+import json
+
+from Geokret import Geokret, GK_CVS_COLUMNS
+
+# Rows written per call to the csv writer
+CSV_CHUNK_SIZE = 1000
+
+CSV_DELIMITER = ';'
+
+# Written for unset fields, telling them from empty strings
+CSV_NULL = '\\N'
+
+# Fields stored as JSON
+CSV_JSON_FIELDS = ('images', 'country_track', 'cache_rating')
+
+# Fields restored as integers, when numeric
+CSV_INT_FIELDS = ('gk_id', 'ownerid', 'distance', 'cache_count', 'type')
+
+
+def open_csv(filename, mode='rb'):
+    """
+    :param filename: String, csv file, gzip compressed if ending with .gz
+    :param mode: String, 'rb' or 'wb'
+    :return: file object
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+
+def encode_json_field(value):
+    """
+    :param value: list or tuple field value
+    :return: String, compact JSON
+    """
+    return json.dumps(value, separators=(',', ':'))
+
+
+def decode_json_field(name, value):
+    """
+    :param name: String, field name, one of CSV_JSON_FIELDS
+    :param value: String, JSON, or a Python literal of previous releases
+    :return: field value, tuples restored, None for an empty cell
+    """
+    if not value.strip():
+        return None
+    try:
+        value = json.loads(value)
+    except ValueError:
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise ValueError("%s: cannot decode %r" % (name, value))
+    if value is None:
+        return None
+    if name == 'cache_rating':
+        value = tuple(value)
+    elif name == 'country_track':
+        value = [tuple(track) for track in value]
+    return value
+
+
+def write_csv(geokrety, filename, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Export Geokrety as CSV.
+
+    :param geokrety: iterable of Geokret, a list or a parser stream
+    :param filename: String, output csv filename
+    :param chunk_size: int, rows written at once
+    :return: int, Geokrety written
+    """
+    count = 0
+    with open_csv(filename, 'wb') as csvfile:
+        writer = csv.writer(csvfile, delimiter=CSV_DELIMITER)
+        writer.writerow(GK_CVS_COLUMNS)
+        rows = []
+        for geokret in geokrety:
+            rows.append(_encode_row(geokret))
+            if len(rows) >= chunk_size:
+                writer.writerows(rows)
+                count += len(rows)
+                rows = []
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def iter_csv(filename):
+    """
+    Import Geokrety from CSV, one at a time.
+
+    Columns which are not Geokret fields, like notes added in a
+    spreadsheet, are skipped.
+
+    :param filename: String, input csv filename
+    :return: Geokret generator
+    """
+    with open_csv(filename, 'rb') as csvfile:
+        reader = csv.reader(csvfile, delimiter=CSV_DELIMITER)
+        columns = [name if name in GK_CVS_COLUMNS else None
+                   for name in reader.next()]
+        for row in reader:
+            yield _decode_row(columns, row)
+
+
+def _encode_row(geokret):
+    """
+    :param geokret: Geokret
+    :return: list of utf-8 strings, in GK_CVS_COLUMNS order
+    """
+    row = []
+    for name in GK_CVS_COLUMNS:
+        value = getattr(geokret, name)
+        if value is None:
+            value = CSV_NULL
+        elif name in CSV_JSON_FIELDS:
+            value = encode_json_field(value)
+        elif isinstance(value, unicode):
+            value = value.encode('utf-8')
+        else:
+            value = str(value)
+        row.append(value)
+    return row
+
+
+def _decode_row(columns, row):
+    """
+    :param columns: list of String, header row, None for skipped columns
+    :param row: list of utf-8 strings
+    :return: Geokret
+    """
+    values = {}
+    for (name, value) in zip(columns, row):
+        if name is None or value == CSV_NULL:
+            continue
+        if name in CSV_JSON_FIELDS:
+            value = decode_json_field(name, value)
+        elif name in CSV_INT_FIELDS and value.isdigit():
+            value = int(value)
+        else:
+            value = value.decode('utf-8')
+        values[name] = value
+    return Geokret(**values)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of parsed Geokrety.org responses.
+
+Entries keep the parsed result together with the response validators
+(ETag, Last-Modified), so a stale entry can be revalidated with a
+conditional request instead of being downloaded and parsed again.
+"""
+
+import cPickle
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Default number of entries kept in memory
+CACHE_MAXSIZE = 256
+
+# Default seconds an entry is used without asking the server
+CACHE_TTL = 60
+
+
+class CacheEntry(object):
+    """
+    A parsed response and its validators.
+    """
+    __slots__ = ('etag', 'last_modified', 'expires', 'data')
+
+    def __init__(self, etag=None, last_modified=None, expires=0, data=None):
+        """
+        :param etag: String, ETag response header
+        :param last_modified: String, Last-Modified response header
+        :param expires: float, timestamp until which no request is needed
+        :param data: String, pickled parsed result
+        :return: None
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.data = data
+
+    def fresh(self):
+        """
+        :return: Boolean, True if usable without asking the server
+        """
+        return time.time() < self.expires
+
+    def value(self):
+        """
+        :return: a private copy of the parsed result
+        """
+        return cPickle.loads(self.data)
+
+    def validators(self):
+        """
+        :return: dict, conditional request headers
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def __getstate__(self):
+        """
+        :return: tuple, pickled state
+        """
+        return (self.etag, self.last_modified, self.expires, self.data)
+
+    def __setstate__(self, state):
+        """
+        :param state: tuple, pickled state
+        :return: None
+        """
+        (self.etag, self.last_modified, self.expires, self.data) = state
+
+
+class GeokretyCache(object):
+    """
+    In memory LRU cache of parsed responses, optionally backed by a
+    directory on disk. Thread safe.
+
+    Counters: hits (served without request), revalidations (served after
+    a 304 Not Modified), misses (downloaded and parsed).
+    """
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL, directory=None):
+        """
+        :param maxsize: int, entries kept in memory
+        :param ttl: int, seconds an entry is used without asking the server
+        :param directory: String, optional on disk store
+        :return: None
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, key):
+        """
+        Lookup an entry, fresh or stale.
+
+        :param key: String
+        :return: CacheEntry or None
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+                return entry
+
+        entry = self._load(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, value, etag=None, last_modified=None):
+        """
+        Store a parsed result.
+
+        :param key: String
+        :param value: the parsed result
+        :param etag: String, ETag response header
+        :param last_modified: String, Last-Modified response header
+        :return: None
+        """
+        entry = CacheEntry(etag, last_modified, time.time() + self.ttl,
+                           cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        self._remember(key, entry)
+        self._save(key, entry)
+
+    def refresh(self, key, entry):
+        """
+        Extend a revalidated entry for another ttl.
+
+        :param key: String
+        :param entry: CacheEntry
+        :return: None
+        """
+        entry.expires = time.time() + self.ttl
+        self._save(key, entry)
+
+    def evict(self, key):
+        """
+        Drop an entry, from memory and disk, once the page it holds is
+        known to have changed.
+
+        :param key: String
+        :return: Boolean, True if an entry was dropped
+        """
+        with self.lock:
+            found = self.entries.pop(key, None) is not None
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+                found = True
+            except OSError:
+                pass
+        return found
+
+    def clear(self):
+        """
+        Drop every entry, from memory and disk.
+
+        :return: None
+        """
+        with self.lock:
+            self.entries.clear()
+        if self.directory:
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.cache'):
+                    os.remove(os.path.join(self.directory, filename))
+
+    def count(self, counter):
+        """
+        Increment one of the hits, misses or revalidations counters.
+
+        :param counter: String, counter name
+        :return: None
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        :return: dict, counters and size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'size': len(self.entries),
+        }
+
+    def _remember(self, key, entry):
+        """
+        Keep entry in memory, evicting the least recently used ones.
+
+        :param key: String
+        :param entry: CacheEntry
+        :return: None
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def _path(self, key):
+        """
+        :param key: String
+        :return: String, entry file on disk
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(self.directory,
+                            hashlib.sha1(key).hexdigest() + '.cache')
+
+    def _load(self, key):
+        """
+        :param key: String
+        :return: CacheEntry or None
+        """
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as handle:
+                return cPickle.load(handle)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return None
+
+    def _save(self, key, entry):
+        """
+        :param key: String
+        :param entry: CacheEntry
+        :return: None
+        """
+        if not self.directory:
+            return
+        path = self._path(key)
+        temporary = '%s.%d.%d' % (path, os.getpid(),
+                                  threading.current_thread().ident)
+        with open(temporary, 'wb') as handle:
+            cPickle.dump(entry, handle, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, path)
@@ -6,20 +6,111 @@ Abstraction around Geokrety.org.
 It try to parse pages to extract values.
 """
 
+import hashlib
+import HTMLParser
 import os
-import csv
+import string
+import threading
+import time
 import requests
-import urllib
-import urllib2
 import urlparse
-
-from Geokret import Geokret, GK_CVS_COLUMNS
-from parsers.GeokretyHTMLHandler import parse_html_owned, parse_html_geokret
-from parsers.GeokretyXMLHandler import parse_xml_stream
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from GeokretColumnar import read_columnar, write_columnar
+from GeokretyCSV import iter_csv, write_csv
+from Geokret import Geokret, GK_EDITABLE_FIELDS
+from GeokretStore import SNAPSHOT_FIELDS, STORE_CHUNK_SIZE
+from GeokretyJournal import journal_keys, JOURNAL_DONE, JOURNAL_FAILED, \
+    JOURNAL_PENDING, JOURNAL_UNKNOWN, JOURNAL_UNSETTLED
+from GeokretyMetrics import ParseEvent
+from GeokretyMirror import MirrorManifest, MIRROR_BLOCK_SIZE, \
+    MIRROR_DOWNLOADED, MIRROR_LINKED, MIRROR_MANIFEST, MIRROR_RESUMED, \
+    MIRROR_SKIPPED
+from GeokretyThrottle import RateLimiter, request_sent
+from GeokretyTransport import GeokretyTransport
+from GeokretyUpload import MultipartStream, file_digest, image_content_type, \
+    UPLOAD_SKIPPED, UPLOAD_UPLOADED
+from parsers.GeokretyHTMLHandler import iter_html_owned, parse_html_geokret, \
+    parse_html_owned_pages
+from parsers.GeokretyXMLHandler import iter_xml_stream, parse_xml_stream
 
 
 URL = "https://geokrety.org"
 
+# Default number of concurrent requests for bulk operations
+BULK_MAX_WORKERS = 8
+
+# export2.php modifiedsince parameter format, UTC
+MODIFIED_SINCE_FORMAT = '%Y%m%d%H%M%S'
+
+# GeokretStore metadata holding the last export2.php poll time
+MODIFIED_SINCE_KEY = 'export2.modifiedsince'
+
+# Seconds polls overlap, absorbing clock differences with the server
+MODIFIED_SINCE_OVERLAP = 60
+
+# Largest share of the stored Geokrety an inventory sync may remove
+SYNC_MAX_REMOVED = 0.5
+
+# update_geokret_web results
+UPDATE_UPDATED = 'updated'
+UPDATE_SKIPPED = 'skipped'
+
+
+def response_text(response):
+    """
+    Decode a response body. Geokrety.org serves utf-8, this avoids the
+    costly charset detection when no charset is announced.
+
+    :param response: requests.Response
+    :return: unicode
+    """
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    return response.text
+
+
+class GeokretyConnectorError(Exception):
+    """
+    Geokrety.org did not fulfil a request.
+    """
+
+
+class GeokretyOutcomeUnknownError(GeokretyConnectorError):
+    """
+    A request failed after it may have reached Geokrety.org, which may
+    have applied it, like on a read timeout or a 502 response.
+    """
+
+
+class BulkResult(namedtuple('BulkResult', ['job', 'result', 'error'])):
+    """
+    Outcome of one job of a bulk operation.
+
+    job is the item given by the caller, result its value on success and
+    error the exception raised on failure.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """
+        :return: Boolean, True if the job succeeded
+        """
+        return self.error is None
+
+
+class SyncReport(namedtuple('SyncReport',
+                            ['added', 'changed', 'removed', 'failed'])):
+    """
+    Outcome of an inventory synchronisation, sets of Geokrety IDs.
+
+    failed holds the added or changed Geokrety whose details could not be
+    retrieved, they are left untouched in the store.
+    """
+    __slots__ = ()
+
 
 def format_filename(s):
     """
@@ -40,31 +131,122 @@ def format_filename(s):
     return filename
 
 
+def _url_filename(url):
+    """
+    :param url: String
+    :return: String, a safe local file name for url
+    """
+    return format_filename(os.path.basename(urlparse.urlsplit(url).path))
+
+
+def _details_path(gk_id):
+    """
+    :param gk_id: int, Geokret ID
+    :return: String, path of the Geokret details page
+    """
+    return '/konkret.php?id=%d&page=0' % int(gk_id)
+
+
+def _inventory_path(page, user_id=None):
+    """
+    :param page: int, page number, starting at 1
+    :param user_id: int, optional, default to connected user
+    :return: String, path of an inventory page
+    """
+    path = '/mypage.php?co=1&page=%d' % int(page)
+    if user_id:
+        path += '&userid=%d' % int(user_id)
+    return path
+
+
+def _export_path(secid):
+    """
+    :param secid: String, API key
+    :return: String, path of the API inventory export
+    """
+    return '/export2.php?secid=%s&inventory=1' % secid
+
+
+def _loaded(geokrety):
+    """
+    Mark Geokrety just loaded from Geokrety.org as clean.
+
+    :param geokrety: iterable of Geokret
+    :return: Geokret array
+    """
+    geokrety = list(geokrety)
+    for geokret in geokrety:
+        geokret.mark_clean()
+    return geokrety
+
+
+def _same_text(first, second):
+    """
+    Compare texts as typed and as parsed from html, whose entities may be
+    left escaped.
+
+    :param first: String or None
+    :param second: String or None
+    :return: Boolean
+    """
+    unescape = HTMLParser.HTMLParser().unescape
+    return (unescape(first or u'').strip() ==
+            unescape(second or u'').strip())
+
+
+def _merge_listing(geokret, listed):
+    """
+    Complete a Geokret from its details page with the inventory listing,
+    which alone knows the tracking number and last spotted place.
+
+    :param geokret: Geokret, from the details page
+    :param listed: Geokret, from the inventory listing
+    :return: Geokret, geokret completed
+    """
+    for (name, value) in listed.as_dict().iteritems():
+        if value is not None and getattr(geokret, name) is None:
+            setattr(geokret, name, value)
+    for name in SNAPSHOT_FIELDS:
+        setattr(geokret, name, getattr(listed, name))
+    return geokret
+
+
 class GeokretyConnector(object):
     """
     Connector for geokrety.org.
 
     When retrieving multiple items, they will be stored in self.inventory
     """
-    credentials = {'login': None, 'password': None}
+    credentials = None
+    url = URL
     secid = None
     cookie = None
     inventory = []
     session = None
+    transport = None
+    cache = None
     connected = False
 
-    def __init__(self, login, password):
+    def __init__(self, login, password, url=URL, cache=None, transport=None):
         """
         Initialize the connector. Need credentials from Geokrety.org
 
         :param login: string
         :param password: string
+        :param url: string, optional Geokrety.org base url
+        :param cache: GeokretyCache, optional cache of parsed pages
+        :param transport: GeokretyTransport, optional, to tune connections
+            or share them between connectors
         :return: None
         """
-        self.session = requests.session()
+        self.transport = transport or GeokretyTransport()
+        # cookies of its own, over the connections of a shared transport
+        self.session = self.transport.new_session()
+        self.url = url.rstrip('/')
+        self.cache = cache
+        self.inventory = []
 
-        self.credentials['login'] = login
-        self.credentials['password'] = password
+        self.credentials = {'login': login, 'password': password}
 
     def connect_api(self):
         """
@@ -73,12 +255,12 @@ class GeokretyConnector(object):
         :return: None
         """
         path = "/api-login2secid.php"
-        data = urllib.urlencode(self.credentials)
 
-        req = urllib2.Request(URL + path, data)
-        response = urllib2.urlopen(req)
-        if response.getcode() == requests.codes.ok:
-            self.secid = response.read().rstrip('\n\r ')
+        response = self.transport.post(self.url + path,
+                                       data=self.credentials,
+                                       session=self.session)
+        if response.status_code == requests.codes.ok:
+            self.secid = response.content.rstrip('\n\r ')
         else:
             print 'E: Cannot connect'
 
@@ -96,9 +278,9 @@ class GeokretyConnector(object):
             'remember': '1',
         }
 
-        response = self.session.post(
-            URL + path, data=params, verify=False,
-            allow_redirects=False)
+        response = self.transport.post(
+            self.url + path, data=params, allow_redirects=False,
+            session=self.session)
 
         if response.status_code == requests.codes.found:
             # print response.text
@@ -114,36 +296,214 @@ class GeokretyConnector(object):
         """
         Retrieve the user inventory via API call.
 
-        :return: None
+        :return: Geokret array
         """
         if self.secid is None:
             print 'E: Must be connected'
             return
 
-        path = '/export2.php?secid=%s&inventory=1' % self.secid
-        self.inventory = parse_xml_stream(URL + path)
+        path = _export_path(self.secid)
+        self.inventory = self._get_parsed(
+            path, lambda response: _loaded(parse_xml_stream(response.raw)),
+            'parse_xml_stream', stream=True)
+        return self.inventory
 
-    def get_inventory_web(self, user_id=None):
+    def get_geokrety_modified_since(self, timestamp=None, store=None):
+        """
+        Retrieve the user inventory Geokrety modified since timestamp,
+        via API call. The export is parsed while it is downloaded.
+
+        With a store, timestamp defaults to the previous poll time and the
+        Geokrety are merged into it as they are parsed: the fields the
+        export lacks, like the tracking number, keep their stored value.
+        Once the export is fully read, the poll time is recorded as the
+        next high-water mark.
+
+        :param timestamp: float, optional unix time
+        :param store: GeokretStore, optional
+        :return: Geokret generator
+        """
+        if self.secid is None:
+            raise GeokretyConnectorError('Must be connected')
+
+        if timestamp is None and store is not None:
+            timestamp = store.get_meta(MODIFIED_SINCE_KEY)
+        if timestamp is None:
+            timestamp = 0
+        started = time.time()
+
+        path = '/export2.php?secid=%s&inventory=1&modifiedsince=%s' % (
+            self.secid, time.strftime(
+                MODIFIED_SINCE_FORMAT,
+                time.gmtime(max(0, float(timestamp) -
+                                MODIFIED_SINCE_OVERLAP))))
+        response = self.transport.stream(self.url + path,
+                                         allow_redirects=False,
+                                         session=self.session)
+        if response.status_code != requests.codes.ok:
+            response.close()
+            raise GeokretyConnectorError(
+                "%s: HTTP %d" % (path, response.status_code))
+
+        chunk = []
+        geokrety = iter_xml_stream(response.raw)
+        parsing = 0.0
+        try:
+            while True:
+                start = time.time()
+                geokret = next(geokrety, None)
+                parsing += time.time() - start
+                if geokret is None:
+                    break
+                geokret.mark_clean()
+                if store is not None:
+                    chunk.append(geokret)
+                    if len(chunk) >= STORE_CHUNK_SIZE:
+                        store.upsert(chunk, merge=True)
+                        chunk = []
+                yield geokret
+        finally:
+            response.close()
+            # the parser reads the socket, leave the transfer out
+            self.transport.dispatch('parse', ParseEvent(
+                self.url + path, 'iter_xml_stream',
+                max(0.0, parsing - response.meter.seconds)))
+
+        if store is not None:
+            store.upsert(chunk, merge=True)
+            store.set_meta(MODIFIED_SINCE_KEY, repr(started))
+
+    def get_inventory_web(self, user_id=None, max_workers=BULK_MAX_WORKERS):
         """
         Retrieve inventory for user_id.
         Parse the Web pages.
 
         :param user_id: int, optional, default to connected user
-        :return: None
+        :param max_workers: int, maximum pages fetched concurrently
+        :return: Geokret array
         """
-        path = '/mypage.php?co=1&page=0'
-        if user_id:
-            path += '&userid=%d' % int(user_id)
+        try:
+            self.inventory = list(self.iter_inventory_web(user_id,
+                                                          max_workers))
+        except GeokretyConnectorError:
+            print 'E: Failed to retrieve Geokrety inventory'
+            return
 
-        response = self.session.get(
-            URL + path, verify=False,
-            allow_redirects=False)
+        print 'I: Geokrety inventory retrieved'
+        return self.inventory
 
-        if response.status_code == requests.codes.ok:
-            self.inventory = parse_html_owned(response.text)
-            print 'I: Geokrety inventory retrieved'
-        else:
-            print 'E: Failed to retrieve Geokrety inventory'
+    def iter_inventory_web(self, user_id=None, max_workers=BULK_MAX_WORKERS,
+                           cached=True):
+        """
+        Retrieve inventory for user_id, page by page.
+        Parse the Web pages.
+
+        The first page tells how many pages there are, the others are then
+        fetched concurrently. Geokrety are yielded in page order.
+
+        :param user_id: int, optional, default to connected user
+        :param max_workers: int, maximum pages fetched concurrently
+        :param cached: Boolean, False to ignore the cached pages
+        :return: Geokret generator
+        """
+        (pages, geokrety) = self._fetch_inventory_page(1, user_id, True,
+                                                       cached)
+        for geokret in geokrety:
+            yield geokret
+
+        if pages < 2:
+            return
+
+        self._grow_connection_pool(max_workers)
+        pool = ThreadPool(min(max_workers, pages - 1))
+        try:
+            for geokrety in pool.imap(
+                    lambda page: self._fetch_inventory_page(
+                        page, user_id, cached=cached),
+                    xrange(2, pages + 1)):
+                for geokret in geokrety:
+                    yield geokret
+        finally:
+            pool.terminate()
+
+    def _fetch_inventory_page(self, page, user_id=None, count_pages=False,
+                              cached=True):
+        """
+        Retrieve and parse one page of an inventory.
+
+        :param page: int, page number, starting at 1
+        :param user_id: int, optional, default to connected user
+        :param count_pages: Boolean, also return the pages count
+        :param cached: Boolean, False to ignore the cached page
+        :return: Geokret array, or (int, Geokret array) with count_pages
+        """
+        path = _inventory_path(page, user_id)
+
+        def parse(response):
+            html = response_text(response)
+            geokrety = _loaded(iter_html_owned(html))
+            if count_pages:
+                return (parse_html_owned_pages(html), geokrety)
+            return geokrety
+
+        return self._get_parsed(path, parse, 'iter_html_owned',
+                                cached=cached)
+
+    def sync_inventory_web(self, store, user_id=None,
+                           max_workers=BULK_MAX_WORKERS, rate=None,
+                           max_removed=SYNC_MAX_REMOVED):
+        """
+        Bring a GeokretStore up to date with an inventory.
+        Parse the Web pages.
+
+        The inventory listing is compared with the stored Geokrety on
+        SNAPSHOT_FIELDS, details pages are only retrieved for new or
+        changed Geokrety. Geokrety missing from the listing are removed.
+
+        An empty listing, as served to an expired session, or one missing
+        more than max_removed of the stored Geokrety is not trusted:
+        nothing is changed and GeokretyConnectorError is raised.
+
+        :param store: GeokretStore
+        :param user_id: int, optional, default to connected user
+        :param max_workers: int, maximum concurrent requests
+        :param rate: float, optional maximum details requests per second
+        :param max_removed: float, largest share of the stored Geokrety
+            removed, 1.0 to allow any
+        :return: SyncReport
+        """
+        listing = dict((geokret.gk_id, geokret) for geokret in
+                       self.iter_inventory_web(user_id, max_workers))
+        snapshot = store.snapshot()
+
+        added = set(listing) - set(snapshot)
+        changed = set(
+            gk_id for (gk_id, values) in snapshot.iteritems()
+            if gk_id in listing and values != tuple(
+                getattr(listing[gk_id], name) for name in SNAPSHOT_FIELDS))
+        removed = set(snapshot) - set(listing)
+        failed = set()
+
+        if snapshot and not listing:
+            raise GeokretyConnectorError(
+                "inventory listing is empty, %d stored Geokrety kept"
+                % len(snapshot))
+        if len(removed) > max_removed * len(snapshot):
+            raise GeokretyConnectorError(
+                "%d of %d stored Geokrety missing from the listing, "
+                "over the max_removed share" % (len(removed), len(snapshot)))
+
+        def merged():
+            for result in self.get_geokrety_details_web(
+                    added | changed, max_workers, rate):
+                if not result.ok:
+                    failed.add(result.job)
+                    continue
+                yield _merge_listing(result.result, listing[result.job])
+
+        store.upsert(merged())
+        store.delete(removed)
+        return SyncReport(added - failed, changed - failed, removed, failed)
 
     def get_geokret_details_web(self, gk_id):
         """
@@ -151,30 +511,189 @@ class GeokretyConnector(object):
         Parse the Web pages.
 
         :param gk_id: int, Geokret ID
-        :return: None
+        :return: The Geokret
+        """
+        try:
+            geokret = self._fetch_geokret_details(gk_id)
+        except GeokretyConnectorError:
+            print 'E: Failed to retrieve Geokret details'
+            return
+
+        print 'I: Geokret details retrieved'
+        return geokret
+
+    def get_geokrety_details_web(self, ids, max_workers=BULK_MAX_WORKERS,
+                                 rate=None):
         """
-        path = '/konkret.php?id=%d&page=0' % gk_id
+        Retrieve full details for many Geokrety, concurrently.
+        Parse the Web pages.
 
-        response = self.session.get(
-            URL + path, verify=False,
-            allow_redirects=False)
+        Results are yielded as soon as they are parsed, in completion order.
 
-        if response.status_code == requests.codes.ok:
-            print 'I: Geokret details retrieved'
-            return parse_html_geokret(response.text)
+        :param ids: iterable of int, Geokrety IDs
+        :param max_workers: int, maximum concurrent requests
+        :param rate: float, optional maximum requests per second
+        :return: BulkResult generator, job is the Geokret ID
+        """
+        return self._bulk(self._fetch_geokret_details, ids,
+                          max_workers, rate)
+
+    def _fetch_geokret_details(self, gk_id, cached=True):
+        """
+        Retrieve and parse a Geokret details page.
+
+        :param gk_id: int, Geokret ID
+        :param cached: Boolean, False to ignore the cached page
+        :return: The Geokret
+        """
+        path = _details_path(gk_id)
+
+        return self._get_parsed(
+            path, lambda response: _loaded([parse_html_geokret(
+                response_text(response))])[0], 'parse_html_geokret',
+            cached=cached)
+
+    def _cache_key(self, path):
+        """
+        :param path: String, path relative to the connector url
+        :return: String, cache key of the page, per user
+        """
+        return '%s %s%s' % (self.credentials['login'], self.url, path)
+
+    def _evict_written(self, gk_id):
+        """
+        Drop the cached pages a write to a Geokret changed: its details
+        page, the connected user inventory pages and API export.
+
+        :param gk_id: int, Geokret ID
+        :return: None
+        """
+        if self.cache is None:
+            return
+        self.cache.evict(self._cache_key(_details_path(gk_id)))
+        if self.secid is not None:
+            self.cache.evict(self._cache_key(_export_path(self.secid)))
+        # pages are cached from the first one on, stop at the first missing
+        page = 1
+        while self.cache.evict(self._cache_key(_inventory_path(page))):
+            page += 1
+
+    def _get_parsed(self, path, parse, parser, stream=False, cached=True):
+        """
+        GET a page and parse it.
+
+        With a cache, a fresh entry is returned without any request, and a
+        stale one is revalidated with its ETag/Last-Modified validators.
+        The parse time is dispatched to the transport 'parse' hooks.
+
+        :param path: String, path relative to the connector url
+        :param parse: callable, turns the response into the result
+        :param parser: String, name of the parser, for instrumentation
+        :param stream: Boolean, parse reads response.raw while the body is
+            received
+        :param cached: Boolean, False to always download the page, the
+            cache entry is still replaced
+        :return: the parsed result
+        """
+        entry = None
+        headers = {}
+        if self.cache is not None:
+            key = self._cache_key(path)
+        if self.cache is not None and cached:
+            entry = self.cache.get(key)
+            if entry is not None:
+                if entry.fresh():
+                    self.cache.count('hits')
+                    return entry.value()
+                headers = entry.validators()
+
+        if stream:
+            response = self.transport.stream(
+                self.url + path, headers=headers, allow_redirects=False,
+                session=self.session)
         else:
-            print 'E: Failed to retrieve Geokret details'
+            response = self.transport.get(
+                self.url + path, headers=headers, allow_redirects=False,
+                session=self.session)
+
+        try:
+            if (entry is not None and
+                    response.status_code == requests.codes.not_modified):
+                self.cache.count('revalidations')
+                self.cache.refresh(key, entry)
+                return entry.value()
+
+            if response.status_code != requests.codes.ok:
+                raise GeokretyConnectorError(
+                    "%s: HTTP %d" % (path, response.status_code))
+
+            start = time.time()
+            value = parse(response)
+            seconds = time.time() - start
+            if stream:
+                # the parser reads the socket, leave the transfer out
+                seconds = max(0.0, seconds - response.meter.seconds)
+            self.transport.dispatch('parse', ParseEvent(
+                self.url + path, parser, seconds))
+        finally:
+            response.close()
+        if self.cache is not None:
+            self.cache.count('misses')
+            self.cache.put(key, value,
+                           response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'))
+        return value
+
+    def _bulk(self, func, jobs, max_workers=BULK_MAX_WORKERS, rate=None):
+        """
+        Run func over jobs on a bounded pool of threads sharing the session.
+
+        :param func: callable, called with one job
+        :param jobs: iterable of jobs
+        :param max_workers: int, maximum concurrent calls
+        :param rate: float, optional maximum calls per second
+        :return: BulkResult generator, in completion order
+        """
+        self._grow_connection_pool(max_workers)
+        limiter = RateLimiter(rate)
+
+        def run(job):
+            limiter.wait()
+            try:
+                return BulkResult(job, func(job), None)
+            except Exception, e:
+                return BulkResult(job, None, e)
+
+        pool = ThreadPool(max_workers)
+        try:
+            for result in pool.imap_unordered(run, jobs):
+                yield result
+        finally:
+            pool.terminate()
+
+    def _grow_connection_pool(self, maxsize, url=None):
+        """
+        Make sure the transport keeps enough connections alive for maxsize
+        concurrent requests.
+
+        :param maxsize: int, number of concurrent requests
+        :param url: String, optional url on another host than the
+            connector one
+        :return: None
+        """
+        self.transport.grow(maxsize, url or self.url)
 
     def update_geokret_web(self, geokret):
         """
         Update a Geokret, via form post.
         Authentication mandatory.
 
+        Nothing is sent when no editable field changed since the Geokret
+        was loaded or last saved, see Geokret.dirty_fields().
+
         :param geokret: Geokret object
-        :return: None
+        :return: String, UPDATE_UPDATED or UPDATE_SKIPPED, None on failure
         """
-        path = '/edit.php'
-
         if not isinstance(geokret, Geokret):
             print 'E: geokret is not a Geokrety instance'
             return False
@@ -183,6 +702,59 @@ class GeokretyConnector(object):
             print 'E: you must be connected.'
             return False
 
+        if not geokret.dirty_fields() & GK_EDITABLE_FIELDS:
+            print "I: No changes, Geokret update skipped."
+            return UPDATE_SKIPPED
+
+        try:
+            self._update_geokret(geokret)
+        except GeokretyConnectorError:
+            print "E: Failed to updated Geokret."
+            return
+
+        print "I: Geokret updated."
+        return UPDATE_UPDATED
+
+    def update_geokrety_web(self, geokrety, journal=None,
+                            max_workers=BULK_MAX_WORKERS, rate=None,
+                            retries=None):
+        """
+        Update many Geokrety, concurrently.
+        Authentication mandatory.
+
+        Geokrety without changes to their editable fields are not sent.
+        With a journal, updates already applied by a previous run of the
+        same batch are skipped.
+
+        :param geokrety: iterable of Geokret, a list or read from CSV
+        :param journal: BatchJournal, optional
+        :param max_workers: int, maximum concurrent requests
+        :param rate: float, optional maximum requests per second
+        :param retries: int, retries of transient failures, the transport
+            ones by default
+        :return: BulkResult generator, job and result are the Geokret
+        """
+        return self._journaled(
+            lambda geokret: self._update_geokret(geokret, retries),
+            journal_keys(geokrety, 'update'), journal, True,
+            max_workers, rate)
+
+    def _update_geokret(self, geokret, retries=None):
+        """
+        Update a Geokret, via form post, if it has changes.
+
+        :param geokret: Geokret object
+        :param retries: int, retries of transient failures, the transport
+            ones by default
+        :return: The Geokret
+        """
+        if not isinstance(geokret, Geokret):
+            raise GeokretyConnectorError('geokret is not a Geokrety instance')
+        if not self.connected:
+            raise GeokretyConnectorError('you must be connected')
+        if not geokret.dirty_fields() & GK_EDITABLE_FIELDS:
+            return geokret
+
         params = {
             'id': geokret.gk_id,
             'nazwa': geokret.name,
@@ -190,11 +762,13 @@ class GeokretyConnector(object):
             'typ': geokret.type
         }
 
-        response = self.session.post(URL + path, data=params, verify=False)
-        if response.history:
-            print "I: Geokret updated."
-        else:
-            print "E: Failed to updated Geokret."
+        response = self._post('/edit.php', params, retries, True)
+        if not response.history:
+            raise self._write_error(
+                "/edit.php: update of %s failed" % geokret.gk_id, response)
+        self._evict_written(geokret.gk_id)
+        geokret.mark_clean()
+        return geokret
 
     def upload_image_web(self, geokret, image_filename,
                          description=None, avatar=False):
@@ -220,7 +794,84 @@ class GeokretyConnector(object):
             print 'E: you must be connected.'
             return False
 
-        path = '/imgup.php?typ=0&id=%d' % geokret.gk_id
+        try:
+            self._upload_image(geokret, image_filename, description, avatar)
+        except GeokretyConnectorError:
+            print "E: Failed to upload Geokret image."
+            return
+
+        print "I: Geokret image uploaded."
+
+    def upload_images_web(self, jobs, max_workers=BULK_MAX_WORKERS,
+                          rate=None, ledger=None):
+        """
+        Upload many pictures, concurrently.
+        Authentication mandatory.
+
+        With a ledger, pictures already uploaded for a Geokret, compared
+        by content, are skipped, and so are the jobs repeating a picture
+        being uploaded.
+
+        :param jobs: iterable of tuples (geokret, image_filename,
+            description, avatar), description and avatar are optional
+        :param max_workers: int, maximum concurrent uploads
+        :param rate: float, optional maximum uploads per second
+        :param ledger: UploadLedger, optional
+        :return: BulkResult generator, result is UPLOAD_UPLOADED or
+            UPLOAD_SKIPPED
+        """
+        return self._bulk(
+            lambda job: self._upload_image(*job, ledger=ledger),
+            jobs, max_workers, rate)
+
+    def _upload_image(self, geokret, image_filename, description=None,
+                      avatar=False, ledger=None):
+        """
+        Upload a picture for a Geokret, streaming it from disk.
+
+        :param geokret: Geokret object
+        :param image_filename: image file to upload
+        :param description: String, optional image description
+        :param avatar: Boolean, set image as featured
+        :param ledger: UploadLedger, optional
+        :return: String, UPLOAD_UPLOADED or UPLOAD_SKIPPED
+        """
+        if not isinstance(geokret, Geokret):
+            raise GeokretyConnectorError('geokret is not a Geokrety instance')
+        if not os.path.isfile(image_filename):
+            raise GeokretyConnectorError(
+                "file %s doesn't exists" % image_filename)
+        if not self.connected:
+            raise GeokretyConnectorError('you must be connected')
+
+        if ledger is None:
+            self._post_image(geokret, image_filename, description, avatar)
+            return UPLOAD_UPLOADED
+
+        # claimed before the upload, so that concurrent jobs send it once
+        digest = file_digest(image_filename)
+        if not ledger.claim(geokret.gk_id, digest):
+            return UPLOAD_SKIPPED
+        try:
+            self._post_image(geokret, image_filename, description, avatar)
+        except Exception:
+            ledger.release(geokret.gk_id, digest)
+            raise
+        ledger.add(geokret.gk_id, digest)
+        return UPLOAD_UPLOADED
+
+    def _post_image(self, geokret, image_filename, description=None,
+                    avatar=False):
+        """
+        Send a picture of a Geokret to imgup.php.
+
+        :param geokret: Geokret object
+        :param image_filename: image file to upload
+        :param description: String, optional image description
+        :param avatar: Boolean, set image as featured
+        :return: None
+        """
+        path = '/imgup.php?typ=0&id=%d' % int(geokret.gk_id)
         params = dict()
 
         if description:
@@ -228,19 +879,20 @@ class GeokretyConnector(object):
         if avatar:
             params['avatar'] = 'true'
 
-        with open(image_filename, 'rb') as filename:
-            response = self.session.post(URL + path,
-                                         data=params,
-                                         files={'obrazek': (
-                                             'cgeo.png', filename,
-                                             'image/png',
-                                             {'Expires': '0'}
-                                         )},
-                                         verify=False)
-            if response.history:
-                print "I: Geokret image uploaded."
-            else:
-                print "E: Failed to upload Geokret image."
+        body = MultipartStream(params, {'obrazek': (
+            image_filename, image_content_type(image_filename))})
+        try:
+            response = self.transport.post(
+                self.url + path, data=body,
+                headers={'Content-Type': body.content_type},
+                session=self.session)
+        finally:
+            body.close()
+
+        if not response.history:
+            raise GeokretyConnectorError(
+                "%s: upload of %s failed" % (path, image_filename))
+        self._evict_written(geokret.gk_id)
 
     def create_geokret_web(self, geokret, logathome=False):
         """
@@ -261,7 +913,111 @@ class GeokretyConnector(object):
             print 'E: you must be connected.'
             return False
 
-        path = '/register.php'
+        try:
+            self._create_geokret(geokret, logathome)
+        except GeokretyConnectorError:
+            print "E: Failed to create Geokret."
+            return
+
+        print "I: Geokret created."
+        return geokret
+
+    def create_geokrety_web(self, geokrety, logathome=False, journal=None,
+                            max_workers=BULK_MAX_WORKERS, rate=None,
+                            retries=None):
+        """
+        Create many Geokrety, concurrently.
+        Authentication mandatory.
+
+        With a journal, Geokrety created by a previous run of the same
+        batch are not created again, they get the ID recorded then.
+        Creations left pending or unknown are looked up, by name, type and
+        description, among the Geokrety of the inventory newer than the
+        batch, before being created again. The first run of a batch reads
+        the inventory to record its highest ID.
+
+        :param geokrety: iterable of Geokret, a list or read from CSV
+        :param logathome: Boolean, set the initial position to user's home
+        :param journal: BatchJournal, optional
+        :param max_workers: int, maximum concurrent requests
+        :param rate: float, optional maximum requests per second
+        :param retries: int, retries of transient failures, the transport
+            ones by default
+        :return: BulkResult generator, job and result are the Geokret, its
+            new ID is set
+        """
+        reconcile = None
+        if journal is not None:
+            unsettled = journal.unsettled('create')
+            if journal.baseline('create') is None and not unsettled:
+                journal.set_baseline('create', max(
+                    [geokret.gk_id for geokret in
+                     self.iter_inventory_web(cached=False)] + [0]))
+            if unsettled:
+                reconcile = self._created_finder(journal)
+        return self._journaled(
+            lambda geokret: self._create_geokret(geokret, logathome,
+                                                 retries),
+            journal_keys(geokrety, 'create'), journal, False,
+            max_workers, rate, reconcile)
+
+    def _created_finder(self, journal):
+        """
+        Find Geokrety which a previous run may have created, in the
+        inventory as listed now, before this run creates any.
+
+        A listed Geokret matches when it is newer than the journal create
+        baseline, its name, type and description are the ones of the
+        creation, and no done operation of the journal holds it. Each one
+        is matched once. Journals without baseline match any ID.
+
+        :param journal: BatchJournal
+        :return: callable, Geokret => ID of the matching listed Geokret,
+            or None
+        """
+        baseline = journal.baseline('create') or 0
+        claimed = journal.done_ids()
+        listed = {}
+        for geokret in self.iter_inventory_web(cached=False):
+            if geokret.gk_id > baseline and geokret.gk_id not in claimed:
+                key = HTMLParser.HTMLParser().unescape(geokret.name or u'')
+                listed.setdefault(key.strip(), []).append(geokret.gk_id)
+        lock = threading.Lock()
+
+        def find(geokret):
+            # details are fetched concurrently, IDs are claimed locked
+            ids = sorted(listed.get((geokret.name or u'').strip(), []))
+            for gk_id in ids:
+                with lock:
+                    if gk_id in claimed:
+                        continue
+                details = self._fetch_geokret_details(gk_id, False)
+                if (str(details.type) == str(geokret.type) and
+                        _same_text(details.description,
+                                   geokret.description)):
+                    with lock:
+                        if gk_id in claimed:
+                            continue
+                        claimed.add(gk_id)
+                    return gk_id
+            return None
+        return find
+
+    def _create_geokret(self, geokret, logathome=False, retries=None):
+        """
+        Create a new Geokret from a Geokret instance.
+
+        :param geokret: Geokret object
+        :param logathome: Boolean, set the initial position to user's home
+        :param retries: int, retries of failures before the request is
+            sent, the transport ones by default
+        :return: The Geokret, its new ID set
+        """
+        if not isinstance(geokret, Geokret):
+            raise GeokretyConnectorError('geokret is not a Geokrety instance')
+        if not self.connected:
+            raise GeokretyConnectorError('you must be connected')
+
         params = dict()
         params['nazwa'] = geokret.name
         params['typ'] = geokret.type
@@ -269,38 +1025,134 @@ class GeokretyConnector(object):
         if logathome:
             params['logAtHome'] = 1
 
-        response = self.session.post(URL + path,
-                                     data=params,
-                                     verify=False)
-        if response.history:
-            print "I: Geokret created."
-            geokret.set_id(response.url.split('=')[1])
+        response = self._post('/register.php', params, retries, False)
+        gk_id = urlparse.parse_qs(
+            urlparse.urlsplit(response.url).query).get('id')
+        if not response.history or not gk_id:
+            raise self._write_error(
+                "/register.php: creation of %s failed" % geokret.name,
+                response)
+        geokret.set_id(gk_id[0])
+        self._evict_written(geokret.gk_id)
+        geokret.mark_clean()
+        return geokret
+
+    def _post(self, path, params, retries=None, idempotent=False):
+        """
+        POST a form. The transport retries transient failures.
+
+        :param path: String, path relative to the connector url
+        :param params: dict, form fields
+        :param retries: int, maximum retries, the transport ones by default
+        :param idempotent: Boolean, the request may be applied twice
+        :return: requests.Response
+        """
+        try:
+            return self.transport.post(self.url + path, data=params,
+                                       retries=retries,
+                                       idempotent=idempotent,
+                                       session=self.session)
+        except requests.exceptions.RequestException, e:
+            if request_sent(e):
+                raise GeokretyOutcomeUnknownError("%s: %s" % (path, e))
+            raise GeokretyConnectorError("%s: %s" % (path, e))
+
+    def _write_error(self, message, response):
+        """
+        Error of a form post which did not get the expected redirection.
+
+        :param message: String
+        :param response: requests.Response
+        :return: GeokretyOutcomeUnknownError when the server failed while
+            it may have applied the post, GeokretyConnectorError otherwise
+        """
+        message = "%s, HTTP %d" % (message, response.status_code)
+        if (response.status_code >= 500 and response.status_code not in
+                self.transport.retry.refused_statuses):
+            return GeokretyOutcomeUnknownError(message)
+        return GeokretyConnectorError(message)
+
+    def _journaled(self, func, jobs, journal=None, idempotent=False,
+                   max_workers=BULK_MAX_WORKERS, rate=None, reconcile=None):
+        """
+        Run a batch operation on the bulk pool, recording it in a journal.
+
+        An operation is recorded pending before it runs, then done, failed
+        when it provably was not applied, or unknown when its request may
+        have been applied. An operation left pending by a crash or unknown
+        is run again when idempotent. Otherwise reconcile looks for its
+        effect first, and without reconcile it fails until its journal
+        entry is settled by hand.
+
+        :param func: callable, applies the operation to a Geokret
+        :param jobs: iterable of (key, Geokret), see journal_keys()
+        :param journal: BatchJournal, optional
+        :param idempotent: Boolean, the operation may be applied twice
+        :param max_workers: int, maximum concurrent calls
+        :param rate: float, optional maximum calls per second
+        :param reconcile: callable, optional, Geokret => ID of the Geokret
+            an unsettled operation produced, None if it was not applied
+        :return: BulkResult generator, job is the Geokret
+        """
+        def run(job):
+            (key, geokret) = job
+            if journal is None:
+                return func(geokret)
+
+            entry = journal.get(key)
+            if entry is not None and entry['state'] == JOURNAL_DONE:
+                if entry['gk_id'] is not None:
+                    geokret.set_id(entry['gk_id'])
+                return geokret
+            if (entry is not None and entry['state'] in JOURNAL_UNSETTLED and
+                    not idempotent):
+                if reconcile is None:
+                    raise GeokretyConnectorError(
+                        "%s may have been applied, see %s"
+                        % (key, journal.filename))
+                gk_id = reconcile(geokret)
+                if gk_id is not None:
+                    geokret.set_id(gk_id)
+                    geokret.mark_clean()
+                    journal.put(key, JOURNAL_DONE, gk_id)
+                    return geokret
+
+            journal.put(key, JOURNAL_PENDING)
+            try:
+                func(geokret)
+            except GeokretyOutcomeUnknownError:
+                journal.put(key, JOURNAL_UNKNOWN)
+                raise
+            except GeokretyConnectorError:
+                journal.put(key, JOURNAL_FAILED)
+                raise
+            journal.put(key, JOURNAL_DONE, geokret.gk_id)
             return geokret
-        else:
-            print "E: Failed to create Geokret."
 
-    def write_csv(self, filename):
+        for result in self._bulk(run, jobs, max_workers, rate):
+            yield BulkResult(result.job[1], result.result, result.error)
+
+    def write_csv(self, filename, geokrety=None):
         """
         Export Geokret inventory as CSV.
 
-        :param filename: String, output csv filename
+        :param filename: String, output csv filename, gzip if ending with .gz
+        :param geokrety: iterable of Geokret, optional, default to inventory
         :return: None
         """
         if not filename:
             print "E: writefile(): no filename provided"
             return
 
-        with open(filename, 'wb') as csvfile:
-            writer = csv.DictWriter(csvfile, GK_CVS_COLUMNS, delimiter=';')
-            writer.writeheader()
-            for geokret in self.inventory:
-                writer.writerow(geokret.__dict__)
+        if geokrety is None:
+            geokrety = self.inventory
+        write_csv(geokrety, filename)
 
     def read_csv(self, filename):
         """
         Import Geokret inventory from CSV.
 
-        :param filename:  String, input csv filename
+        :param filename:  String, input csv filename, gzip if ending with .gz
         :return: None
         """
         self.inventory = []
@@ -309,37 +1161,181 @@ class GeokretyConnector(object):
             print "E: readfile(): no filename provided"
             return
 
-        with open(filename, 'rb') as csvfile:
-            reader = csv.DictReader(csvfile, GK_CVS_COLUMNS, delimiter=';')
-            reader.next()
-            for row in reader:
-                geokret = Geokret(**row)
-                self.inventory.append(geokret)
+        self.inventory = list(iter_csv(filename))
 
-    def download_to_file(self, url, destination_directory):
+    def write_columnar(self, filename, geokrety=None):
         """
-        Download specified url to the specified file
+        Export Geokret inventory as a binary columnar file.
 
-        :param url: relative path to download file
-        :param destination: destination file
+        :param filename: String, output filename
+        :param geokrety: iterable of Geokret, optional, default to inventory
         :return: None
         """
+        if not filename:
+            print "E: write_columnar(): no filename provided"
+            return
+
+        if geokrety is None:
+            geokrety = self.inventory
+        write_columnar(geokrety, filename)
+
+    def read_columnar(self, filename):
+        """
+        Import Geokret inventory from a binary columnar file.
+
+        :param filename: String, input filename
+        :return: None
+        """
+        self.inventory = []
+
+        if not filename:
+            print "E: read_columnar(): no filename provided"
+            return
 
-        filename = format_filename(os.path.basename(urlparse.urlsplit(url).path))
+        with read_columnar(filename) as table:
+            self.inventory = list(table.to_geokrety())
 
-        # make directories
-        os.makedirs(os.path.dirname(destination_directory))
+    def download_to_file(self, url, destination_directory):
+        """
+        Download specified url to the specified file
 
-        # download the file
-        with open(destination_directory + '/' + filename, 'wb') as handle:
-            response = requests.get(url, stream=True)
+        An interrupted download left a .part file, it is resumed.
 
-            if not response.ok:
-                raise "Failed to download: " + url
+        :param url: relative path to download file
+        :param destination: destination file
+        :return: String, the downloaded file path
+        """
+        if not os.path.isdir(destination_directory):
+            os.makedirs(destination_directory)
 
-            for block in response.iter_content(1024):
-                handle.write(block)
+        self._download(url, destination_directory)
+        return os.path.join(destination_directory, _url_filename(url))
 
+    def mirror_images(self, destination_directory, geokrety=None,
+                      max_workers=BULK_MAX_WORKERS, rate=None):
+        """
+        Download the pictures of Geokrety, concurrently.
+
+        Files recorded complete in the directory manifest are skipped,
+        once the server confirms their ETag, partial ones are resumed,
+        and files identical to an already mirrored one are hard linked
+        to it. Run it again to resume an
+        interrupted mirror.
+
+        :param destination_directory: String, mirror directory
+        :param geokrety: iterable of Geokret, optional, default to inventory
+        :param max_workers: int, maximum concurrent downloads
+        :param rate: float, optional maximum downloads per second
+        :return: BulkResult generator, job is the url, result one of
+            MIRROR_DOWNLOADED, MIRROR_RESUMED, MIRROR_SKIPPED or MIRROR_LINKED
+        """
+        if geokrety is None:
+            geokrety = self.inventory
+        if not os.path.isdir(destination_directory):
+            os.makedirs(destination_directory)
+
+        urls = []
+        seen = set()
+        for geokret in geokrety:
+            for url in [geokret.imagehi] + list(geokret.images or ()):
+                if url and url not in seen:
+                    seen.add(url)
+                    urls.append(url)
+                    self._grow_connection_pool(max_workers, url)
+
+        manifest = MirrorManifest(
+            os.path.join(destination_directory, MIRROR_MANIFEST))
+        return self._bulk(
+            lambda url: self._download(url, destination_directory, manifest),
+            urls, max_workers, rate)
+
+    def _download(self, url, directory, manifest=None):
+        """
+        Download an url into directory, resuming a partial download.
+
+        :param url: String, absolute url
+        :param directory: String, existing destination directory
+        :param manifest: MirrorManifest, optional
+        :return: String, one of MIRROR_DOWNLOADED, MIRROR_RESUMED,
+            MIRROR_SKIPPED or MIRROR_LINKED
+        """
+        filename = _url_filename(url)
+        if not filename:
+            raise GeokretyConnectorError("%s: no file name" % url)
+        target = os.path.join(directory, filename)
+        partial = target + '.part'
+
+        digest = hashlib.sha1()
+        headers = {'Accept-Encoding': 'identity'}
+        entry = manifest.get(url) if manifest is not None else None
+        if (entry and entry['size'] is not None and
+                os.path.isfile(target) and
+                os.path.getsize(target) == entry['size']):
+            if not entry['etag']:
+                return MIRROR_SKIPPED
+            # complete, unless the server changed the image since
+            headers['If-None-Match'] = entry['etag']
+        elif os.path.isfile(partial):
+            with open(partial, 'rb') as handle:
+                for block in iter(lambda: handle.read(MIRROR_BLOCK_SIZE), ''):
+                    digest.update(block)
+            headers['Range'] = 'bytes=%d-' % os.path.getsize(partial)
+            if entry and entry['etag']:
+                headers['If-Range'] = entry['etag']
+
+        response = self.transport.get(url, headers=headers, stream=True,
+                                      session=self.session)
+        try:
+            if response.status_code == requests.codes.not_modified:
+                return MIRROR_SKIPPED
+            if response.status_code == requests.codes.partial_content:
+                (mode, status) = ('ab', MIRROR_RESUMED)
+            elif response.status_code == requests.codes.ok:
+                (mode, status) = ('wb', MIRROR_DOWNLOADED)
+                digest = hashlib.sha1()
+            elif (response.status_code ==
+                    requests.codes.requested_range_not_satisfiable):
+                os.remove(partial)
+                return self._download(url, directory, manifest)
+            else:
+                raise GeokretyConnectorError(
+                    "%s: HTTP %d" % (url, response.status_code))
+
+            etag = response.headers.get('ETag')
+            if manifest is not None:
+                manifest.put(url, {'file': filename, 'etag': etag,
+                                   'size': None, 'sha1': None})
+            with open(partial, mode) as handle:
+                for block in response.iter_content(MIRROR_BLOCK_SIZE):
+                    digest.update(block)
+                    handle.write(block)
+        finally:
+            response.close()
+
+        os.rename(partial, target)
+        if manifest is None:
+            return status
+
+        sha1 = digest.hexdigest()
+        original = manifest.find(sha1)
+        if original and original != filename:
+            original = os.path.join(directory, original)
+            if os.path.isfile(original):
+                # linked aside then renamed, the download is kept when
+                # linking fails
+                link = target + '.link'
+                try:
+                    if os.path.lexists(link):
+                        os.remove(link)
+                    os.link(original, link)
+                    os.rename(link, target)
+                    status = MIRROR_LINKED
+                except OSError:
+                    if os.path.lexists(link):
+                        os.remove(link)
+        manifest.put(url, {'file': filename, 'etag': etag,
+                           'size': os.path.getsize(target), 'sha1': sha1})
+        return status
 
 
 if __name__ == "__main__":
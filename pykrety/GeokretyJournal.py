@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Journal of batch operations, so that a batch interrupted by a crash can be
+run again without applying its operations twice.
+
+Operations are identified by a key computed from the Geokret content, see
+journal_keys(). The journal is a JSON lines file, one state change
+appended per line, the last line of a key wins.
+
+An operation is pending while it runs, then done, failed when Geokrety.org
+provably did not apply it, or unknown when the request may have been
+applied, like after a read timeout. Pending operations left by a crash
+and unknown ones are reconciled before being run again.
+
+A baseline, like the highest Geokret ID of the inventory before a batch
+first created any, tells the effects of the batch from what was there.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+# Operation states
+JOURNAL_PENDING = 'pending'
+JOURNAL_DONE = 'done'
+JOURNAL_FAILED = 'failed'
+JOURNAL_UNKNOWN = 'unknown'
+
+# States of operations which may have been applied
+JOURNAL_UNSETTLED = (JOURNAL_PENDING, JOURNAL_UNKNOWN)
+
+# State of the baseline entries, see BatchJournal.baseline()
+JOURNAL_BASELINE = 'baseline'
+
+
+def journal_keys(geokrety, action):
+    """
+    Key the operations of a batch. Identical Geokrety of a batch are told
+    apart by their occurrence, so keys stay the same when the same batch
+    is run again.
+
+    :param geokrety: iterable of Geokret
+    :param action: String, 'create' or 'update'
+    :return: (String, Geokret) generator
+    """
+    occurrences = {}
+    for geokret in geokrety:
+        content = hashlib.sha1(json.dumps(
+            [geokret.name, geokret.type, geokret.description])).hexdigest()
+        if action == 'create':
+            key = '%s %s' % (action, content)
+        else:
+            key = '%s %s %s' % (action, geokret.gk_id, content)
+        occurrence = occurrences[key] = occurrences.get(key, -1) + 1
+        yield ('%s %d' % (key, occurrence), geokret)
+
+
+class BatchJournal(object):
+    """
+    key => {'state', 'gk_id'} entries of batch operations. Thread safe.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: String, journal file, created when needed
+        :return: None
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename, 'rb') as handle:
+                for line in handle:
+                    try:
+                        (key, entry) = json.loads(line)
+                    except ValueError:
+                        # line cut by an interruption
+                        continue
+                    self.entries[key] = entry
+
+    def get(self, key):
+        """
+        :param key: String, operation key
+        :return: dict, the operation entry, or None
+        """
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, state, gk_id=None):
+        """
+        Record an operation state, appended to the file at once.
+
+        :param key: String, operation key
+        :param state: String, one of JOURNAL_PENDING, JOURNAL_DONE,
+            JOURNAL_FAILED or JOURNAL_UNKNOWN
+        :param gk_id: int, optional Geokret ID
+        :return: None
+        """
+        entry = {'state': state, 'gk_id': gk_id}
+        with self.lock:
+            self.entries[key] = entry
+            with open(self.filename, 'ab') as handle:
+                handle.write(json.dumps([key, entry]) + '\n')
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def unsettled(self, action):
+        """
+        :param action: String, 'create' or 'update'
+        :return: String list, keys of the operations which may have been
+            applied
+        """
+        prefix = action + ' '
+        with self.lock:
+            return [key for (key, entry) in self.entries.iteritems()
+                    if key.startswith(prefix) and
+                    entry['state'] in JOURNAL_UNSETTLED]
+
+    def baseline(self, action):
+        """
+        :param action: String, 'create' or 'update'
+        :return: int, the Geokret ID recorded before the first operation
+            of action, or None
+        """
+        with self.lock:
+            entry = self.entries.get('%s %s' % (JOURNAL_BASELINE, action))
+        if entry is None:
+            return None
+        return entry['gk_id']
+
+    def set_baseline(self, action, gk_id):
+        """
+        :param action: String, 'create' or 'update'
+        :param gk_id: int, Geokret ID
+        :return: None
+        """
+        self.put('%s %s' % (JOURNAL_BASELINE, action), JOURNAL_BASELINE,
+                 gk_id)
+
+    def done_ids(self):
+        """
+        :return: set, Geokrety IDs of the done operations
+        """
+        with self.lock:
+            return set(entry['gk_id'] for entry in self.entries.itervalues()
+                       if entry['state'] == JOURNAL_DONE and
+                       entry['gk_id'] is not None)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation of the connector requests.
+
+GeokretyTransport dispatches a RequestEvent after every request attempt,
+and the connector a ParseEvent after every parsed page. Any callable may
+be registered for them, GeokretyMetrics collects them per endpoint:
+
+    metrics = GeokretyMetrics()
+    metrics.attach(gkConn.transport)
+    gkConn.get_inventory_web()
+    print metrics.to_prometheus()
+"""
+
+import json
+import threading
+import urlparse
+from collections import namedtuple
+
+# Upper bounds of the duration histograms buckets, in seconds
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+# Prefix of the Prometheus metric names
+METRICS_PREFIX = 'pykrety'
+
+# Endpoint of requests outside of the Geokrety.org scripts, like images
+METRICS_OTHER_ENDPOINT = 'other'
+
+# Status of requests which got no response
+METRICS_ERROR_STATUS = 'error'
+
+# A request attempt, status is None when no response was received.
+# bytes_received counts the body once decoded, not the compressed bytes
+# on the wire. Streamed responses are dispatched once closed, counting
+# what was read of their body
+RequestEvent = namedtuple('RequestEvent', [
+    'method', 'url', 'status', 'latency', 'bytes_sent', 'bytes_received'])
+
+# A response parsed by parser, in seconds. Streamed responses are parsed
+# while received, the time spent waiting for their body is not included
+ParseEvent = namedtuple('ParseEvent', ['url', 'parser', 'seconds'])
+
+
+def endpoint_name(url):
+    """
+    :param url: String
+    :return: String, the script of a Geokrety.org url, like konkret.php
+    """
+    name = urlparse.urlsplit(url).path.rsplit('/', 1)[-1]
+    if name.endswith('.php'):
+        return name
+    return METRICS_OTHER_ENDPOINT
+
+
+def _labels(labels):
+    """
+    :param labels: dict, label name => value
+    :return: String, Prometheus label set
+    """
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                     .replace('"', '\\"'))
+        for (name, value) in sorted(labels.iteritems()))
+
+
+def _sample_key(sample):
+    """
+    :param sample: (dict, value) tuple
+    :return: list, sort key of the sample labels
+    """
+    return sorted(sample[0].iteritems())
+
+
+class Histogram(object):
+    """
+    Distribution of observed values over fixed buckets.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        """
+        :param buckets: tuple, sorted upper bounds of the buckets
+        :return: None
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        :param value: float
+        :return: None
+        """
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: (String, int) list, upper bound => values less or equal,
+            the last bound is +Inf
+        """
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        result = []
+        running = 0
+        for (bound, count) in zip(bounds, self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def as_dict(self):
+        """
+        :return: dict, JSON friendly
+        """
+        return {
+            'buckets': self.cumulative(),
+            'sum': self.total,
+            'count': self.count,
+        }
+
+
+class GeokretyMetrics(object):
+    """
+    Collector of request and parse events, per endpoint. Thread safe.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        """
+        :param buckets: tuple, sorted upper bounds of the histograms
+            buckets, in seconds
+        :return: None
+        """
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every observation.
+
+        :return: None
+        """
+        with self.lock:
+            # (endpoint, method, status) => count
+            self.requests = {}
+            # endpoint => Histogram
+            self.latencies = {}
+            # endpoint => bytes
+            self.bytes_sent = {}
+            self.bytes_received = {}
+            # (endpoint, parser) => Histogram
+            self.parse_times = {}
+
+    def attach(self, transport):
+        """
+        Collect the events of a transport, and of the connectors using it.
+
+        :param transport: GeokretyTransport
+        :return: None
+        """
+        transport.register_hook('request', self.on_request)
+        transport.register_hook('parse', self.on_parse)
+
+    def on_request(self, event):
+        """
+        :param event: RequestEvent
+        :return: None
+        """
+        endpoint = endpoint_name(event.url)
+        status = event.status
+        if status is None:
+            status = METRICS_ERROR_STATUS
+        key = (endpoint, event.method, str(status))
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = Histogram(self.buckets)
+            self.latencies[endpoint].observe(event.latency)
+            self.bytes_sent[endpoint] = (
+                self.bytes_sent.get(endpoint, 0) + event.bytes_sent)
+            self.bytes_received[endpoint] = (
+                self.bytes_received.get(endpoint, 0) + event.bytes_received)
+
+    def on_parse(self, event):
+        """
+        :param event: ParseEvent
+        :return: None
+        """
+        key = (endpoint_name(event.url), event.parser)
+        with self.lock:
+            if key not in self.parse_times:
+                self.parse_times[key] = Histogram(self.buckets)
+            self.parse_times[key].observe(event.seconds)
+
+    def as_dict(self):
+        """
+        :return: dict, JSON friendly snapshot of the metrics, per endpoint
+        """
+        with self.lock:
+            endpoints = {}
+
+            def get(endpoint):
+                return endpoints.setdefault(endpoint, {
+                    'requests': {},
+                    'bytes_sent': 0,
+                    'bytes_received': 0,
+                    'latency': None,
+                    'parse': {},
+                })
+
+            for ((endpoint, method, status), count) in \
+                    self.requests.iteritems():
+                get(endpoint)['requests']['%s %s' % (method, status)] = count
+            for (endpoint, histogram) in self.latencies.iteritems():
+                get(endpoint)['latency'] = histogram.as_dict()
+            for (endpoint, size) in self.bytes_sent.iteritems():
+                get(endpoint)['bytes_sent'] = size
+            for (endpoint, size) in self.bytes_received.iteritems():
+                get(endpoint)['bytes_received'] = size
+            for ((endpoint, parser), histogram) in \
+                    self.parse_times.iteritems():
+                get(endpoint)['parse'][parser] = histogram.as_dict()
+            return endpoints
+
+    def to_json(self):
+        """
+        :return: String, JSON document of as_dict()
+        """
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        :return: String, Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            self._counter(
+                lines, 'requests_total', 'Requests, per response status.',
+                [(dict(endpoint=endpoint, method=method, status=status),
+                  count) for ((endpoint, method, status), count)
+                 in self.requests.iteritems()])
+            self._counter(
+                lines, 'request_bytes_total', 'Request body bytes sent.',
+                [(dict(endpoint=endpoint), size)
+                 for (endpoint, size) in self.bytes_sent.iteritems()])
+            self._counter(
+                lines, 'response_bytes_total',
+                'Response body bytes received, decoded.',
+                [(dict(endpoint=endpoint), size)
+                 for (endpoint, size) in self.bytes_received.iteritems()])
+            self._histogram(
+                lines, 'request_duration_seconds',
+                'Time until the response headers are received.',
+                [(dict(endpoint=endpoint), histogram)
+                 for (endpoint, histogram) in self.latencies.iteritems()])
+            self._histogram(
+                lines, 'parse_duration_seconds', 'Time spent parsing.',
+                [(dict(endpoint=endpoint, parser=parser), histogram)
+                 for ((endpoint, parser), histogram)
+                 in self.parse_times.iteritems()])
+        return '\n'.join(lines) + '\n'
+
+    def _counter(self, lines, name, description, samples):
+        """
+        :param lines: String list, appended the metric lines
+        :param name: String, metric name without prefix
+        :param description: String
+        :param samples: (dict, number) list, labels => value
+        :return: None
+        """
+        name = '%s_%s' % (METRICS_PREFIX, name)
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for (labels, value) in sorted(samples, key=_sample_key):
+            lines.append('%s%s %s' % (name, _labels(labels), value))
+
+    def _histogram(self, lines, name, description, samples):
+        """
+        :param lines: String list, appended the metric lines
+        :param name: String, metric name without prefix
+        :param description: String
+        :param samples: (dict, Histogram) list, labels => histogram
+        :return: None
+        """
+        name = '%s_%s' % (METRICS_PREFIX, name)
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for (labels, histogram) in sorted(samples, key=_sample_key):
+            for (bound, count) in histogram.cumulative():
+                bucket = dict(labels, le=bound)
+                lines.append('%s_bucket%s %d' % (name, _labels(bucket),
+                                                 count))
+            lines.append('%s_sum%s %r' % (name, _labels(labels),
+                                          histogram.total))
+            lines.append('%s_count%s %d' % (name, _labels(labels),
+                                            histogram.count))
+
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+Manifest of a local mirror of Geokrety images.
+
+The manifest is a JSON lines file kept in the mirror directory, one entry
+appended per download, the last entry of an url wins. Appending keeps
+recording cheap however large the mirror, and an interrupted mirror is
+resumed from what was recorded.
+"""
+
+import json
+import os
+import threading
+
+# Manifest file name, in the mirror directory
+MIRROR_MANIFEST = '.manifest'
+
+# Bytes written at once while downloading
+MIRROR_BLOCK_SIZE = 256 * 1024
+
+# Mirror results
+MIRROR_DOWNLOADED = 'downloaded'
+MIRROR_RESUMED = 'resumed'
+MIRROR_SKIPPED = 'skipped'
+MIRROR_LINKED = 'linked'
+
+
+class MirrorManifest(object):
+    """
+    url => {'file', 'size', 'etag', 'sha1'} entries of a mirror.
+    Thread safe.
+
+    size and sha1 are None while the download of an url is not complete.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: String, manifest file, created when needed
+        :return: None
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.digests = {}
+        if os.path.exists(filename):
+            with open(filename, 'rb') as handle:
+                for line in handle:
+                    try:
+                        (url, entry) = json.loads(line)
+                    except ValueError:
+                        # line cut by an interruption
+                        continue
+                    self._remember(url, entry)
+
+    def get(self, url):
+        """
+        :param url: String
+        :return: dict, the url entry, or None
+        """
+        with self.lock:
+            return self.entries.get(url)
+
+    def find(self, digest):
+        """
+        :param digest: String, SHA-1 of a content
+        :return: String, a file name holding that content, or None
+        """
+        with self.lock:
+            return self.digests.get(digest)
+
+    def put(self, url, entry):
+        """
+        Record an url entry, appended to the file at once.
+
+        :param url: String
+        :param entry: dict
+        :return: None
+        """
+        with self.lock:
+            self._remember(url, entry)
+            with open(self.filename, 'ab') as handle:
+                handle.write(json.dumps([url, entry]) + '\n')
+
+    def _remember(self, url, entry):
+        """
+        :param url: String
+        :param entry: dict
+        :return: None
+        """
+        self.entries[url] = entry
+        if entry.get('sha1'):
+            self.digests.setdefault(entry['sha1'], entry['file'])
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throttling helpers shared by connector worker threads.
+
+GeokretyTransport combines them on every request: a TokenBucket caps the
+request rate, an AdaptiveConcurrency bounds the requests in flight, and a
+RetryPolicy schedules the retries of transient failures.
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+from requests import exceptions
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+# Retries of transient failures
+RETRY_RETRIES = 3
+
+# Seconds before the first retry, doubled after each one
+RETRY_BACKOFF = 1.0
+
+# Maximum seconds between two retries
+RETRY_MAX_BACKOFF = 60.0
+
+# Longest Retry-After honored, in seconds, longer ones are not retried
+RETRY_MAX_RETRY_AFTER = 300.0
+
+# HTTP status codes of transient failures
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Those of them telling the request was refused without being processed
+RETRY_REFUSED_STATUSES = (429, 503)
+
+# Requests in flight at start, unless a transport or its callers ask for
+# more, see AdaptiveConcurrency.allow()
+ADAPTIVE_INITIAL = 8
+
+# Requests in flight at most
+ADAPTIVE_MAXIMUM = 64
+
+# Factor applied to the limit on failures
+ADAPTIVE_BACKOFF = 0.5
+
+# Factor applied to the limit when latency degrades
+ADAPTIVE_LATENCY_BACKOFF = 0.9
+
+# Latency, relative to the best one observed, considered degraded
+ADAPTIVE_LATENCY_TOLERANCE = 2.0
+
+# Growth of the best latency per window, forgetting old observations
+ADAPTIVE_BASELINE_DRIFT = 1.01
+
+
+def retry_after(response):
+    """
+    :param response: requests.Response
+    :return: float, seconds asked by its Retry-After header, or None
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+def request_sent(error):
+    """
+    Tell whether a failed request may have reached the server, which may
+    then have processed it.
+
+    :param error: requests.exceptions.RequestException
+    :return: Boolean, False only when the request was never sent
+    """
+    if isinstance(error, (exceptions.ConnectTimeout, exceptions.InvalidURL,
+                          exceptions.InvalidSchema, exceptions.MissingSchema,
+                          exceptions.InvalidHeader)):
+        return False
+    if isinstance(error, exceptions.ConnectionError) and error.args:
+        # connection refused or name not resolved
+        reason = getattr(error.args[0], 'reason', None)
+        if isinstance(reason, NewConnectionError):
+            return False
+    return True
+
+
+class RateLimiter(object):
+    """
+    Space calls evenly so that at most `rate` of them start per second.
+    Thread safe.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: float, calls per second, None or 0 for unlimited
+        :return: None
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next call is allowed.
+
+        :return: None
+        """
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class TokenBucket(object):
+    """
+    Allow `rate` calls per second on average, and bursts of up to `burst`
+    calls. Calls may also be paused altogether, when the server asks to
+    retry later. Thread safe.
+    """
+
+    def __init__(self, rate=None, burst=1):
+        """
+        :param rate: float, calls per second, None or 0 for unlimited
+        :param burst: int, calls allowed at once after being idle
+        :return: None
+        """
+        self.rate = rate
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a call is allowed, and consume its token.
+
+        :return: None
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                delay = self.paused_until - now
+                if delay <= 0 and self.rate:
+                    self.tokens = min(
+                        self.burst,
+                        self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                    else:
+                        delay = (1 - self.tokens) / self.rate
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """
+        Hold every call for some time.
+
+        :param seconds: float
+        :return: None
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+
+class RetryPolicy(object):
+    """
+    Which failures are retried, and when.
+
+    Retries back off exponentially, with jitter so that threads failing
+    together do not retry together. A Retry-After header is honored.
+
+    A request which may have been processed is only retried when
+    idempotent. Otherwise only connection timeouts and the
+    refused_statuses responses are retried.
+    """
+
+    def __init__(self, retries=RETRY_RETRIES, backoff=RETRY_BACKOFF,
+                 max_backoff=RETRY_MAX_BACKOFF,
+                 max_retry_after=RETRY_MAX_RETRY_AFTER,
+                 statuses=RETRY_STATUSES,
+                 refused_statuses=RETRY_REFUSED_STATUSES):
+        """
+        :param retries: int, default maximum retries of a request
+        :param backoff: float, seconds before the first retry
+        :param max_backoff: float, maximum seconds between two retries
+        :param max_retry_after: float, longest Retry-After honored
+        :param statuses: tuple, HTTP status codes of transient failures
+        :param refused_statuses: tuple, those of them telling the request
+            was not processed
+        :return: None
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+        self.refused_statuses = refused_statuses
+
+    def retry_error(self, error, idempotent):
+        """
+        :param error: requests.exceptions.RequestException
+        :param idempotent: Boolean, the request may be applied twice
+        :return: Boolean, the request may be retried
+        """
+        if idempotent:
+            return isinstance(error, (exceptions.ConnectionError,
+                                      exceptions.Timeout))
+        return isinstance(error, exceptions.ConnectTimeout)
+
+    def retry_response(self, response, idempotent):
+        """
+        :param response: requests.Response
+        :param idempotent: Boolean, the request may be applied twice
+        :return: Boolean, the request may be retried
+        """
+        if idempotent:
+            return response.status_code in self.statuses
+        return response.status_code in self.refused_statuses
+
+    def delay(self, attempt, response=None):
+        """
+        :param attempt: int, retries already made
+        :param response: requests.Response, optional failed response
+        :return: float, seconds before the next retry, None when the
+            server asks to wait longer than max_retry_after
+        """
+        if response is not None:
+            seconds = retry_after(response)
+            if seconds is not None:
+                if seconds > self.max_retry_after:
+                    return None
+                return seconds
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
+
+class AdaptiveConcurrency(object):
+    """
+    Bound the calls in flight with a limit adapted to the observed
+    latency and failures (additive increase, multiplicative decrease).
+
+    The limit is reviewed after each window of `limit` calls. It grows by
+    one when the window went well, it is cut when calls failed or got
+    much slower than the best latency observed. Calls may be keyed, by
+    endpoint say, their latency is then only compared with the one of
+    calls of the same key. Thread safe.
+    """
+
+    def __init__(self, initial=ADAPTIVE_INITIAL, minimum=1,
+                 maximum=ADAPTIVE_MAXIMUM,
+                 tolerance=ADAPTIVE_LATENCY_TOLERANCE):
+        """
+        :param initial: int, calls in flight at start
+        :param minimum: int, calls in flight at least
+        :param maximum: int, calls in flight at most
+        :param tolerance: float, latency relative to the best one
+            considered degraded
+        :return: None
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.in_flight = 0
+        # most calls in flight asked for, see allow()
+        self.allowed = int(initial)
+        # key => best average latency of a window
+        self.baselines = {}
+        self.condition = threading.Condition()
+        self._reset_window()
+
+    def acquire(self):
+        """
+        Block until a call may start.
+
+        :return: None
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def allow(self, calls):
+        """
+        Raise the limit to let `calls` start at once, within the maximum,
+        when a caller first asks for that much concurrency. A limit
+        already adapted to failures or latency is kept otherwise.
+
+        :param calls: int, concurrent calls wanted
+        :return: None
+        """
+        with self.condition:
+            if calls <= self.allowed:
+                return
+            self.allowed = calls
+            self.limit = max(self.limit, float(min(self.maximum, calls)))
+            self.condition.notify_all()
+
+    def release(self, latency, failed=False, key=None):
+        """
+        Record the end of a call.
+
+        :param latency: float, seconds the call took
+        :param failed: Boolean, the call failed or was throttled
+        :param key: hashable, kind of call, optional
+        :return: None
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.window += 1
+            if failed:
+                if not self.backed_off:
+                    self.backed_off = True
+                    self._decrease(ADAPTIVE_BACKOFF)
+            else:
+                self.successes += 1
+                (total, count) = self.latencies.get(key, (0.0, 0))
+                self.latencies[key] = (total + latency, count + 1)
+            if self.window >= self.limit:
+                self._review()
+            self.condition.notify_all()
+
+    def _review(self):
+        """
+        Adapt the limit at the end of a window. The lock is held.
+
+        :return: None
+        """
+        if self.successes and not self.backed_off:
+            # average latency relative to the baseline of each key
+            slowdown = 0.0
+            for (key, (total, count)) in self.latencies.iteritems():
+                average = total / count
+                baseline = self.baselines.get(key)
+                if baseline is None or average < baseline:
+                    baseline = average
+                if baseline > 0:
+                    slowdown += count * average / baseline
+                else:
+                    slowdown += count
+                self.baselines[key] = baseline * ADAPTIVE_BASELINE_DRIFT
+            if slowdown / self.successes > self.tolerance:
+                self._decrease(ADAPTIVE_LATENCY_BACKOFF)
+            else:
+                self.limit = min(self.maximum, self.limit + 1)
+        self._reset_window()
+
+    def _decrease(self, factor):
+        """
+        :param factor: float, applied to the limit
+        :return: None
+        """
+        self.limit = max(self.minimum, self.limit * factor)
+
+    def _reset_window(self):
+        """
+        :return: None
+        """
+        self.window = 0
+        self.successes = 0
+        # key => (seconds, calls) of the window successes
+        self.latencies = {}
+        self.backed_off = False
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+
+"""
+HTTP transport shared by every connector request.
+
+One requests session keeps connections alive per host and negotiates gzip
+compressed transfers. Its connection pools grow with the concurrency of
+the callers, and are shared by the sessions of new_session(), which keep
+their own cookies.
+
+Every request, whichever thread sends it, goes through the same token
+bucket, adaptive concurrency limit and retry policy, see GeokretyThrottle.
+
+Request attempts are dispatched to the 'request' hooks, see
+GeokretyMetrics.
+"""
+
+import threading
+import time
+import urlparse
+
+import requests
+
+from GeokretyMetrics import RequestEvent, endpoint_name
+from GeokretyThrottle import AdaptiveConcurrency, RetryPolicy, TokenBucket
+
+# Default connection pools kept, one per host
+TRANSPORT_POOL_CONNECTIONS = 4
+
+# Default connections kept alive per host
+TRANSPORT_POOL_MAXSIZE = requests.adapters.DEFAULT_POOLSIZE
+
+# Default (connect, read) timeouts, in seconds
+TRANSPORT_TIMEOUT = (10, 60)
+
+# Methods which may be applied twice, retried on any transient failure
+TRANSPORT_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT',
+                                          'DELETE'])
+
+# Events hooks may be registered for
+TRANSPORT_HOOKS = ('request', 'parse')
+
+
+def _body_size(body):
+    """
+    :param body: prepared request body
+    :return: int, its length in bytes, 0 when unknown
+    """
+    if body is None:
+        return 0
+    if isinstance(body, basestring):
+        return len(body)
+    if hasattr(body, '__len__'):
+        return len(body)
+    return 0
+
+
+class _BodyMeter(object):
+    """
+    Counts the body bytes read from a streamed response, once decoded, and
+    the seconds spent waiting for them, by wrapping its raw stream.
+    """
+
+    def __init__(self, raw):
+        """
+        :param raw: urllib3.HTTPResponse, response.raw
+        :return: None
+        """
+        self.size = 0
+        self.seconds = 0.0
+        self.read = raw.read
+        self.read_chunked = raw.read_chunked
+        raw.read = self.timed_read
+        raw.read_chunked = self.timed_read_chunked
+
+    def timed_read(self, *args, **kwargs):
+        """
+        :return: String, the data read by raw.read()
+        """
+        start = time.time()
+        data = self.read(*args, **kwargs)
+        self.seconds += time.time() - start
+        self.size += len(data)
+        return data
+
+    def timed_read_chunked(self, *args, **kwargs):
+        """
+        :return: String generator, the chunks of raw.read_chunked()
+        """
+        chunks = self.read_chunked(*args, **kwargs)
+        while True:
+            start = time.time()
+            chunk = next(chunks, None)
+            self.seconds += time.time() - start
+            if chunk is None:
+                return
+            self.size += len(chunk)
+            yield chunk
+
+
+class GeokretyTransport(object):
+    """
+    Pooled, keep-alive HTTP transport, throttled and retrying transient
+    failures. Thread safe.
+
+        transport = GeokretyTransport(pool_maxsize=32, timeout=(5, 30),
+                                      rate=10)
+        gkConn = GeokretyConnector('myusername', 'mypassword',
+                                   transport=transport)
+    """
+
+    def __init__(self, pool_connections=TRANSPORT_POOL_CONNECTIONS,
+                 pool_maxsize=TRANSPORT_POOL_MAXSIZE,
+                 timeout=TRANSPORT_TIMEOUT, verify=False, rate=None,
+                 burst=1, retry=None, concurrency=None):
+        """
+        :param pool_connections: int, connection pools kept, one per host
+        :param pool_maxsize: int, connections kept alive per host
+        :param timeout: float or (connect, read) tuple, seconds
+        :param verify: Boolean, verify TLS certificates
+        :param rate: float, optional maximum requests per second
+        :param burst: int, requests allowed at once after being idle
+        :param retry: RetryPolicy, optional, default one otherwise
+        :param concurrency: AdaptiveConcurrency, optional, default one
+            starting at pool_maxsize requests in flight otherwise
+        :return: None
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.verify = verify
+        self.bucket = TokenBucket(rate, burst)
+        self.retry = retry or RetryPolicy()
+        self.concurrency = concurrency or AdaptiveConcurrency(
+            initial=pool_maxsize)
+        self.hooks = dict((event, []) for event in TRANSPORT_HOOKS)
+        self.pool_maxsizes = {}
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session.headers['Connection'] = 'keep-alive'
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying transient failures.
+
+        A failed response is returned once retries are exhausted, or when
+        its Retry-After is too long. A Retry-After holds every request of
+        the transport.
+
+        Bodies are sent again on retries: a file body is rewound to where
+        it started, a generator body must not be retried (retries=0).
+
+        :param method: String, HTTP method
+        :param url: String, absolute url
+        :param kwargs: requests options, timeout and verify default to the
+            transport ones. Also:
+            session: requests.Session, see new_session(), the transport
+            one by default
+            retries: int, maximum retries, the policy ones by default
+            idempotent: Boolean, the request may be applied twice, by
+            default it depends on the method
+        :return: requests.Response
+        """
+        session = kwargs.pop('session', None) or self.session
+        retries = kwargs.pop('retries', None)
+        if retries is None:
+            retries = self.retry.retries
+        idempotent = kwargs.pop('idempotent', None)
+        if idempotent is None:
+            idempotent = method in TRANSPORT_IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('verify', self.verify)
+        body = kwargs.get('data')
+        position = None
+        if hasattr(body, 'seek') and hasattr(body, 'tell'):
+            position = body.tell()
+
+        endpoint = endpoint_name(url)
+        attempt = 0
+        while True:
+            if attempt and position is not None:
+                body.seek(position)
+            self.bucket.acquire()
+            try:
+                response = self._send(session, method, url, endpoint,
+                                      kwargs)
+            except requests.exceptions.RequestException, e:
+                if (attempt >= retries or
+                        not self.retry.retry_error(e, idempotent)):
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                if (attempt >= retries or
+                        not self.retry.retry_response(response, idempotent)):
+                    return response
+                delay = self.retry.delay(attempt, response)
+                if delay is None:
+                    return response
+                if 'Retry-After' in response.headers:
+                    self.bucket.pause(delay)
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, session, method, url, endpoint, kwargs):
+        """
+        Send one attempt, within the concurrency limit. Its slot is given
+        back and its request event dispatched whatever the outcome, even
+        an error reading the body, like a deleted upload file.
+
+        :param session: requests.Session
+        :param method: String, HTTP method
+        :param url: String, absolute url
+        :param endpoint: String, endpoint_name() of the url
+        :param kwargs: dict, requests options
+        :return: requests.Response
+        """
+        self.concurrency.acquire()
+        start = time.time()
+        response = None
+        # errors outside of requests do not tell the server is overloaded
+        failed = False
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = response.status_code in self.retry.statuses
+            if kwargs.get('stream'):
+                response.meter = _BodyMeter(response.raw)
+        except requests.exceptions.RequestException, e:
+            failed = self.retry.retry_error(e, True)
+            raise
+        finally:
+            latency = time.time() - start
+            self.concurrency.release(latency, failed, endpoint)
+            if self.hooks['request']:
+                if response is None:
+                    self.dispatch('request', RequestEvent(
+                        method, url, None, latency, 0, 0))
+                else:
+                    self._dispatch_response(method, url, response, latency,
+                                            kwargs.get('stream'))
+        return response
+
+    def _dispatch_response(self, method, url, response, latency, stream):
+        """
+        Dispatch the request event of a response, once closed when it is
+        streamed.
+
+        :param method: String, HTTP method
+        :param url: String, requested url, before redirections
+        :param response: requests.Response
+        :param latency: float, seconds until the headers were received
+        :param stream: Boolean, the body is not read yet
+        :return: None
+        """
+        first = response.history[0] if response.history else response
+        sent = _body_size(first.request.body)
+
+        if not stream:
+            self.dispatch('request', RequestEvent(
+                method, url, response.status_code, latency, sent,
+                len(response.content)))
+            return
+
+        close = response.close
+
+        def closed():
+            response.close = close
+            close()
+            self.dispatch('request', RequestEvent(
+                method, url, response.status_code, latency, sent,
+                response.meter.size))
+
+        response.close = closed
+
+    def register_hook(self, event, hook):
+        """
+        :param event: String, one of TRANSPORT_HOOKS
+        :param hook: callable, called with the events, from any thread
+        :return: None
+        """
+        self.hooks[event].append(hook)
+
+    def dispatch(self, event, data):
+        """
+        Call the hooks of an event.
+
+        :param event: String, one of TRANSPORT_HOOKS
+        :param data: the event, a GeokretyMetrics RequestEvent or ParseEvent
+        :return: None
+        """
+        for hook in self.hooks[event]:
+            hook(data)
+
+    def get(self, url, **kwargs):
+        """
+        :param url: String, absolute url
+        :param kwargs: requests options
+        :return: requests.Response
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        :param url: String, absolute url
+        :param kwargs: requests options
+        :return: requests.Response
+        """
+        return self.request('POST', url, **kwargs)
+
+    def stream(self, url, **kwargs):
+        """
+        GET an url without reading its body. response.raw is a file object
+        of the decompressed body, to be parsed while it is received.
+        Close the response once read.
+
+        response.meter counts the body bytes read and the seconds spent
+        waiting for them, to tell the transfer time from the parse one.
+
+        :param url: String, absolute url
+        :param kwargs: requests options
+        :return: requests.Response
+        """
+        response = self.get(url, stream=True, **kwargs)
+        response.raw.decode_content = True
+        return response
+
+    def new_session(self):
+        """
+        A session with cookies of its own, over the transport connection
+        pools, so that connectors sharing the transport keep their logins
+        apart. Pass it to the requests as session.
+
+        :return: requests.Session
+        """
+        session = requests.Session()
+        session.headers.update(self.session.headers)
+        # the very mapping, pools grown later are shared too
+        session.adapters = self.session.adapters
+        return session
+
+    def grow(self, maxsize, url):
+        """
+        Make sure the pool of url host keeps enough connections alive for
+        maxsize concurrent requests, and that the concurrency limit lets
+        them start, within its maximum.
+
+        :param maxsize: int, number of concurrent requests
+        :param url: String, an url on the host
+        :return: None
+        """
+        self.concurrency.allow(maxsize)
+        prefix = '%s://%s' % urlparse.urlsplit(url)[:2]
+        with self.lock:
+            if maxsize <= self.pool_maxsizes.get(prefix, self.pool_maxsize):
+                return
+            self.pool_maxsizes[prefix] = maxsize
+            self.session.mount(prefix, requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=maxsize))
+
+    def close(self):
+        """
+        Close kept alive connections.
+
+        :return: None
+        """
+        self.session.close()
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers for image uploads: a multipart/form-data body read from disk as it
+is sent, content type detection and a ledger of uploaded images.
+"""
+
+import hashlib
+import imghdr
+import json
+import mimetypes
+import os
+import threading
+import uuid
+
+# Bytes read at once from files
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# Bulk upload results
+UPLOAD_UPLOADED = 'uploaded'
+UPLOAD_SKIPPED = 'skipped'
+
+
+def image_content_type(path):
+    """
+    Content type of an image, from its content, else from its name.
+
+    :param path: String, image file
+    :return: String, MIME type
+    """
+    kind = imghdr.what(path)
+    if kind is not None:
+        return 'image/%s' % kind
+    (content_type, _) = mimetypes.guess_type(path)
+    return content_type or 'application/octet-stream'
+
+
+def file_digest(path):
+    """
+    :param path: String, file
+    :return: String, SHA-1 hexadecimal digest of the content
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(UPLOAD_BLOCK_SIZE), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode(value):
+    """
+    :param value: String or unicode or number
+    :return: String, utf-8
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class StringPart(object):
+    """
+    Literal part of a MultipartStream, read like a file.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: String
+        :return: None
+        """
+        self.data = data
+        self.position = 0
+
+    def read(self, size):
+        """
+        :param size: int, maximum bytes
+        :return: String
+        """
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        """
+        :return: None
+        """
+
+
+class MultipartStream(object):
+    """
+    multipart/form-data request body. Files are read while the body is
+    sent, its length is known beforehand so no chunked encoding is needed.
+    The body may be rewound with seek(0) to be sent again.
+
+        body = MultipartStream({'opis': 'text'},
+                               {'obrazek': ('/tmp/image.jpg', 'image/jpeg')})
+        session.post(url, data=body,
+                     headers={'Content-Type': body.content_type})
+    """
+
+    def __init__(self, fields, files):
+        """
+        :param fields: dict, form field name => value
+        :param files: dict, form field name => (path, content type)
+        :return: None
+        """
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self.parts = []
+        self.length = 0
+        self.index = 0
+        self.position = 0
+        self.current = None
+
+        for (name, value) in fields.iteritems():
+            self._add('--%s\r\nContent-Disposition: form-data; name="%s"'
+                      '\r\n\r\n%s\r\n' % (self.boundary, _encode(name),
+                                          _encode(value)))
+        for (name, (path, content_type)) in files.iteritems():
+            self._add('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                      'filename="%s"\r\nContent-Type: %s\r\nExpires: 0'
+                      '\r\n\r\n' % (self.boundary, _encode(name),
+                                    _encode(os.path.basename(path)),
+                                    content_type))
+            self.parts.append(path)
+            self.length += os.path.getsize(path)
+            self._add('\r\n')
+        self._add('--%s--\r\n' % self.boundary)
+
+    def _add(self, data):
+        """
+        :param data: String, literal body part
+        :return: None
+        """
+        self.parts.append(StringPart(data))
+        self.length += len(data)
+
+    def __len__(self):
+        """
+        :return: int, body length
+        """
+        return self.length
+
+    def read(self, size=-1):
+        """
+        :param size: int, maximum bytes, all when negative
+        :return: String, next bytes of the body, empty at the end
+        """
+        chunks = []
+        while size < 0 or size > 0:
+            if self.current is None:
+                if self.index == len(self.parts):
+                    break
+                part = self.parts[self.index]
+                self.index += 1
+                if isinstance(part, StringPart):
+                    part.position = 0
+                    self.current = part
+                else:
+                    self.current = open(part, 'rb')
+            chunk = self.current.read(size if size > 0 else UPLOAD_BLOCK_SIZE)
+            if not chunk:
+                self.current.close()
+                self.current = None
+                continue
+            chunks.append(chunk)
+            self.position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return ''.join(chunks)
+
+    def tell(self):
+        """
+        :return: int, bytes read
+        """
+        return self.position
+
+    def seek(self, offset, whence=0):
+        """
+        Rewind the body, it can only be moved back to its start.
+
+        :param offset: int, 0
+        :param whence: int, os.SEEK_SET
+        :return: None
+        """
+        if offset or whence != os.SEEK_SET:
+            raise IOError('a multipart body can only be rewound')
+        self.close()
+        self.index = 0
+        self.position = 0
+
+    def __iter__(self):
+        """
+        :return: String generator, body blocks
+        """
+        for block in iter(lambda: self.read(UPLOAD_BLOCK_SIZE), ''):
+            yield block
+
+    def close(self):
+        """
+        :return: None
+        """
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+class UploadLedger(object):
+    """
+    Digests of the images uploaded for each Geokret, kept in a JSON file.
+    Thread safe.
+
+    An upload is claimed before it is sent, then either added once done
+    or released when it failed.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: String, ledger file, created when needed
+        :return: None
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.claimed = set()
+        if os.path.exists(filename):
+            with open(filename, 'rb') as handle:
+                self.digests = dict((key, set(values)) for (key, values)
+                                    in json.load(handle).iteritems())
+
+    def contains(self, gk_id, digest):
+        """
+        :param gk_id: int, Geokret ID
+        :param digest: String, image digest
+        :return: Boolean, True if already uploaded for this Geokret
+        """
+        with self.lock:
+            return digest in self.digests.get(str(gk_id), ())
+
+    def claim(self, gk_id, digest):
+        """
+        Reserve an upload, unless it is done or claimed already.
+
+        :param gk_id: int, Geokret ID
+        :param digest: String, image digest
+        :return: Boolean, True if the caller is to upload the image
+        """
+        with self.lock:
+            if (digest in self.digests.get(str(gk_id), ()) or
+                    (str(gk_id), digest) in self.claimed):
+                return False
+            self.claimed.add((str(gk_id), digest))
+            return True
+
+    def release(self, gk_id, digest):
+        """
+        Give up a claimed upload, which failed.
+
+        :param gk_id: int, Geokret ID
+        :param digest: String, image digest
+        :return: None
+        """
+        with self.lock:
+            self.claimed.discard((str(gk_id), digest))
+
+    def add(self, gk_id, digest):
+        """
+        Record an upload, the file is saved at once.
+
+        :param gk_id: int, Geokret ID
+        :param digest: String, image digest
+        :return: None
+        """
+        with self.lock:
+            self.claimed.discard((str(gk_id), digest))
+            self.digests.setdefault(str(gk_id), set()).add(digest)
+            temporary = '%s.%d' % (self.filename, os.getpid())
+            with open(temporary, 'wb') as handle:
+                json.dump(dict((key, sorted(values)) for (key, values)
+                               in self.digests.iteritems()), handle)
+            os.rename(temporary, self.filename)
@@ -8,11 +8,38 @@ import BeautifulSoup
 import re
 
 from pykrety import Geokret
+from GeokretyHTMLOwnedParser import iter_html_owned
 
+# konkret.php parsing engines
+HTML_ENGINE_SOUP = 'soup'
+HTML_ENGINE_TABLES = 'tables'
 
-def parse_html_geokret(html):
+# Engine used when none is requested, may be changed per deployment.
+# tests/compare_html_engines.py checks the engines agree on the fixtures
+HTML_ENGINE = HTML_ENGINE_TABLES
+
+TABLE_TAG_RE = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+OWNED_ROW_CLASS_RE = re.compile(r'^mg[01]$')
+
+OWNED_PAGE_LINK_RE = re.compile(r'mypage\.php\?[^"\'>]*?\bpage=(\d+)')
+
+
+def parse_html_geokret(html, engine=None):
+    """
+    Parse of Geokrety HTML page: /konkret.php
+
+    :param html: the html full page
+    :param engine: String, optional parsing engine, default to HTML_ENGINE
+    :return: The Geokret
+    """
+    return HTML_ENGINES[engine or HTML_ENGINE](html)
+
+
+def parse_html_geokret_soup(html):
     """
     Parse of Geokrety HTML page: /konkret.php
+    The whole page is loaded in BeautifulSoup.
 
     :param html: the html full page
     :return: The Geokret
@@ -20,21 +47,77 @@ def parse_html_geokret(html):
     soup = BeautifulSoup.BeautifulSoup(html)
     tables = soup.findAll('table')
 
-    geokret = Geokret.Geokret()
-
-    infos = tables[0]
-    details = tables[1]
     # links = tables[2]
     #carte = tables[3]
     #moves = tables[4] # table may not exists see 46684
 
+    return _parse_konkret_tables(tables[0], tables[1])
+
+
+def parse_html_geokret_tables(html):
+    """
+    Parse of Geokrety HTML page: /konkret.php
+    Only the infos and details tables are loaded in BeautifulSoup.
+
+    :param html: the html full page
+    :return: The Geokret
+    """
+    if hasattr(html, 'read'):
+        html = html.read()
+
+    fragment = _konkret_tables_fragment(html)
+    if fragment is None:
+        return parse_html_geokret_soup(html)
+
+    soup = BeautifulSoup.BeautifulSoup(fragment)
+    tables = soup.findAll('table')
+
+    return _parse_konkret_tables(tables[0], tables[1])
+
+
+def _konkret_tables_fragment(html, count=2):
+    """
+    Cut the html from the first top level table to the end of the
+    count-th top level table, without building any tree.
+
+    :param html: the html full page
+    :param count: int, number of top level tables to keep
+    :return: String, html fragment or None if not enough tables
+    """
+    depth = 0
+    start = None
+    for match in TABLE_TAG_RE.finditer(html):
+        if not match.group(1):
+            if depth == 0 and start is None:
+                start = match.start()
+            depth += 1
+        elif depth:
+            depth -= 1
+            if depth == 0:
+                count -= 1
+                if count == 0:
+                    return html[start:match.end()]
+    return None
+
+
+def _parse_konkret_tables(infos, details):
+    """
+    Extract Geokret from konkret.php infos and details tables.
+
+    :param infos: BeautifulSoup Tag, the infos table
+    :param details: BeautifulSoup Tag, the details table
+    :return: The Geokret
+    """
+    geokret = Geokret.Geokret()
+
     ### TABLE INFOS
     infos_tr = infos.findAll('tr')
     i = 0
 
     geokret.set_name(infos_tr[i].strong.text)
 
-    matchObj = re.match(r'^GeoKret.*\((.+)\) by.*$', infos_tr[i].text)
+    matchObj = re.match(r'^GeoKret.*\((.+)\) by.*$', infos_tr[i].text,
+                        re.DOTALL)
     geokret.set_type(Geokret.GK_TYPES_REV[matchObj.group(1)])
 
     geokret.set_owner(infos_tr[i].a.text)
@@ -102,6 +185,12 @@ def parse_html_geokret(html):
     return geokret
 
 
+HTML_ENGINES = {
+    HTML_ENGINE_SOUP: parse_html_geokret_soup,
+    HTML_ENGINE_TABLES: parse_html_geokret_tables,
+}
+
+
 def parse_html_owned(html):
     """
     Parse of Geokrety HTML page: /mypage.php
@@ -110,9 +199,7 @@ def parse_html_owned(html):
     :return: Geokret array
     """
     soup = BeautifulSoup.BeautifulSoup(html)
-    mg0 = soup.findAll('tr', attrs={'class': u'mg0'})
-    mg1 = soup.findAll('tr', attrs={'class': u'mg1'})
-    gks = mg0 + mg1
+    gks = soup.findAll('tr', attrs={'class': OWNED_ROW_CLASS_RE})
 
     geokrety = []
     for gk in gks:
@@ -145,6 +232,18 @@ def parse_html_owned(html):
     return geokrety
 
 
+def parse_html_owned_pages(html):
+    """
+    Number of pages of a Geokrety HTML page: /mypage.php
+    Read from the pagination links, page=0 being the "Show all" link.
+
+    :param html: the html full page
+    :return: int, pages count
+    """
+    pages = [int(page) for page in OWNED_PAGE_LINK_RE.findall(html)]
+    return max(pages + [1])
+
+
 if __name__ == '__main__':
     html_file = 'geokret_details2.html'
     geokrety = parse_html_geokret(open(html_file, 'r'))
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming parser around HTML from Geokrety.org: /mypage.php
+
+Inventory rows are turned into Geokrety as soon as they are closed, only
+the row being read is held in memory.
+"""
+
+import codecs
+import HTMLParser
+
+from pykrety import Geokret
+
+# Characters fed to the parser at once
+HTML_CHUNK_SIZE = 64 * 1024
+
+# Encoding of the pages given as bytes
+HTML_ENCODING = 'utf-8'
+
+# Inventory rows css classes
+OWNED_ROW_CLASSES = ('mg0', 'mg1')
+
+
+class OwnedCell(object):
+    """
+    The parts of a <td> needed to extract a Geokret.
+    """
+
+    def __init__(self):
+        """
+        :return: None
+        """
+        self.text = u''
+        self.span = None
+        self.span_text = u''
+        self.a = None
+        self.a_text = u''
+        self.img = None
+        self.hrefs = []
+
+
+class GeokretyOwnedHTMLParser(HTMLParser.HTMLParser):
+    """
+    Event driven parser of mypage.php inventory tables.
+    """
+
+    def __init__(self):
+        """
+        Completed Geokrety are queued in self.geokrety until consumed.
+
+        :return: None
+        """
+        HTMLParser.HTMLParser.__init__(self)
+        self.geokrety = []
+        self.cells = None
+        self.cell = None
+        self.in_span = 0
+        self.in_a = 0
+        self.pending = []
+
+    def handle_starttag(self, tag, attrs):
+        """
+        Match a begin element.
+
+        :param tag: string
+        :param attrs: list of (name, value)
+        :return: None
+        """
+        self.flush_text()
+        if tag == 'tr':
+            self.close_row()
+            classes = dict(attrs).get('class') or ''
+            if set(classes.split()).intersection(OWNED_ROW_CLASSES):
+                self.cells = []
+            return
+
+        if self.cells is None:
+            return
+
+        if tag == 'td':
+            self.cell = OwnedCell()
+            self.cells.append(self.cell)
+            return
+
+        cell = self.cell
+        if cell is None:
+            return
+
+        if tag == 'span':
+            if cell.span is None:
+                cell.span = dict(attrs)
+                self.in_span = 1
+            elif self.in_span:
+                self.in_span += 1
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            cell.hrefs.append(href)
+            if cell.a is None:
+                cell.a = dict(attrs)
+                self.in_a = 1
+            elif self.in_a:
+                self.in_a += 1
+        elif tag == 'img':
+            if cell.img is None:
+                cell.img = dict(attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        """
+        Match an empty element, nothing to close.
+
+        :param tag: string
+        :param attrs: list of (name, value)
+        :return: None
+        """
+        if tag in ('span', 'a'):
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+        else:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        """
+        Match end element.
+
+        :param tag: string
+        :return: None
+        """
+        self.flush_text()
+        if self.cells is None:
+            return
+
+        if tag == 'tr' or tag == 'table':
+            self.close_row()
+        elif tag == 'td':
+            self.cell = None
+            self.in_span = 0
+            self.in_a = 0
+        elif tag == 'span' and self.in_span:
+            self.in_span -= 1
+        elif tag == 'a' and self.in_a:
+            self.in_a -= 1
+
+    def handle_data(self, data):
+        """
+        Match element content.
+
+        :param data: string
+        :return: None
+        """
+        if self.cell is not None:
+            self.pending.append(data)
+
+    def handle_comment(self, data):
+        """
+        Comments split text, as BeautifulSoup does.
+
+        :param data: string
+        :return: None
+        """
+        self.flush_text()
+
+    def handle_entityref(self, name):
+        """
+        Keep entities untouched, as BeautifulSoup does.
+
+        :param name: string
+        :return: None
+        """
+        self.handle_data(u'&%s;' % name)
+
+    def handle_charref(self, name):
+        """
+        Keep character references untouched, as BeautifulSoup does.
+
+        :param name: string
+        :return: None
+        """
+        self.handle_data(u'&#%s;' % name)
+
+    def flush_text(self):
+        """
+        Append the text read since the last tag to the current cell.
+        Like BeautifulSoup, each text node is stripped.
+
+        :return: None
+        """
+        if not self.pending:
+            return
+        data = u''.join(self.pending).strip()
+        self.pending = []
+
+        cell = self.cell
+        if cell is None or not data:
+            return
+        cell.text += data
+        if self.in_span:
+            cell.span_text += data
+        if self.in_a:
+            cell.a_text += data
+
+    def close_row(self):
+        """
+        Turn the current inventory row into a Geokret.
+
+        :return: None
+        """
+        if self.cells is not None:
+            self.geokrety.append(_parse_owned_row(self.cells))
+        self.cells = None
+        self.cell = None
+        self.in_span = 0
+        self.in_a = 0
+        self.pending = []
+
+
+def _parse_owned_row(tds):
+    """
+    Extract Geokret from a mypage.php inventory row.
+
+    :param tds: OwnedCell array
+    :return: The Geokret
+    """
+    geokret = Geokret.Geokret()
+
+    try:
+        geokret.set_spotted_type(tds[0].span['title'])
+        geokret.set_id(tds[1].a['href'].split('=')[1])
+        geokret.set_name(tds[1].span_text)
+        geokret.set_distance(tds[4].text.replace('km', ''))
+        geokret.set_cache_count(tds[5].text)
+
+        try:
+            geokret.set_tracking_number(tds[6].hrefs[1].split('=')[1])
+        except IndexError:
+            pass
+
+        if tds[1].img:
+            geokret.set_featured_image(tds[1].img['title'].split('|')[3])
+
+        if tds[2].text:
+            geokret.set_spotted_country(tds[2].img['alt'])
+            geokret.set_spotted_cache_name(tds[2].a_text)
+    except Exception, e:
+        print "E: cannot parse %s ; %s" % (geokret.gkid(), e)
+
+    return geokret
+
+
+def iter_html_owned(html, encoding=HTML_ENCODING):
+    """
+    Parse of Geokrety HTML page: /mypage.php
+    Geokrety are yielded in page order, as soon as their row is closed.
+
+    :param html: the html full page, a file object or an iterable of chunks,
+        as unicode or bytes
+    :param encoding: String, encoding of the bytes
+    :return: Geokret generator
+    """
+    if isinstance(html, basestring):
+        chunks = (html[i:i + HTML_CHUNK_SIZE]
+                  for i in xrange(0, len(html), HTML_CHUNK_SIZE))
+    elif hasattr(html, 'read'):
+        chunks = iter(lambda: html.read(HTML_CHUNK_SIZE), '')
+    else:
+        chunks = html
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parser = GeokretyOwnedHTMLParser()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            # a multibyte character may span two chunks
+            chunk = decoder.decode(chunk)
+        parser.feed(chunk)
+        for geokret in _drain(parser):
+            yield geokret
+    parser.feed(decoder.decode('', True))
+    parser.close()
+    parser.flush_text()
+    parser.close_row()
+    for geokret in _drain(parser):
+        yield geokret
+
+
+def _drain(parser):
+    """
+    Hand over the Geokrety completed by the parser so far.
+
+    :param parser: GeokretyOwnedHTMLParser
+    :return: Geokret array
+    """
+    geokrety = parser.geokrety
+    parser.geokrety = []
+    return geokrety
@@ -5,8 +5,20 @@ Parser around XML from Geokrety.org API
 """
 
 import xml.sax
+import xml.sax.saxutils
 
 from pykrety import Geokret
+from GeokretyXMLPullParser import iter_xml_pull
+
+# Bytes fed to the incremental parser at once
+XML_CHUNK_SIZE = 64 * 1024
+
+# XML parsing engines, all producing identical Geokrety
+XML_BACKEND_SAX = 'sax'
+XML_BACKEND_ITERPARSE = 'iterparse'
+
+# Engine used when none is requested, may be changed per deployment
+XML_BACKEND = XML_BACKEND_ITERPARSE
 
 
 class GeokretyXMLHandler(xml.sax.ContentHandler):
@@ -15,7 +27,18 @@ class GeokretyXMLHandler(xml.sax.ContentHandler):
     """
     content = ''
     geokret = None
-    geokrety = []
+
+    def __init__(self):
+        """
+        Initialize per-document state.
+
+        Completed Geokrety are queued in self.geokrety until consumed.
+
+        :return: None
+        """
+        xml.sax.ContentHandler.__init__(self)
+        self.geokrety = []
+        self.chunks = []
 
     def startElement(self, name, attrs):
         """
@@ -25,9 +48,9 @@ class GeokretyXMLHandler(xml.sax.ContentHandler):
         :param attrs: dict
         :return: None
         """
+        self.chunks = []
         if name == "geokret":
-            self.geokret = Geokret.Geokret()
-            self.geokrety.append(self.geokret)
+            self.geokret = Geokret.Geokret(images=list())
             for (key, value) in attrs.items():
                 if key == 'id':
                     self.geokret.set_id(value)
@@ -57,9 +80,18 @@ class GeokretyXMLHandler(xml.sax.ContentHandler):
         :param name: string
         :return: None
         """
+        self.content = u''.join(self.chunks).strip('\n\r ')
+        self.chunks = []
+
+        if self.geokret is None:
+            return
+
         if name == 'geokret':
             if self.content:
                 self.geokret.set_name(self.content)
+            self.geokrety.append(self.geokret)
+            self.geokret = None
+            return
 
         if name == 'name':
             self.geokret.set_name(self.content)
@@ -90,31 +122,87 @@ class GeokretyXMLHandler(xml.sax.ContentHandler):
         :param content: string
         :return: None
         """
-        self.content = content.rstrip('\n\r ')
+        self.chunks.append(content)
 
 
-def parse_xml_file(xml_filename):
+def parse_xml_file(xml_filename, backend=None):
     """
     Parse from xml filename.
 
     :param xml_filename: String
-    :return: The GeokretyXMLHandler
+    :param backend: String, optional parsing engine, see XML_BACKENDS
+    :return: Geokret array
     """
-    return parse_xml_stream(open(xml_filename, 'rb'))
+    return parse_xml_stream(open(xml_filename, 'rb'), backend)
 
 
-def parse_xml_stream(stream):
+def parse_xml_stream(stream, backend=None):
     """
     Parse from xml stream.
 
     :param stream: file object
-    :return: The GeokretyXMLHandler
+    :param backend: String, optional parsing engine, see XML_BACKENDS
+    :return: Geokret array
+    """
+    return list(iter_xml_stream(stream, backend))
+
+
+def iter_xml_stream(stream, backend=None):
     """
+    Parse from xml stream, yielding each Geokret as soon as its
+    </geokret> element is closed.
+
+    Only the Geokret being built is held in memory, so documents of any
+    size may be consumed while they are still being downloaded.
+
+    :param stream: file object or url
+    :param backend: String, optional parsing engine, default to XML_BACKEND
+    :return: Geokret generator
+    """
+    return XML_BACKENDS[backend or XML_BACKEND](stream)
+
+
+def iter_xml_sax(stream):
+    """
+    Parse from xml stream with the SAX handler, yielding each Geokret as
+    soon as its </geokret> element is closed.
+
+    :param stream: file object or url
+    :return: Geokret generator
+    """
+    source = xml.sax.saxutils.prepare_input_source(stream)
     parser = xml.sax.make_parser()
     handler = GeokretyXMLHandler()
     parser.setContentHandler(handler)
-    parser.parse(stream)
-    return handler.geokrety
+
+    byte_stream = source.getByteStream()
+    buf = byte_stream.read(XML_CHUNK_SIZE)
+    while buf:
+        parser.feed(buf)
+        for geokret in _drain(handler):
+            yield geokret
+        buf = byte_stream.read(XML_CHUNK_SIZE)
+    parser.close()
+    for geokret in _drain(handler):
+        yield geokret
+
+
+def _drain(handler):
+    """
+    Hand over the Geokrety completed by the handler so far.
+
+    :param handler: GeokretyXMLHandler
+    :return: Geokret array
+    """
+    geokrety = handler.geokrety
+    handler.geokrety = []
+    return geokrety
+
+
+XML_BACKENDS = {
+    XML_BACKEND_SAX: iter_xml_sax,
+    XML_BACKEND_ITERPARSE: iter_xml_pull,
+}
 
 
 if __name__ == '__main__':
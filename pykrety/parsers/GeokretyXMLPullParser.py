@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pull parser around XML from Geokrety.org API.
+
+Uses lxml when it is installed, cElementTree otherwise. Elements are
+cleared as soon as their Geokret is complete, so memory stays flat.
+"""
+
+import xml.sax.saxutils
+
+try:
+    from lxml import etree
+except ImportError:
+    try:
+        import xml.etree.cElementTree as etree
+    except ImportError:
+        import xml.etree.ElementTree as etree
+
+from pykrety import Geokret
+
+
+GK = Geokret.Geokret
+
+# <geokret> attributes => setters
+GEOKRET_ATTRIBUTES = {
+    'id': GK.set_id,
+    'dist': GK.set_distance,
+    'nr': GK.set_tracking_number,
+    'type': GK.set_type,
+    'waypoint': GK.set_spotted_cache_name,
+    'image': GK.add_image,
+}
+
+# Child elements attributes => setters
+ELEMENT_ATTRIBUTES = {
+    'owner': {'owner': GK.set_owner},
+    'type': {'type': GK.set_type},
+}
+
+# Child elements text => setters
+ELEMENT_CONTENT = {
+    'name': (GK.set_name,),
+    'description': (GK.set_description,),
+    'owner': (GK.set_owner,),
+    'datecreated': (GK.set_date_released,),
+    'distancetravelled': (GK.set_distance,),
+    'image': (GK.set_spotted_type,),
+    'waypoint': (GK.set_spotted_type, GK.set_spotted_cache_name),
+}
+
+
+def _content(elem):
+    """
+    Text directly preceding the element end, as seen by the SAX handler.
+
+    :param elem: Element
+    :return: unicode
+    """
+    if len(elem):
+        text = elem[-1].tail
+    else:
+        text = elem.text
+    if not text:
+        return u''
+    return unicode(text).strip('\n\r ')
+
+
+def iter_xml_pull(stream):
+    """
+    Parse from xml stream with an incremental pull parser, yielding each
+    Geokret as soon as its </geokret> element is closed.
+
+    :param stream: file object or url
+    :return: Geokret generator
+    """
+    source = xml.sax.saxutils.prepare_input_source(stream)
+
+    geokret = None
+    parents = []
+    for event, elem in etree.iterparse(source.getByteStream(),
+                                       events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'geokret':
+                geokret = GK(images=list())
+                for (key, value) in elem.attrib.items():
+                    setter = GEOKRET_ATTRIBUTES.get(key)
+                    if setter:
+                        setter(geokret, unicode(value))
+            elif geokret is not None and tag in ELEMENT_ATTRIBUTES:
+                setters = ELEMENT_ATTRIBUTES[tag]
+                for (key, value) in elem.attrib.items():
+                    if key in setters:
+                        setters[key](geokret, unicode(value))
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        if geokret is None:
+            continue
+
+        if tag == 'geokret':
+            content = _content(elem)
+            if content:
+                geokret.set_name(content)
+            yield geokret
+            geokret = None
+
+            # Drop the finished subtree from the document
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+        elif tag in ELEMENT_CONTENT:
+            content = _content(elem)
+            for setter in ELEMENT_CONTENT[tag]:
+                setter(geokret, content)
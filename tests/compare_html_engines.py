@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+Check that the konkret.php engines agree on the fixtures, before changing
+HTML_ENGINE or the tables fragment cut. Run from the repository root:
+
+    python tests/compare_html_engines.py
+
+Both the infos and details tables BeautifulSoup builds, and the Geokrety
+extracted from them, must be identical. Pages which are not konkret.php
+ones, like mypage.php, are skipped.
+"""
+
+import glob
+import os
+import sys
+
+import BeautifulSoup
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from pykrety.parsers import GeokretyHTMLHandler
+
+
+def compare(path):
+    """
+    :param path: String, html fixture
+    :return: String list, differences, None when not a konkret.php page
+    """
+    with open(path, 'rb') as handle:
+        html = handle.read()
+
+    try:
+        soup = GeokretyHTMLHandler.parse_html_geokret_soup(html)
+    except Exception:
+        return None
+
+    differences = []
+    fragment = GeokretyHTMLHandler._konkret_tables_fragment(html)
+    if fragment is None:
+        differences.append('no tables fragment')
+    else:
+        whole = BeautifulSoup.BeautifulSoup(html).findAll('table')[:2]
+        cut = BeautifulSoup.BeautifulSoup(fragment).findAll('table')[:2]
+        for (index, (expected, found)) in enumerate(zip(whole, cut)):
+            if unicode(expected) != unicode(found):
+                differences.append('table %d markup differs' % index)
+
+    tables = GeokretyHTMLHandler.parse_html_geokret_tables(html).as_dict()
+    for (field, value) in sorted(soup.as_dict().iteritems()):
+        if tables[field] != value:
+            differences.append('%s: soup %r, tables %r' % (
+                field, value, tables[field]))
+    return differences
+
+
+def main():
+    """
+    :return: int, exit status, 1 when the engines disagree
+    """
+    status = 0
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, '*.html'))):
+        name = os.path.basename(path)
+        differences = compare(path)
+        if differences is None:
+            print 'skipped %s, not a konkret.php page' % name
+        elif differences:
+            status = 1
+            print 'DIFFERS %s' % name
+            for difference in differences:
+                print '    %s' % difference
+        else:
+            print 'same    %s' % name
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
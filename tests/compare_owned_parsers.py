@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Check that the streaming mypage.php parser agrees with the BeautifulSoup
+one on the fixtures, whatever form the page is given in. Run from the
+repository root:
+
+    python tests/compare_owned_parsers.py
+
+Chunks are a few bytes long, so that multibyte characters span two of them.
+"""
+
+import glob
+import io
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from pykrety.parsers.GeokretyHTMLHandler import parse_html_owned
+from pykrety.parsers.GeokretyHTMLOwnedParser import iter_html_owned
+
+# Bytes per chunk of the chunks form
+CHUNK_SIZE = 7
+
+
+def forms(path):
+    """
+    :param path: String, html fixture
+    :return: (String, page) list, every accepted form of the page
+    """
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    return [
+        ('str', data),
+        ('unicode', data.decode('utf-8')),
+        ('file', open(path, 'rb')),
+        ('text file', io.open(path, encoding='utf-8')),
+        ('chunks', (data[i:i + CHUNK_SIZE]
+                    for i in xrange(0, len(data), CHUNK_SIZE))),
+    ]
+
+
+def main():
+    """
+    :return: int, exit status, 1 when the parsers disagree
+    """
+    status = 0
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, '*.html'))):
+        name = os.path.basename(path)
+        with open(path, 'rb') as handle:
+            expected = [geokret.as_dict()
+                        for geokret in parse_html_owned(handle.read())]
+        if not expected:
+            print 'skipped %s, not a mypage.php page' % name
+            continue
+        for (form, page) in forms(path):
+            found = [geokret.as_dict() for geokret in iter_html_owned(page)]
+            if found == expected:
+                print 'same    %s as %s' % (name, form)
+            else:
+                status = 1
+                print 'DIFFERS %s as %s, %d Geokrety instead of %d' % (
+                    name, form, len(found), len(expected))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())